@@ -0,0 +1,105 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Compares the per-tile PIL resampling of SampleTiler with the NumPy
+# LayerDownsampler on one layer of an existing tiled image: throughput of
+# each, and how far apart their tiles are.
+
+import os, sys, time
+from math import *
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import Image, ImageChops
+from tiled_image import *
+from tiled_image.sample_tiler import SampleTiler
+from tiled_image.downsampler import LayerDownsampler
+
+def pilTiles(image_path, layer_number):
+   """Return {(column, row): tile} resampled a tile at a time with PIL"""
+   tiled_image = TiledImage.fromDirectory(image_path)
+   sample_tiler = SampleTiler(tiled_image)
+   pyramid = tiled_image.pyramid
+   tile_size = pyramid.tile_size
+   scale = pyramid.scaleForLayer(layer_number)
+   grid_size = pyramid.tileGridSize(layer_number)
+   tiles = {}
+   for row in xrange(grid_size.height):
+      for column in xrange(grid_size.width):
+         area = sample_tiler.tileSourceRectangle(column, row, layer_number)
+         scaled_tile = tiled_image.getScaledImage(area, scale, layer_number + 1)
+         tile = Image.new("RGB", (tile_size.width, tile_size.height),
+                          tiled_image.background)
+         tile.paste(scaled_tile, (0, 0))
+         tiles[(column, row)] = tile
+   return tiles
+
+def numpyTiles(image_path, layer_number):
+   """Return {(column, row): tile} resampled a row at a time with NumPy"""
+   tiled_image = TiledImage.fromDirectory(image_path)
+   downsampler = LayerDownsampler(tiled_image, layer_number)
+   grid_size = tiled_image.pyramid.tileGridSize(layer_number)
+   tiles = {}
+   for row in xrange(grid_size.height):
+      for (column, tile) in downsampler.tileRow(row):
+         tiles[(column, row)] = tile
+   return tiles
+
+def timeTiles(function, image_path, layer_number):
+   """Return (tiles, seconds) for a tiling function"""
+   start = time.time()
+   tiles = function(image_path, layer_number)
+   return (tiles, time.time() - start)
+
+def compareTiles(pil_tiles, numpy_tiles):
+   """Return (mean absolute difference, PSNR) between two sets of tiles"""
+   squared_error = 0
+   absolute_error = 0
+   count = 0
+   for key in pil_tiles:
+      histogram = ImageChops.difference(pil_tiles[key], numpy_tiles[key]).histogram()
+      for band in xrange(3):
+         for (value, pixels) in enumerate(histogram[band * 256:(band + 1) * 256]):
+            squared_error += value * value * pixels
+            absolute_error += value * pixels
+            count += pixels
+   mean_squared_error = max(float(squared_error) / count, 0.000001)
+   return (float(absolute_error) / count,
+           10 * log10(255 * 255 / mean_squared_error))
+
+if __name__ == "__main__":
+   parser = OptionParser(usage = "%prog [options] tiled_image_directory")
+   parser.add_option("-l", "--layer", dest="layer", type="int",
+            help="layer to resample, default: the finest layer built by sampling")
+   (options, args) = parser.parse_args()
+   if len(args) < 1:
+      parser.error("missing tiled image directory")
+   image_path = args[0]
+
+   layer_number = options.layer
+   if layer_number == None:
+      layer_number = TiledImage.fromDirectory(image_path).layer_count - 3
+
+   (pil_tiles, pil_seconds) = timeTiles(pilTiles, image_path, layer_number)
+   (numpy_tiles, numpy_seconds) = timeTiles(numpyTiles, image_path, layer_number)
+   (mean_difference, psnr) = compareTiles(pil_tiles, numpy_tiles)
+
+   tile_count = len(pil_tiles)
+   print "layer%04i: %i tiles" % (layer_number, tile_count)
+   print "pil:   %8.3f s  %8.1f tiles/s" % (pil_seconds, tile_count / pil_seconds)
+   print "numpy: %8.3f s  %8.1f tiles/s" % (numpy_seconds, tile_count / numpy_seconds)
+   print "difference: mean %.3f, PSNR %.2f dB" % (mean_difference, psnr)
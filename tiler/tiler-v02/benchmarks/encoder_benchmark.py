@@ -0,0 +1,119 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Encodes tiles cut from a corpus of source images with each of a list of
+# TileEncoder settings, reporting bytes per tile, encode time per tile
+# and how far the decoded tiles are from the source pixels.
+
+import os, sys, time
+from math import *
+from cStringIO import StringIO
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import Image, ImageChops
+from tiled_image import *
+
+DEFAULT_ENCODINGS = ["jpg",
+                     "jpg:optimize",
+                     "jpg:progressive,optimize",
+                     "jpg:quality=85,subsampling=4:4:4",
+                     "jpg:quality=85,subsampling=4:2:0,progressive,optimize",
+                     "jpg:quality=70,subsampling=4:2:0,progressive,optimize",
+                     "webp:quality=80",
+                     "webp:quality=65",
+                     "png"]
+
+def corpusTiles(source_paths, tile_size, tile_limit):
+   """Return up to tile_limit tiles cut from the source images.
+
+   Tiles are taken on the finest layer's grid, padded with white the
+   way edge tiles are, a share from each source image.
+   """
+   tiles = []
+   per_source = max(1, tile_limit / len(source_paths))
+   for source_path in source_paths:
+      source = Image.open(source_path).convert("RGB")
+      (width, height) = source.size
+      boxes = [(left, top, min(left + tile_size, width), min(top + tile_size, height))
+               for top in xrange(0, height, tile_size)
+               for left in xrange(0, width, tile_size)]
+      step = max(1, len(boxes) / per_source)
+      for box in boxes[::step][:per_source]:
+         tile = Image.new("RGB", (tile_size, tile_size), (255, 255, 255))
+         tile.paste(source.crop(box), (0, 0))
+         tiles.append(tile)
+   return tiles[:tile_limit]
+
+def squaredError(tile, data):
+   """Return (sum of squared differences, sample count) of a decoded tile"""
+   decoded = Image.open(StringIO(data)).convert("RGB")
+   histogram = ImageChops.difference(tile, decoded).histogram()
+   squared_error = 0
+   count = 0
+   for band in xrange(3):
+      for (value, pixels) in enumerate(histogram[band * 256:(band + 1) * 256]):
+         squared_error += value * value * pixels
+         count += pixels
+   return (squared_error, count)
+
+def measureEncoding(encoder, tiles):
+   """Return (bytes per tile, milliseconds per tile, PSNR) for an encoder"""
+   start = time.time()
+   encoded = [encoder.encode(tile) for tile in tiles]
+   seconds = time.time() - start
+
+   squared_error = 0
+   count = 0
+   for (tile, data) in zip(tiles, encoded):
+      (tile_error, tile_count) = squaredError(tile, data)
+      squared_error += tile_error
+      count += tile_count
+   mean_squared_error = max(float(squared_error) / count, 0.000001)
+   psnr = 10 * log10(255 * 255 / mean_squared_error)
+   total_bytes = sum([len(data) for data in encoded])
+   return (float(total_bytes) / len(tiles), 1000.0 * seconds / len(tiles), psnr)
+
+if __name__ == "__main__":
+   parser = OptionParser(usage = "%prog [options] source_image...")
+   parser.add_option("-e", "--encoding", dest="encodings", action="append",
+            help="tile encoding to measure, may be repeated, default: a range of settings")
+   parser.add_option("-n", "--tiles", dest="tiles", type="int", default=200,
+            help="number of tiles to encode, default: 200")
+   parser.add_option("-t", "--tile-size", dest="tile_size", type="int", default=256,
+            help="tile width and height, default: 256")
+   (options, args) = parser.parse_args()
+   if len(args) < 1:
+      parser.error("missing source images")
+
+   encoders = []
+   for encoding in options.encodings or DEFAULT_ENCODINGS:
+      try:
+         encoders.append(TileEncoder(encoding))
+      except ValueError, error:
+         print "skipping %s: %s" % (encoding, error)
+
+   tiles = corpusTiles(args, options.tile_size, options.tiles)
+   print "%i tiles from %i images" % (len(tiles), len(args))
+   baseline = None
+   print "%-56s %9s %6s %9s %7s" % ("encoding", "bytes", "ratio", "ms/tile", "PSNR")
+   for encoder in encoders:
+      (tile_bytes, milliseconds, psnr) = measureEncoding(encoder, tiles)
+      if baseline == None:
+         baseline = tile_bytes
+      print "%-56s %9.0f %6.2f %9.2f %7.2f" % (
+         encoder.spec(), tile_bytes, tile_bytes / baseline, milliseconds, psnr)
@@ -0,0 +1,101 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Compares the tuple based geometry value types with the plain classes
+# they replaced (copied below as "before"): bytes per rectangle, and the
+# time to create, compare, read and hash them.
+
+import os, sys, time, random, gc
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from geometry import *
+
+class PlainRectangle:
+   """The previous Rectangle: a plain class with an instance dictionary"""
+
+   def __init__(self, left = 0, top = 0, right = 0, bottom = 0):
+      self.left = left
+      self.top = top
+      self.right = right
+      self.bottom = bottom
+
+   def __eq__(self, other):
+      if not isinstance(other, PlainRectangle):
+         return False
+      return (self.left == other.left and self.top == other.top
+                  and self.right == other.right and self.bottom == other.bottom)
+
+   def __ne__(self, other):
+      return not self == other
+
+def rectangleBytes(rectangle):
+   """Return the bytes held by one rectangle, not counting its coordinates"""
+   size = sys.getsizeof(rectangle)
+   if hasattr(rectangle, "__dict__"):
+      size += sys.getsizeof(rectangle.__dict__)
+   return size
+
+def timeCall(function, count):
+   """Return microseconds per item of calling function over count items"""
+   gc.collect()
+   start = time.time()
+   function()
+   return (time.time() - start) * 1000000.0 / count
+
+def measure(rectangle_class, edges, hashable):
+   """Return {measure: value} for one rectangle class"""
+   count = len(edges)
+   rectangles = [rectangle_class(*box) for box in edges]
+   copies = [rectangle_class(*box) for box in edges]
+   def create():
+      [rectangle_class(*box) for box in edges]
+   def compare():
+      [first == second for (first, second) in zip(rectangles, copies)]
+   def read():
+      [rectangle.right - rectangle.left for rectangle in rectangles]
+   results = {"bytes": rectangleBytes(rectangles[0]),
+              "create_us": timeCall(create, count),
+              "compare_us": timeCall(compare, count),
+              "read_us": timeCall(read, count)}
+   if hashable:
+      def distinct():
+         set(rectangles).intersection(copies)
+      results["hash_us"] = timeCall(distinct, count)
+   return results
+
+if __name__ == "__main__":
+   parser = OptionParser(usage = "%prog [options]")
+   parser.add_option("-n", "--count", dest="count", type="int", default=200000,
+            help="number of rectangles, default: 200000")
+   (options, args) = parser.parse_args()
+
+   generator = random.Random(1)
+   edges = []
+   for index in xrange(options.count):
+      (left, top) = (generator.randint(0, 100000), generator.randint(0, 100000))
+      edges.append((left, top, left + generator.randint(1, 512),
+                    top + generator.randint(1, 512)))
+
+   before = measure(PlainRectangle, edges, False)
+   after = measure(Rectangle, edges, True)
+   print "%i rectangles" % options.count
+   print "%-12s %10s %10s %8s" % ("measure", "before", "after", "ratio")
+   for key in ("bytes", "create_us", "compare_us", "read_us"):
+      ratio = float(after[key]) / max(before[key], 0.000001)
+      print "%-12s %10.3f %10.3f %8.2f" % (key, before[key], after[key], ratio)
+   print "%-12s %10s %10.3f" % ("hash_us", "-", after["hash_us"])
@@ -0,0 +1,350 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Benchmarks the stages of tiling on deterministic synthetic sources:
+# cutting the finest layers from the source (SourceTiler), sampling the
+# coarser layers (SampleTiler), reading scaled areas back
+# (TiledImage.getScaledImage) and Pyramid coordinate arithmetic. Results
+# are written as JSON, and compared with a baseline from an earlier run:
+# a stage slower, or a run larger, by more than the threshold is a
+# regression, and the script exits with status 1.
+
+import os, sys, time, json, random, platform, shutil, multiprocessing, Queue
+from optparse import OptionParser
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, REPO_PATH)
+import Image
+from geometry import *
+from tiled_image import *
+from tiled_image.tiler import Tiler
+from tiled_image.source_tiler import SourceTiler
+from tiled_image.change_detector import pixelBytes
+from tiled_image.memory_budget import peakResidentBytes, MEGABYTE
+
+# Synthetic sources by name: (width, height)
+SOURCE_SIZES = {"1mp":   (1024, 1024),
+                "16mp":  (4096, 4096),
+                "256mp": (16384, 16384),
+                "strip": (131072, 8192)}
+DEFAULT_SOURCES = ["1mp", "16mp"]
+
+PATTERN_SIZE = 1024
+WRITE_ROWS = 64
+SCALED_REQUESTS = 40
+PYRAMID_CALLS = 100000
+# Seconds between checks that a measuring process is still running
+POLL_SECONDS = 5
+
+# Metrics where a larger value is better; for the rest smaller is better
+HIGHER_IS_BETTER = ("tiles_per_second", "requests_per_second", "calls_per_second",
+                    "ranges_per_second")
+
+def imageFromBytes(mode, size, data):
+   """Return an image of raw pixel data (fromstring before Pillow)"""
+   if hasattr(Image, "frombytes"):
+      return Image.frombytes(mode, size, data)
+   return Image.fromstring(mode, size, data)
+
+def patternImage(seed):
+   """Return a PATTERN_SIZE square RGB image of smooth noise and edges"""
+   generator = random.Random(seed)
+   noise = imageFromBytes("RGB", (64, 64), "".join(
+      [chr(generator.randint(0, 255)) for index in xrange(64 * 64 * 3)]))
+   pattern = noise.resize((PATTERN_SIZE, PATTERN_SIZE), Image.BICUBIC)
+   detail = imageFromBytes("L", (256, 256), "".join(
+      [chr(generator.randint(0, 255)) for index in xrange(256 * 256)]))
+   detail = detail.resize((PATTERN_SIZE, PATTERN_SIZE), Image.NEAREST)
+   return Image.blend(pattern, Image.merge("RGB", (detail, detail, detail)), 0.25)
+
+def writeSource(path, size, seed = 1):
+   """Write a synthetic source as a raw PPM, WRITE_ROWS rows at a time.
+
+   The pattern is pasted with an offset that changes by row and column,
+   so no two tiles are alike. Raw PPM sources can be read in bands, so
+   sources larger than memory can be tiled.
+   """
+   (width, height) = size
+   pattern = patternImage(seed)
+   out = open(path + ".tmp", "wb")
+   out.write("P6\n%i %i\n255\n" % (width, height))
+   for top in xrange(0, height, WRITE_ROWS):
+      rows = min(WRITE_ROWS, height - top)
+      band = Image.new("RGB", (width, rows))
+      for left in xrange(-PATTERN_SIZE, width, PATTERN_SIZE):
+         block = top / PATTERN_SIZE
+         shift = (block * 389 + left / PATTERN_SIZE * 131) % PATTERN_SIZE
+         offset_top = (top % PATTERN_SIZE + block * 97) % PATTERN_SIZE
+         section = pattern.crop((0, offset_top, PATTERN_SIZE, offset_top + rows))
+         band.paste(section, (left + shift, 0))
+      out.write(pixelBytes(band))
+   out.close()
+   os.rename(path + ".tmp", path)
+
+def sourcePath(work_path, name):
+   """Return the path of a synthetic source, writing it if need be"""
+   path = os.path.join(work_path, "%s.ppm" % name)
+   if not os.path.exists(path):
+      print "writing %s source: %i x %i" % ((name,) + SOURCE_SIZES[name])
+      writeSource(path, SOURCE_SIZES[name])
+   return path
+
+def timeLayers(layer_times):
+   """Record (tiler class, layer, tiles, seconds) of each layer tiled"""
+   tileLayer = Tiler.tileLayer
+   def timedTileLayer(tiler, layer_number):
+      start = time.time()
+      tileLayer(tiler, layer_number)
+      grid_size = tiler.pyramid.tileGridSize(layer_number)
+      layer_times.append((tiler.__class__.__name__, layer_number,
+                          grid_size.width * grid_size.height, time.time() - start))
+   Tiler.tileLayer = timedTileLayer
+
+def stageResults(layer_times, class_name):
+   """Return the results of the layers tiled by one class of tiler"""
+   layers = [{"layer": layer_number, "tiles": tiles, "seconds": seconds}
+             for (name, layer_number, tiles, seconds) in layer_times
+             if name == class_name]
+   tiles = sum([layer["tiles"] for layer in layers])
+   seconds = max(sum([layer["seconds"] for layer in layers]), 0.000001)
+   return {"tiles": tiles, "seconds": seconds, "tiles_per_second": tiles / seconds,
+           "layers": layers}
+
+def scaledResults(image_path, seed = 1):
+   """Return the results of reading deterministic scaled areas"""
+   tiled_image = TiledImage.fromDirectory(image_path)
+   (width, height) = (tiled_image.image_size.width, tiled_image.image_size.height)
+   generator = random.Random(seed)
+   pixels = 0
+   start = time.time()
+   for index in xrange(SCALED_REQUESTS):
+      scale = 2 ** -generator.uniform(0, 6)
+      area_width = min(width, int(1024 / scale))
+      area_height = min(height, int(768 / scale))
+      left = generator.randint(0, width - area_width)
+      top = generator.randint(0, height - area_height)
+      area = Rectangle(left, top, left + area_width - 1, top + area_height - 1)
+      scaled = tiled_image.getScaledImage(area, scale)
+      pixels += scaled.size[0] * scaled.size[1]
+   seconds = max(time.time() - start, 0.000001)
+   return {"requests": SCALED_REQUESTS, "seconds": seconds,
+           "requests_per_second": SCALED_REQUESTS / seconds,
+           "megapixels": pixels / 1000000.0}
+
+def pyramidResults(size, seed = 1):
+   """Return the results of calling Pyramid's coordinate methods"""
+   pyramid = Pyramid(Dimensions(*size))
+   generator = random.Random(seed)
+   points = [(generator.uniform(0, size[0]), generator.uniform(0, size[1]),
+              generator.randint(0, pyramid.layer_count - 1),
+              generator.uniform(0.001, 1)) for index in xrange(1000)]
+   calls = 0
+   start = time.time()
+   while calls < PYRAMID_CALLS:
+      for (x, y, layer_number, scale) in points:
+         pyramid.tileColumn(x, layer_number)
+         pyramid.tileRow(y, layer_number)
+         pyramid.tileGridSize(layer_number)
+         pyramid.layerForScale(scale)
+         pyramid.scaleForLayer(layer_number)
+      calls += len(points) * 5
+   seconds = max(time.time() - start, 0.000001)
+
+   # A batch of viewport rectangles against every layer at once
+   rectangles = []
+   for (x, y, layer_number, scale) in points:
+      width = generator.uniform(1, size[0] / 4.0)
+      height = generator.uniform(1, size[1] / 4.0)
+      rectangles.append(Rectangle(x, y, x + width, y + height))
+   layer_numbers = range(pyramid.layer_count)
+   ranges = 0
+   ranges_start = time.time()
+   while ranges < PYRAMID_CALLS:
+      pyramid.tileRanges(rectangles, layer_numbers)
+      ranges += len(rectangles) * len(layer_numbers)
+   ranges_seconds = max(time.time() - ranges_start, 0.000001)
+   return {"calls": calls, "seconds": seconds, "calls_per_second": calls / seconds,
+           "ranges": ranges, "ranges_seconds": ranges_seconds,
+           "ranges_per_second": ranges / ranges_seconds}
+
+def runSource(name, source_path, work_path, options, results):
+   """Tile one source and measure each stage, in a process of its own"""
+   layer_times = []
+   timeLayers(layer_times)
+   image_path = os.path.join(work_path, name + "_images")
+   if os.path.exists(image_path):
+      shutil.rmtree(image_path)
+   try:
+      start = time.time()
+      TiledImage.fromSourceImage(source_path, image_path, options)
+      seconds = time.time() - start
+      stages = {"source": stageResults(layer_times, "SourceTiler"),
+                "sample": stageResults(layer_times, "SampleTiler"),
+                "scaled": scaledResults(image_path),
+                "pyramid": pyramidResults(SOURCE_SIZES[name])}
+   except:
+      # Tell the waiting parent before the traceback is printed
+      results.put(None)
+      raise
+   (own_peak, worker_peak) = peakResidentBytes()
+   results.put({"seconds": seconds, "stages": stages,
+                "peak_rss_mb": own_peak / float(MEGABYTE),
+                "worker_peak_rss_mb": worker_peak / float(MEGABYTE)})
+   shutil.rmtree(image_path)
+
+def measureSource(name, source_path, work_path, options):
+   """Return the results of tiling a source, measured in a new process.
+
+   Each source gets a fresh process, so that its peak RSS is its own.
+   A process that dies without a result, as when killed for running
+   out of memory, raises RuntimeError rather than waiting forever.
+   """
+   results = multiprocessing.Queue()
+   process = multiprocessing.Process(target = runSource,
+      args = (name, source_path, work_path, options, results))
+   process.start()
+   while True:
+      try:
+         result = results.get(timeout = POLL_SECONDS)
+         break
+      except Queue.Empty:
+         # A result sent just before exiting is still in the queue
+         if process.is_alive() or not results.empty():
+            continue
+         if process.exitcode < 0:
+            raise RuntimeError("benchmark of %s failed: killed by signal %i" % (
+               name, -process.exitcode))
+         raise RuntimeError("benchmark of %s failed: exited with status %i" % (
+            name, process.exitcode))
+   process.join()
+   if result == None:
+      raise RuntimeError("benchmark of %s failed" % name)
+   return result
+
+def metrics(results):
+   """Return {metric path: value} of the numbers compared with a baseline"""
+   values = {}
+   for (name, source) in results["sources"].items():
+      values["%s/seconds" % name] = source["seconds"]
+      values["%s/peak_rss_mb" % name] = source["peak_rss_mb"]
+      for (stage_name, stage) in source["stages"].items():
+         for key in HIGHER_IS_BETTER:
+            if key in stage:
+               values["%s/%s/%s" % (name, stage_name, key)] = stage[key]
+   return values
+
+def compare(results, baseline, threshold):
+   """Print each metric against the baseline, returning the regressions"""
+   values = metrics(results)
+   base_values = metrics(baseline)
+   regressions = []
+   print "%-36s %12s %12s %8s" % ("metric", "baseline", "now", "change")
+   for key in sorted(values.keys()):
+      if key not in base_values or base_values[key] == 0:
+         continue
+      change = values[key] / base_values[key] - 1
+      if key.split("/")[-1] in HIGHER_IS_BETTER:
+         regressed = change < -threshold
+      else:
+         regressed = change > threshold
+      flag = ""
+      if regressed:
+         flag = "REGRESSION"
+         regressions.append(key)
+      print "%-36s %12.2f %12.2f %+7.1f%% %s" % (
+         key, base_values[key], values[key], change * 100, flag)
+   return regressions
+
+if __name__ == "__main__":
+   parser = OptionParser(usage = "%prog [options]")
+   parser.add_option("-s", "--source", dest="sources", action="append",
+            choices = sorted(SOURCE_SIZES.keys()),
+            help="synthetic source to tile, may be repeated: %s, default: %s" % (
+               ", ".join(sorted(SOURCE_SIZES.keys())), ", ".join(DEFAULT_SOURCES)))
+   parser.add_option("-d", "--work-dir", dest="work_path", default="benchmark_work",
+            help="directory for synthetic sources (kept) and tiled images")
+   parser.add_option("-w", "--workers", dest="workers", type="int", default=1,
+            help="number of worker processes used to generate tiles")
+   parser.add_option("-m", "--band-memory", dest="band_memory", type="int", default=64,
+            help="decode sources in bands of at most this many megabytes, default: 64")
+   parser.add_option("-o", "--output", dest="output",
+            help="write results to this JSON file")
+   parser.add_option("-b", "--baseline", dest="baseline",
+            help="compare results with this JSON file from an earlier run")
+   parser.add_option("-t", "--threshold", dest="threshold", type="float", default=10,
+            help="percent slower or larger than the baseline that is a regression, default: 10")
+   parser.add_option("-u", "--update-baseline", dest="update", action="store_true",
+            default=False, help="write the results to the baseline file after comparing")
+   (options, args) = parser.parse_args()
+
+   work_path = os.path.abspath(options.work_path)
+   if not os.path.isdir(work_path):
+      os.makedirs(work_path)
+   # copyResources() reads the resources directory of the current directory
+   os.chdir(REPO_PATH)
+
+   tiling_options = TilingOptions()
+   tiling_options.workers = options.workers
+   tiling_options.band_memory = options.band_memory * MEGABYTE
+
+   results = {"python": platform.python_version(),
+              "pil": getattr(Image, "PILLOW_VERSION", getattr(Image, "VERSION", "")),
+              "platform": platform.platform(),
+              "workers": options.workers,
+              "sources": {}}
+   for name in options.sources or DEFAULT_SOURCES:
+      source_path = sourcePath(work_path, name)
+      result = measureSource(name, source_path, work_path, tiling_options)
+      results["sources"][name] = result
+      print "%s: %.1f s, peak RSS %.1f MB (largest worker %.1f MB)" % (
+         name, result["seconds"], result["peak_rss_mb"], result["worker_peak_rss_mb"])
+      for stage_name in ("source", "sample"):
+         stage = result["stages"][stage_name]
+         print "  %-8s %6i tiles %8.2f s %8.1f tiles/s" % (
+            stage_name, stage["tiles"], stage["seconds"], stage["tiles_per_second"])
+         for layer in stage["layers"]:
+            print "    layer%04i %6i tiles %8.2f s" % (
+               layer["layer"], layer["tiles"], layer["seconds"])
+      stage = result["stages"]["scaled"]
+      print "  scaled   %6i areas %8.2f s %8.1f areas/s" % (
+         stage["requests"], stage["seconds"], stage["requests_per_second"])
+      stage = result["stages"]["pyramid"]
+      print "  pyramid  %6i calls %8.2f s %8.0f calls/s" % (
+         stage["calls"], stage["seconds"], stage["calls_per_second"])
+
+   if options.output != None:
+      out = open(options.output, "w")
+      json.dump(results, out, indent = 2, sort_keys = True)
+      out.close()
+
+   regressions = []
+   if options.baseline != None and os.path.exists(options.baseline):
+      baseline_file = open(options.baseline, "r")
+      baseline = json.load(baseline_file)
+      baseline_file.close()
+      print
+      if baseline["workers"] != results["workers"]:
+         print "warning: the baseline was run with %i workers" % baseline["workers"]
+      regressions = compare(results, baseline, options.threshold / 100.0)
+   if options.baseline != None and (options.update or not os.path.exists(options.baseline)):
+      out = open(options.baseline, "w")
+      json.dump(results, out, indent = 2, sort_keys = True)
+      out.close()
+      print "baseline written to %s" % options.baseline
+   if len(regressions) > 0:
+      print "%i regressions over %.0f%%" % (len(regressions), options.threshold)
+      sys.exit(1)
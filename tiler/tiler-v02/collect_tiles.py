@@ -0,0 +1,59 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Removes tiles from a content store that no tiled image using the store
+# indexes any more: tiles of images that were deleted, retiled or
+# extracted.
+
+from tiled_image import *
+from optparse import OptionParser
+   
+if __name__ == "__main__":
+    parser = OptionParser(usage = "%prog [options] content_store_directory ...")
+    parser.add_option("-g", "--grace", dest="grace", type="int", default = 60,
+            help="minutes a new tile is kept before it may be removed, default: 60")
+    parser.add_option("-n", "--dry-run", dest="dry_run", action="store_true",
+            default = False,
+            help="report what would be removed without removing it")
+    parser.add_option("-p", "--prune-missing", dest="prune_missing",
+            action="store_true", default = False,
+            help="drop registered images that have no content index, "
+                 "instead of stopping; their tiles are then removed")
+    (options, args) = parser.parse_args()
+    if len(args) < 1:
+        parser.error("missing content store directory")
+    
+    for store_path in args:
+        store = ContentStore(store_path)
+        try:
+            (removed_count, removed_bytes, kept_count, dropped_paths) = \
+                store.collectGarbage(options.grace * 60, options.dry_run,
+                                     options.prune_missing)
+        except IOError, error:
+            print "%s\n  nothing removed: move the images back, or use --prune-missing" % error
+            continue
+        if options.dry_run:
+            verb = "Would remove"
+        else:
+            verb = "Removed"
+        for image_path in dropped_paths:
+            print "%s: dropping %s: it has no %s" % (
+                store_path, image_path, STORE_INDEX_FILE_NAME)
+        print "%s: %s %i tiles (%.1f MB), %i tiles kept" % (
+            store_path, verb, removed_count, removed_bytes / 1048576.0, kept_count)
+        
+    print "\nDone."
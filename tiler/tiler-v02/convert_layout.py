@@ -0,0 +1,40 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Moves the tiles of existing tiled images, in place, between the flat
+# layout (one directory per layer) and the sharded layout (each layer
+# split into subdirectories of shard_rows tile rows).
+
+from tiled_image import *
+from optparse import OptionParser
+   
+if __name__ == "__main__":
+    parser = OptionParser(usage = "%prog [options] tiled_image_directory ...")
+    parser.add_option("-S", "--shard-rows", dest="shard_rows", type="int",
+            default = 0,
+            help="tile rows in each subdirectory of a layer, or 0 for flat layers")
+    (options, args) = parser.parse_args()
+    if len(args) < 1:
+        parser.error("missing tiled image directory")
+    if options.shard_rows < 0:
+        parser.error("shard rows must not be negative")
+    
+    for image_path in args:
+        tiled_image = TiledImage.fromDirectory(image_path)
+        tiled_image.convertLayout(options.shard_rows)
+        
+    print "\nDone."
@@ -0,0 +1,59 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Exports an area of a tiled image at any scale to a PNG, TIFF or JPEG
+# file, rendering and writing the result a strip of rows at a time.
+
+from tiled_image import *
+from geometry import *
+from optparse import OptionParser
+   
+if __name__ == "__main__":
+    parser = OptionParser(usage = "%prog [options] tiled_image_directory output_file")
+    parser.add_option("-r", "--region", dest="region",
+            help="left,top,right,bottom of the area in image pixels, default: all")
+    parser.add_option("-s", "--scale", dest="scale", type="float", default = 1.0,
+            help="output pixels per image pixel")
+    parser.add_option("-W", "--width", dest="width", type="int",
+            help="output width in pixels, in place of a scale")
+    parser.add_option("-H", "--strip-height", dest="strip_height", type="int",
+            default = 256, help="output rows rendered at a time")
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error("need a tiled image directory and an output file")
+    if options.strip_height < 1:
+        parser.error("strip height must be at least 1")
+    
+    tiled_image = TiledImage.fromDirectory(args[0])
+    image_size = tiled_image.image_size
+    if options.region == None:
+        region = Rectangle(0, 0, image_size.width, image_size.height)
+    else:
+        try:
+            edges = [float(part) for part in options.region.split(",")]
+        except ValueError:
+            edges = []
+        if len(edges) != 4:
+            parser.error("region must be left,top,right,bottom")
+        region = Rectangle(*edges)
+    scale = options.scale
+    if options.width != None:
+        scale = float(options.width) / (region.right - region.left)
+    
+    print "Exporting %s at scale %1.5f to %s" % (region, scale, args[1])
+    tiled_image.exportScaledImage(region, scale, args[1], options.strip_height)
+    print "\nDone."
@@ -0,0 +1,41 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Writes the tiles of tiled images packed into a tile archive, or kept in
+# a content store, back out as one file per tile, in the layout recorded
+# in contents.xml.
+
+from tiled_image import *
+from optparse import OptionParser
+   
+if __name__ == "__main__":
+    parser = OptionParser(usage = "%prog [options] tiled_image_directory ...")
+    parser.add_option("-k", "--keep", dest="keep", action="store_true",
+            default = False,
+            help="keep the archive or content index after extracting its tiles")
+    (options, args) = parser.parse_args()
+    if len(args) < 1:
+        parser.error("missing tiled image directory")
+    
+    for image_path in args:
+        tiled_image = TiledImage.fromDirectory(image_path)
+        if not tiled_image.packsTiles():
+            print "%s has no tile archive or content store" % image_path
+            continue
+        tiled_image.extractArchive(options.keep)
+        
+    print "\nDone."
@@ -14,32 +14,39 @@
 # Author: Jonathan A, Smith
 
 import types
+from operator import itemgetter
 
-class Dimensions:
-   """Dimensions class.
+class Dimensions(tuple):
+   """Dimensions class. Dimensions are immutable, so they can be shared and
+   used as dictionary keys; the width and height are held in a tuple.
    
    self.width - width value
    self.height - height value
    """
    
-   def __init__(self, width = 0, height = 0):
+   __slots__ = ()
+   
+   def __new__(cls, width = 0, height = 0):
       """Initialize dimensions"""
-      self.width = width
-      self.height = height 
+      return tuple.__new__(cls, (width, height))
+   
+   width = property(itemgetter(0), doc = "width value")
+   height = property(itemgetter(1), doc = "height value")
+   
+   def __getnewargs__(self):
+      """Return the arguments that recreate the dimensions when unpickled"""
+      return tuple(self)
       
    def __eq__(self, other):
       """Test if two dimensions objects are equal"""
-      if not isinstance(other, Dimensions):
-         return False
-      if self.width != other.width or self.height != other.height:
-         return False
-      return True
+      return isinstance(other, Dimensions) and tuple.__eq__(self, other)
    
    def __ne__(self, other):
       """Return true if not equal"""
       return not self == other
+   
+   __hash__ = tuple.__hash__
       
    def __repr__(self):
       """Return a string represenation"""
-      return "Dimensions(width=%s, height=%s)" % (self.width, self.height)
-   
\ No newline at end of file
+      return "Dimensions(width=%s, height=%s)" % self
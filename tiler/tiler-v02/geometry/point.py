@@ -13,17 +13,28 @@
 #
 # Author: Jonathan A, Smith
 
-class Point:
-   """Point class.
+from operator import itemgetter
+
+class Point(tuple):
+   """Point class. Points are immutable, so they can be shared and used as
+   dictionary keys; the x and y values are held in a tuple.
 
    self.x - x value
    self.y - y value
    """
    
-   def __init__(self, x = 0, y = 0):
+   __slots__ = ()
+   
+   def __new__(cls, x = 0, y = 0):
       """Initialize a point"""
-      self.x = x
-      self.y = y  
+      return tuple.__new__(cls, (x, y))
+   
+   x = property(itemgetter(0), doc = "x value")
+   y = property(itemgetter(1), doc = "y value")
+   
+   def __getnewargs__(self):
+      """Return the arguments that recreate the point when unpickled"""
+      return tuple(self)
       
    def project(self, transform):
       """Project the point into a new coordinate system"""
@@ -33,17 +44,14 @@ class Point:
       
    def __eq__(self, other):
       """Determine if two points are equal"""
-      if not isinstance(other, Point):
-         return False
-      if self.x != other.x or self.y != other.y:
-         return False
-      return True
+      return isinstance(other, Point) and tuple.__eq__(self, other)
    
    def __ne__(self, other):
       """Return True if not equal"""
       return not self == other
+   
+   __hash__ = tuple.__hash__
       
    def __repr__(self):
       """Return a string represenation"""
-      return "Point(x=%s, y=%s)" % (self.x, self.y)
-   
\ No newline at end of file
+      return "Point(x=%s, y=%s)" % self
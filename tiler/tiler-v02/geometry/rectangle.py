@@ -14,12 +14,17 @@
 # Author: Jonathan A, Smith
 
 import types
+from operator import itemgetter
 from point import *
 from dimensions import *
 from transform import *
 
-class Rectangle:
+class Rectangle(tuple):
    """Rectangle class. Assumes floating point coordinates.
+   
+   Rectangles are immutable, so they can be shared and used as dictionary
+   keys; the edges are held in a tuple. Methods that move or resize a
+   rectangle return a new one.
 
    self.left - left edge
    self.top - top edge
@@ -27,25 +32,31 @@ class Rectangle:
    self.bottom - bottom edge
    """
    
-   def __init__(self, left = 0, top = 0, right = 0, bottom = 0):
+   __slots__ = ()
+   
+   def __new__(cls, left = 0, top = 0, right = 0, bottom = 0):
       """Initialize a rectangle"""
-      self.left = left
-      self.top = top
-      self.right = right
-      self.bottom = bottom
+      return tuple.__new__(cls, (left, top, right, bottom))
+   
+   left = property(itemgetter(0), doc = "left edge")
+   top = property(itemgetter(1), doc = "top edge")
+   right = property(itemgetter(2), doc = "right edge")
+   bottom = property(itemgetter(3), doc = "bottom edge")
+   
+   def __getnewargs__(self):
+      """Return the arguments that recreate the rectangle when unpickled"""
+      return tuple(self)
 
    def getTopLeft(self):
       """Return top left point"""
       return Point(self.left, self.top)
    
-   def setTopLeft(self, top_left):
-      """Moves the rectangle to a new coordinate position"""
+   def withTopLeft(self, top_left):
+      """Return the rectangle moved to a new coordinate position"""
       x_offset = top_left.x - self.left
       y_offset = top_left.y - self.top
-      self.left   += x_offset
-      self.right  += x_offset
-      self.top    += y_offset
-      self.bottom += y_offset
+      return self.__class__(self.left + x_offset, self.top    + y_offset,
+                            self.right + x_offset, self.bottom + y_offset)
    
    def getBottomRight(self):
       """Return bottom right point"""
@@ -55,10 +66,10 @@ class Rectangle:
       """Return the dimensions (size) of the rectangle"""
       return Dimensions(self.right - self.left, self.bottom - self.top)
    
-   def setDimensions(self, dimensions):
-      """Resizes the rectangle to new dimensions"""
-      self.right  = self.left + dimensions.width
-      self.bottom = self.top  + dimensions.height
+   def withDimensions(self, dimensions):
+      """Return the rectangle resized to new dimensions"""
+      return self.__class__(self.left, self.top, self.left + dimensions.width,
+                            self.top + dimensions.height)
       
    def getCenter(self):
       """Return the center point"""
@@ -86,9 +97,9 @@ class Rectangle:
    def project(self, transform):
       """Return a new rectangle with coordnates projected by a transform"""
       assert isinstance(transform, Transform)
-      top_left = transform.project(self.getTopLeft())
-      bottom_right = transform.project(self.getBottomRight())
-      return Rectangle(top_left.x, top_left.y, bottom_right.x, bottom_right.y)
+      (left, top) = transform.projectCoordinates(self.left, self.top)
+      (right, bottom) = transform.projectCoordinates(self.right, self.bottom)
+      return Rectangle(left, top, right, bottom)
    
    def inset(self, dimensions):
       """Return a new rectangle with inset removed from edges"""
@@ -110,14 +121,13 @@ class Rectangle:
 
    def __eq__(self, other):
       """Determine if two rectangles and equal"""
-      if not isinstance(other, Rectangle):
-         return False
-      return (self.left == other.left and self.top == other.top
-                  and self.right == other.right and self.bottom == other.bottom)
+      return isinstance(other, Rectangle) and tuple.__eq__(self, other)
    
    def __ne__(self, other):
       """Determine if two rectangles are not equal"""
       return not self == other
+   
+   __hash__ = tuple.__hash__
          
    def __repr__(self):
       """Return a string representation of the rectangle"""
@@ -14,6 +14,17 @@ class DimensionsTest(unittest.TestCase):
       d3 = Dimensions(2, 3)
       self.assertEqual(d1, d3)
       self.assertNotEqual(d1, d2)
+      self.assertNotEqual(d1, (2, 3))
+      
+   def testHash(self):
+      sizes = {Dimensions(256, 256): "tile"}
+      self.assertEqual("tile", sizes[Dimensions(256, 256)])
+      self.assertEqual(hash(Dimensions(2, 3)), hash(Dimensions(2, 3)))
+      
+   def testImmutable(self):
+      d1 = Dimensions(2, 3)
+      self.assertRaises(AttributeError, setattr, d1, "width", 4)
+      self.assertRaises(AttributeError, setattr, d1, "depth", 4)
    
 def suite():
    return unittest.makeSuite(DimensionsTest)
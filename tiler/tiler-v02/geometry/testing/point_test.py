@@ -20,6 +20,16 @@ class PointTest(unittest.TestCase):
       self.assertEqual(p1, p3)
       self.assertNotEqual(p1, p2)
       
+   def testHash(self):
+      p1 = Point(2, 3)
+      self.assertEqual(hash(p1), hash(Point(2, 3)))
+      self.assertEqual(1, len(set([p1, Point(2, 3)])))
+      self.assertNotEqual(p1, Dimensions(2, 3))
+      
+   def testImmutable(self):
+      p1 = Point(2, 3)
+      self.assertRaises(AttributeError, setattr, p1, "x", 4)
+      
 def suite():
    return unittest.makeSuite(PointTest)
    
@@ -12,9 +12,10 @@ class RectangleTest(unittest.TestCase):
       self.assertEqual(Point(0, 0), r.getTopLeft())
       self.assertEqual(Point(100, 100), r.getBottomRight()) 
       
-   def testSetTopLeft(self):
-      r = Rectangle(0, 0, 100, 100)
-      r.setTopLeft(Point(100, 100))
+   def testWithTopLeft(self):
+      r0 = Rectangle(0, 0, 100, 100)
+      r = r0.withTopLeft(Point(100, 100))
+      self.assertEqual(Rectangle(0, 0, 100, 100), r0)
       self.assertEqual(100, r.left)
       self.assertEqual(100, r.top)
       self.assertEqual(200, r.right)
@@ -27,15 +28,25 @@ class RectangleTest(unittest.TestCase):
       self.assertEqual(r1, r3)
       self.assertNotEqual(r1, r2)
       
+   def testHash(self):
+      r1 = Rectangle(0, 0, 100, 100)
+      areas = {r1: "first"}
+      self.assertEqual("first", areas[Rectangle(0, 0, 100, 100)])
+      self.assert_(Rectangle(1, 0, 101, 100) not in areas)
+      
+   def testImmutable(self):
+      r1 = Rectangle(0, 0, 100, 100)
+      self.assertRaises(AttributeError, setattr, r1, "left", 10)
+      self.assertRaises(AttributeError, setattr, r1, "width", 10)
+      
    def testDimensions(self):
       r1 = Rectangle(0, 0, 8, 16)
       r2 = Rectangle(-1, -1, 1, 1)
       self.assertEqual(Dimensions(8, 16), r1.getDimensions())
       self.assertEqual(Dimensions(2, 2), r2.getDimensions())
       
-   def testSetDimensions(self):
-      r = Rectangle(20, 20, 50, 82)
-      r.setDimensions(Dimensions(10, 10))
+   def testWithDimensions(self):
+      r = Rectangle(20, 20, 50, 82).withDimensions(Dimensions(10, 10))
       self.assertEqual(Point(20, 20), r.getTopLeft())
       self.assertEqual(Point(30, 30), r.getBottomRight())
       
@@ -1,8 +1,25 @@
 import unittest, math
 from ispace.geometry import *
 
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+def sampleTransforms():
+   """Return transforms that mix translation, scale and rotation"""
+   return [Transform.makeIdentity(),
+           Transform.makeTranslate(5, -10),
+           Transform.makeScale(0.5, 0.25),
+           Transform.makeRotate(math.pi / 3).compose(Transform.makeTranslate(4, 3)),
+           Transform.makeScale(2, 3).compose(Transform.makeRotate(-0.7))]
+
 class TransformTest(unittest.TestCase):
    
+   def assertMatrixAlmostEqual(self, t1, t2):
+      for (value1, value2) in zip(t1.matrix, t2.matrix):
+         self.assertAlmostEqual(value1, value2)
+   
    def testIdentity(self):
       t = Transform.makeIdentity()
       self.assertEqual(Point(6, 11), t.project(Point(6, 11)))
@@ -87,6 +104,80 @@ class TransformTest(unittest.TestCase):
       self.assertAlmostEqual(p1.x, p2.x)
       self.assertAlmostEqual(p1.y, p2.y)
       
+   def testInverseInteger(self):
+      t1 = Transform.makeScale(2, 2)
+      self.assertEqual(Point(5, 5), t1.inverse().project(Point(10, 10)))
+      
+   def testInverseCached(self):
+      t1 = Transform.makeTranslate(1, 1)
+      t2 = t1.inverse()
+      self.assertEqual(t2, t1.inverse())
+      self.assert_(t2 is not t1.inverse())
+      t2.matrix[2] = 5
+      self.assertEqual(Point(0, 0), t1.inverse().project(Point(1, 1)))
+      t1.matrix = Transform.makeTranslate(2, 2).matrix
+      self.assertEqual(Point(0, 0), t1.inverse().project(Point(2, 2)))
+      
+   @unittest.skipIf(numpy == None, "requires NumPy")
+   def testProjectPoints(self):
+      points = numpy.array([(3, 4), (-2.5, 7), (0, 0), (100, -40)])
+      for t in sampleTransforms():
+         projected = t.projectPoints(points)
+         self.assertEqual((4, 2), projected.shape)
+         for ((x, y), (projected_x, projected_y)) in zip(points, projected):
+            p1 = t.project(Point(x, y))
+            self.assertAlmostEqual(p1.x, projected_x)
+            self.assertAlmostEqual(p1.y, projected_y)
+         self.assert_(numpy.allclose(projected, t.project(points)))
+         
+   @unittest.skipIf(numpy == None, "requires NumPy")
+   def testProjectRectangles(self):
+      rectangles = [Rectangle(0, 0, 10, 20), Rectangle(-5, 3, 7, 9)]
+      for t in sampleTransforms():
+         projected = t.projectRectangles(numpy.array(rectangles))
+         for (r1, edges) in zip(rectangles, projected):
+            for (edge1, edge2) in zip(r1.project(t), edges):
+               self.assertAlmostEqual(edge1, edge2)
+               
+   @unittest.skipIf(numpy == None, "requires NumPy")
+   def testComposeTransforms(self):
+      firsts = sampleTransforms()
+      seconds = firsts[::-1]
+      for (t1, t2, t3) in zip(firsts, seconds, composeTransforms(firsts, seconds)):
+         self.assertMatrixAlmostEqual(t1.compose(t2), t3)
+      t4 = Transform.makeTranslate(1, 2)
+      for (t1, t3) in zip(firsts, composeTransforms(t4, firsts)):
+         self.assertMatrixAlmostEqual(t4.compose(t1), t3)
+         
+   @unittest.skipIf(numpy == None, "requires NumPy")
+   def testInvertTransforms(self):
+      transforms = sampleTransforms()
+      inverses = invertTransforms(transforms)
+      for (t1, t2) in zip(transforms, inverses):
+         self.assertEqual(t2, t1.inverse())
+         self.assertMatrixAlmostEqual(Transform.makeFromMatrix(t1.matrix).inverse(), t2)
+         self.assertMatrixAlmostEqual(t1.compose(t2), Transform.makeIdentity())
+      
+   @unittest.skipIf(numpy == None, "requires NumPy")
+   def testMatrixStacks(self):
+      transforms = sampleTransforms()
+      matrices = matrixStack(transforms)
+      products = composeMatrices(matrices, matrices[::-1])
+      self.assertEqual((len(transforms), 3, 3), products.shape)
+      for (t1, t2, product) in zip(transforms, transforms[::-1], products):
+         self.assertMatrixAlmostEqual(t1.compose(t2), Transform.makeFromMatrix(product))
+      inverses = invertMatrices(matrices)
+      self.assertEqual((len(transforms), 3, 3), inverses.shape)
+      for (t1, inverse) in zip(transforms, inverses):
+         self.assertMatrixAlmostEqual(t1.inverse(), Transform.makeFromMatrix(inverse))
+         
+   @unittest.skipIf(numpy == None, "requires NumPy")
+   def testInvertSingular(self):
+      singular = Transform.makeScale(0, 1)
+      self.assertRaises(ZeroDivisionError, singular.inverse)
+      self.assertRaises(ZeroDivisionError, invertTransforms,
+                        [Transform.makeIdentity(), singular])
+      
    def testEqual(self):
        t1 = Transform.makeTranslate(1, 1)
        t2 = Transform.makeTranslate(1, 1)
@@ -17,10 +17,18 @@ from cStringIO import StringIO
 import string, math
 from point import *
 
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
 class Transform:
    """An affine tranform matrix for translating from one coordinate system to another.
+   
+   With NumPy, arrays of points and rectangles can be projected at once.
       
    self.matrix - 3 x 3 tranformation matrix stored as a list of nine values.
+   self.inverse_cache - (matrix, inverse matrix) of the last inverse computed
    """
    
    # **** Constructors
@@ -28,6 +36,7 @@ class Transform:
    def __init__(self):
       """Default matrix is the identity matrix"""
       self.matrix = [1, 0, 0, 0, 1, 0, 0, 0, 1]
+      self.inverse_cache = None
       
    @classmethod
    def makeIdentity(self):
@@ -57,14 +66,47 @@ class Transform:
       transform.matrix = [cos_angle, -sin_angle, 0, sin_angle, cos_angle, 0, 0, 0, 1]
       return transform 
    
+   @classmethod
+   def makeFromMatrix(self, matrix):
+      """Return a transform for a 3 x 3 NumPy array or nine values"""
+      if numpy != None:
+         matrix = numpy.ravel(matrix)
+      transform = Transform()
+      transform.matrix = [float(value) for value in matrix]
+      return transform
+   
    # **** Projection
    
    def project(self, point):
       """Convert a point into the coordinate system described by this 
-         transform"""
+         transform. Given a NumPy array, projects its points instead."""
+      if numpy != None and isinstance(point, numpy.ndarray):
+         return self.projectPoints(point)
+      return Point(*self.projectCoordinates(point.x, point.y))
+   
+   def projectCoordinates(self, x, y):
+      """Return the projected (x, y) of a point's coordinates"""
       matrix = self.matrix
-      return Point(matrix[0] * point.x + matrix[1] * point.y + matrix[2],
-                   matrix[3] * point.x + matrix[4] * point.y + matrix[5])
+      return (matrix[0] * x + matrix[1] * y + matrix[2],
+              matrix[3] * x + matrix[4] * y + matrix[5])
+   
+   def projectPoints(self, points):
+      """Project an array of (x, y) points, shape [... x 2], returning a new
+         array of float coordinates"""
+      points = numpy.asarray(points, numpy.float64)
+      matrix = self.matrixArray()
+      return numpy.dot(points, matrix[:2, :2].T) + matrix[:2, 2]
+   
+   def projectRectangles(self, rectangles):
+      """Project an array of (left, top, right, bottom) rectangles, shape
+         [... x 4], as Rectangle.project does, returning a new array"""
+      rectangles = numpy.asarray(rectangles, numpy.float64)
+      corners = self.projectPoints(rectangles.reshape(rectangles.shape[:-1] + (2, 2)))
+      return corners.reshape(rectangles.shape)
+   
+   def matrixArray(self):
+      """Return the matrix as a 3 x 3 NumPy array"""
+      return numpy.array(self.matrix, numpy.float64).reshape(3, 3)
    
    # **** Composition and Inverse
    
@@ -89,10 +131,18 @@ class Transform:
       return result
    
    def inverse(self):
-      """Compute the inverse of the matrix to reverse the transform"""
+      """Compute the inverse of the matrix to reverse the transform.
+      
+      The inverse matrix is kept until the matrix changes, so repeated
+      calls do not compute it again. Each call returns a new transform.
+      """
+      if self.inverse_cache != None and self.inverse_cache[0] == self.matrix:
+         result = Transform()
+         result.matrix = list(self.inverse_cache[1])
+         return result
       a = self.matrix
-      det = (  a[0]*a[4]*a[8] - a[0]*a[5]*a[7] - a[1]*a[3]*a[8] 
-             + a[1]*a[5]*a[6] + a[2]*a[3]*a[7] - a[2]*a[4]*a[6] )
+      det = float(  a[0]*a[4]*a[8] - a[0]*a[5]*a[7] - a[1]*a[3]*a[8] 
+                  + a[1]*a[5]*a[6] + a[2]*a[3]*a[7] - a[2]*a[4]*a[6] )
    
       result = Transform()
       result.matrix = [
@@ -108,6 +158,7 @@ class Transform:
          -(a[0]*a[7] - a[1]*a[6]) / det,
          ( a[0]*a[4] - a[1]*a[3]) / det ]
       
+      self.inverse_cache = (list(self.matrix), list(result.matrix))
       return result
    
    # **** Equals
@@ -135,4 +186,77 @@ class Transform:
       for start in xrange(0, 9, 3):
          print >>out, "[", string.join(strings[start:start + 3], ", "), "]"
       return out.getvalue()
-      
\ No newline at end of file
+
+
+# **** Stacks of Transforms
+
+def matrixStack(transforms):
+   """Return the matrices of a list of transforms as an [N x 3 x 3] array"""
+   return numpy.array([transform.matrix for transform in transforms],
+                      numpy.float64).reshape(-1, 3, 3)
+
+def composeMatrices(firsts, seconds):
+   """Return the products of two [N x 3 x 3] stacks of matrices.
+   
+   Either may instead be a single 3 x 3 matrix, composed with every
+   matrix of the other, as Transform.compose() does.
+   """
+   return numpy.matmul(numpy.asarray(firsts, numpy.float64),
+                       numpy.asarray(seconds, numpy.float64))
+
+def invertMatrices(matrices):
+   """Return the inverses of an [N x 3 x 3] stack of matrices.
+   
+   Computed as Transform.inverse() does, so a singular matrix raises
+   ZeroDivisionError, as it does there.
+   """
+   a = numpy.asarray(matrices, numpy.float64).reshape(-1, 9).T
+   det = (  a[0]*a[4]*a[8] - a[0]*a[5]*a[7] - a[1]*a[3]*a[8]
+          + a[1]*a[5]*a[6] + a[2]*a[3]*a[7] - a[2]*a[4]*a[6] )
+   if not det.all():
+      raise ZeroDivisionError("matrix %i is singular" % numpy.flatnonzero(det == 0)[0])
+   result = numpy.array([
+       ( a[4]*a[8] - a[5]*a[7]),
+      -(a[1]*a[8] - a[2]*a[7]),
+       ( a[1]*a[5] - a[2]*a[4]),
+      
+      -(a[3]*a[8] - a[5]*a[6]),
+       ( a[0]*a[8] - a[2]*a[6]),
+      -(a[0]*a[5] - a[2]*a[3]),
+      
+       ( a[3]*a[7] - a[4]*a[6]),
+      -(a[0]*a[7] - a[1]*a[6]),
+       ( a[0]*a[4] - a[1]*a[3]) ]) / det
+   return result.T.reshape(-1, 3, 3)
+
+def composeTransforms(firsts, seconds):
+   """Return [first.compose(second)] for two lists of transforms.
+   
+   Either list may instead be a single transform, composed with every
+   transform of the other. With NumPy the products are computed together
+   by composeMatrices().
+   """
+   if isinstance(firsts, Transform):
+      firsts = [firsts] * len(seconds)
+   if isinstance(seconds, Transform):
+      seconds = [seconds] * len(firsts)
+   if numpy == None:
+      return [first.compose(second) for (first, second) in zip(firsts, seconds)]
+   products = composeMatrices(matrixStack(firsts), matrixStack(seconds))
+   return [Transform.makeFromMatrix(product) for product in products]
+
+def invertTransforms(transforms):
+   """Return [transform.inverse()] for a list of transforms.
+   
+   With NumPy the inverses are computed together by invertMatrices().
+   Each transform keeps its inverse, as if inverse() had been called.
+   """
+   if numpy == None:
+      return [transform.inverse() for transform in transforms]
+   inverses = []
+   for (transform, matrix) in zip(transforms,
+                                  invertMatrices(matrixStack(transforms))):
+      inverse = Transform.makeFromMatrix(matrix)
+      transform.inverse_cache = (list(transform.matrix), list(inverse.matrix))
+      inverses.append(inverse)
+   return inverses
@@ -0,0 +1,55 @@
+#!/usr/local/bin/python
+
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Serves tiled images over HTTP for the viewer, from one process, with
+# recently served tiles kept in memory. Tiles in sharded layouts and tile
+# archives are served at the same URLs as tiles in the flat layout.
+# Missing tiles of lazily tiled images are rendered from their source.
+
+from tiled_image import *
+from optparse import OptionParser
+   
+if __name__ == "__main__":
+    parser = OptionParser(usage = "%prog [options] [root_directory]")
+    parser.add_option("-p", "--port", dest="port", type="int", default = 8000,
+            help="port to listen on")
+    parser.add_option("-b", "--bind", dest="bind", default = "",
+            help="address to listen on, default: all interfaces")
+    parser.add_option("-m", "--cache-memory", dest="cache_memory", type="int",
+            default = 64, help="megabytes of encoded tiles to keep in memory")
+    parser.add_option("-w", "--workers", dest="workers", type="int",
+            default = 2, help="processes rendering tiles of lazily tiled images, 0 for none")
+    parser.add_option("-s", "--source-memory", dest="source_memory", type="int",
+            default = 256, help="megabytes of decoded sources each rendering process keeps")
+    (options, args) = parser.parse_args()
+    if len(args) > 1:
+        parser.error("more than one root directory")
+    root_path = "."
+    if len(args) == 1:
+        root_path = args[0]
+    
+    server = TileServer(root_path, (options.bind, options.port),
+                        options.cache_memory * 1024 * 1024, options.workers,
+                        options.source_memory * 1024 * 1024)
+    print "Serving %s on port %i" % (os.path.abspath(root_path), options.port)
+    try:
+        server.serveForever()
+    except KeyboardInterrupt:
+        print "\n%r" % server.store.cache
+        if server.renderer != None:
+            print "%i tiles rendered, %i requests shared a render" % (
+                server.renderer.render_count, server.renderer.coalesced_count)
@@ -16,22 +16,121 @@
 # Author: Jonathan A, Smith
 
 from tiled_image import *
+from tiled_image.tile_order import TILE_ORDERS
+from tiled_image import downsampler
 from optparse import OptionParser
    
 if __name__ == "__main__":
     parser = OptionParser()
     parser.add_option("-b", "--bgcolor", dest="bgcolor", default = "0xFFFFFF",
             help="background color as an RBG hex number, ex: 0xFFFFFF")
+    parser.add_option("-w", "--workers", dest="workers", type="int", default = 1,
+            help="number of worker processes used to generate tiles")
+    parser.add_option("-m", "--band-memory", dest="band_memory", type="int",
+            help="decode the source in bands of at most this many megabytes")
+    parser.add_option("-M", "--max-memory", dest="max_memory", type="int",
+            help="megabytes the whole run may use: workers, bands and caches are fitted to it")
+    parser.add_option("-c", "--cascade", dest="cascade", action="store_true",
+            default = False,
+            help="build coarser layers from tiles kept in memory, not from disk")
+    parser.add_option("-t", "--tile-cache", dest="tile_cache", type="int",
+            default = 32, help="megabytes of decoded tiles to keep in memory")
+    parser.add_option("-o", "--order", dest="order", default = "row",
+            choices = TILE_ORDERS.keys(),
+            help="tile traversal order: row, morton or hilbert")
+    parser.add_option("-d", "--downsampler", dest="downsampler", default = "pil",
+            choices = ["pil", "numpy"],
+            help="resample coarser layers a tile at a time (pil) or a row at a time (numpy)")
+    parser.add_option("-S", "--shard-rows", dest="shard_rows", type="int",
+            default = 0,
+            help="put each layer's tiles in subdirectories of this many tile rows")
+    parser.add_option("-P", "--pack", dest="pack", action="store_true",
+            default = False,
+            help="pack all tiles into one archive file (tiles.pack)")
+    parser.add_option("-C", "--content-store", dest="content_store",
+            help="keep tiles once by content in this store directory, shared between images")
+    parser.add_option("-f", "--format", dest="tile_encoding", default = "jpg",
+            help="tile format and encoder settings, e.g. jpg:quality=80,progressive or webp:quality=75")
+    parser.add_option("-e", "--eager-layers", dest="eager_layers", type="int",
+            default = 0,
+            help="tile only this many coarsest layers, leaving finer tiles to serve_tiles.py")
+    parser.add_option("-E", "--skip-empty", dest="skip_empty", action="store_true",
+            default = False,
+            help="do not store tiles that are only background, mark them in occupancy.map")
+    parser.add_option("-a", "--batch", dest="batch", action="store_true",
+            default = False,
+            help="tile every image in the given files, directories and .txt file lists")
+    parser.add_option("-O", "--output-dir", dest="output_dir",
+            help="batch: directory for tiled images, default: _images beside each source")
+    parser.add_option("-s", "--small-image", dest="small_image", type="int",
+            default = 16,
+            help="batch: megapixels below which an image is tiled by a single worker")
+    parser.add_option("-v", "--progress", dest="progress", default = "summary",
+            help="where progress goes: summary, quiet or json:path, comma separated")
+    parser.add_option("-H", "--hash", dest="hash", action="store_true",
+            default = False,
+            help="store source hashes so the image can be retiled incrementally")
+    parser.add_option("-r", "--retile", dest="retile", action="store_true",
+            default = False,
+            help="regenerate only tiles whose source changed in an existing tiled image")
+    parser.add_option("-p", "--previous", dest="previous",
+            help="retile: previous version of the source to compare with")
     (options, args) = parser.parse_args()
     bgcolor = eval(options.bgcolor)
+    if options.downsampler == "numpy" and downsampler.numpy == None:
+        parser.error("the numpy downsampler requires NumPy")
     if len(args) < 1:
         parser.error("mising image")
-    source_file_path = args[0]
+    if options.pack and options.content_store != None:
+        parser.error("tiles can be packed or kept in a content store, not both")
+    try:
+        TileEncoder(options.tile_encoding)
+        eventSinks(options.progress)
+    except ValueError, error:
+        parser.error(str(error))
     
-    if len(args) < 2:
-        tiled_image = TiledImage.fromSourceImage(source_file_path)
-    else:
-        output_path = args[1]
-        tiled_image = TiledImage.fromSourceImage(source_file_path, output_path)
+    tiling_options = TilingOptions()
+    tiling_options.workers = options.workers
+    tiling_options.cascade = options.cascade
+    tiling_options.tile_cache_memory = options.tile_cache * 1024 * 1024
+    tiling_options.tile_order = options.order
+    tiling_options.downsampler = options.downsampler
+    tiling_options.source_hashes = options.hash
+    tiling_options.shard_rows = options.shard_rows
+    tiling_options.tile_archive = options.pack
+    tiling_options.tile_store = options.content_store
+    tiling_options.eager_layers = options.eager_layers
+    tiling_options.tile_encoding = options.tile_encoding
+    tiling_options.skip_empty_tiles = options.skip_empty
+    tiling_options.progress = options.progress
+    if options.band_memory != None:
+        tiling_options.band_memory = options.band_memory * 1024 * 1024
+    if options.max_memory != None:
+        tiling_options.max_memory = options.max_memory * 1024 * 1024
+    
+    try:
+        if options.retile:
+            source_file_path = args[0]
+            if len(args) < 2:
+                output_path = TiledImage.defaultImagePath(source_file_path)
+            else:
+                output_path = args[1]
+            tiled_image = TiledImage.fromDirectory(output_path, tiling_options)
+            tiled_image.retileFromSource(source_file_path, options.previous)
+        elif options.batch:
+            batch_tiler = BatchTiler(tiling_options, options.output_dir,
+                                     options.small_image * 1024 * 1024)
+            batch_tiler.tileImages(args)
+        elif len(args) < 2:
+            source_file_path = args[0]
+            tiled_image = TiledImage.fromSourceImage(source_file_path, 
+                                                      options = tiling_options)
+        else:
+            source_file_path = args[0]
+            output_path = args[1]
+            tiled_image = TiledImage.fromSourceImage(source_file_path, output_path,
+                                                      tiling_options)
+    except ValueError, error:
+        parser.error(str(error))
         
     print "\nDone."
\ No newline at end of file
@@ -17,4 +17,10 @@
 
 from image_information import *
 from tiled_image import *
-from pyramid import *
\ No newline at end of file
+from pyramid import *
+from tiling_options import *
+from tile_encoder import *
+from instrumentation import *
+from content_store import *
+from batch_tiler import *
+from tile_server import *
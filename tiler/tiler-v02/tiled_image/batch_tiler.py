@@ -0,0 +1,245 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+import os, os.path, copy, time
+import Image
+from geometry import *
+from pyramid import Pyramid
+from tiled_image import TiledImage
+from tile_pool import TilePool, releaseWorkerTilers
+from memory_budget import MemoryBudget
+from instrumentation import Instrumentation, eventSinks
+
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp",
+                     ".ppm", ".pgm", ".gif")
+
+def _tileWholeImage(job):
+   """Tile one small image in a worker process, returning (job, error).
+
+   Any error is returned, so one bad image does not stop the batch.
+   """
+   (source_path, image_path, pixel_count, tile_count, options) = job
+   # A large image tiled earlier in this worker no longer needs its source
+   releaseWorkerTilers()
+   try:
+      TiledImage.fromSourceImage(source_path, image_path, options)
+   except Exception, error:
+      return (job, errorMessage(error))
+   return (job, None)
+
+def errorMessage(error):
+   """Return the message recorded for an image that failed"""
+   if isinstance(error, EnvironmentError):
+      return str(error)
+   return "%s: %s" % (error.__class__.__name__, error)
+
+def pyramidTileCount(pyramid):
+   """Return the number of tiles in all layers of a pyramid"""
+   count = 0
+   for layer_number in xrange(pyramid.layer_count):
+      grid_size = pyramid.tileGridSize(layer_number)
+      count += grid_size.width * grid_size.height
+   return count
+
+
+class BatchTiler:
+   """Tiles many source images on one shared pool of worker processes.
+
+   Images with fewer than small_image_pixels pixels are each tiled whole
+   by a single worker, several at a time; larger images are tiled one
+   after another with their tiles spread across all workers. Images that
+   are already completely tiled are skipped.
+
+   self.options - TilingOptions used for every image
+   self.output_path - directory for tiled images, or None to put each
+      in an _images directory beside its source
+   self.small_image_pixels - largest image tiled by one worker
+   self.instrumentation - Instrumentation sent what the batch skips and
+      its totals; each image sends its own progress
+   """
+
+   def __init__(self, options, output_path = None,
+                small_image_pixels = 16 * 1024 * 1024):
+      self.options = options
+      self.output_path = output_path
+      self.small_image_pixels = small_image_pixels
+      self.tiled_count = 0
+      self.skipped_count = 0
+      self.failures = []
+      self.pixel_count = 0
+      self.tile_count = 0
+      self.instrumentation = Instrumentation(output_path,
+                                             eventSinks(options.progress))
+
+   def findSources(self, paths):
+      """Return source image paths from files, directories and file lists.
+
+      Directories are searched recursively for image files. A path ending
+      in .txt is read as a list of paths, one per line.
+      """
+      sources = []
+      for path in paths:
+         if os.path.isdir(path):
+            for (directory, names, file_names) in os.walk(path):
+               names[:] = sorted([name for name in names if name != "_images"])
+               for file_name in sorted(file_names):
+                  (name, ext) = os.path.splitext(file_name)
+                  if ext.lower() in SOURCE_EXTENSIONS:
+                     sources.append(os.path.join(directory, file_name))
+         elif path.endswith(".txt"):
+            list_file = open(path, "r")
+            lines = [line.strip() for line in list_file]
+            list_file.close()
+            sources.extend(self.findSources(
+               [line for line in lines if line and not line.startswith("#")]))
+         else:
+            sources.append(path)
+      return sources
+
+   def imagePath(self, source_path):
+      """Return the directory a source image is tiled into"""
+      if self.output_path == None:
+         return TiledImage.defaultImagePath(source_path)
+      (name, ext) = os.path.splitext(os.path.basename(source_path))
+      return os.path.join(self.output_path, name)
+
+   def imagePaths(self, source_paths):
+      """Return the directory each source image is tiled into, in order.
+
+      Every source gets a directory of its own. When a source would share
+      one with an earlier source, such as a/scan.jpg and b/scan.png in one
+      output directory, the later is tiled under its own directory
+      relative to the directory all the sources are in, and failing that
+      also named with its extension.
+      """
+      directories = [os.path.dirname(os.path.abspath(source_path))
+                     for source_path in source_paths]
+      common_directory = os.path.commonprefix(directories)
+      if not common_directory.endswith(os.sep) and common_directory not in directories:
+         common_directory = os.path.dirname(common_directory)
+      image_paths = []
+      used_paths = set()
+      for (source_path, directory) in zip(source_paths, directories):
+         image_path = self.imagePath(source_path)
+         if image_path in used_paths and self.output_path != None:
+            relative_directory = os.path.relpath(directory, common_directory)
+            image_path = os.path.normpath(os.path.join(
+               self.output_path, relative_directory, os.path.basename(image_path)))
+         if image_path in used_paths:
+            (name, ext) = os.path.splitext(source_path)
+            image_path = "%s_%s" % (image_path, ext[1:].lower())
+         if image_path in used_paths:
+            raise ValueError("%s would be tiled into %s, as an earlier source is" % (
+               source_path, image_path))
+         used_paths.add(image_path)
+         image_paths.append(image_path)
+      return image_paths
+
+   def isComplete(self, image_path):
+      """Return True if contents.xml and every tile of an image exist.
+
+      An image whose contents.xml can not be read, such as one cut short
+      by a crash, is not complete, and is tiled again.
+      """
+      if not os.path.exists(os.path.join(image_path, "contents.xml")):
+         return False
+      if not os.path.exists(os.path.join(image_path, "thumbnail.jpg")):
+         return False
+      try:
+         return TiledImage.fromDirectory(image_path).isComplete()
+      except Exception:
+         return False
+
+   def tileImages(self, paths):
+      """Tile every source image found in paths"""
+      start_time = time.time()
+
+      small_jobs = []
+      large_jobs = []
+      # A source found twice, such as in a directory and a list, is tiled once
+      source_paths = []
+      found_paths = set()
+      for source_path in self.findSources(paths):
+         if os.path.abspath(source_path) not in found_paths:
+            found_paths.add(os.path.abspath(source_path))
+            source_paths.append(source_path)
+      for (source_path, image_path) in zip(source_paths,
+                                           self.imagePaths(source_paths)):
+         if self.isComplete(image_path):
+            self.instrumentation.message("Skipping %s: already tiled" % source_path)
+            self.skipped_count += 1
+            continue
+         try:
+            (width, height) = Image.open(source_path).size
+         except Exception, error:
+            self.failures.append((source_path, errorMessage(error)))
+            continue
+         tile_count = pyramidTileCount(Pyramid(Dimensions(width, height)))
+         job = (source_path, image_path, width * height, tile_count, self.options)
+         if width * height < self.small_image_pixels:
+            small_jobs.append(job)
+         else:
+            large_jobs.append(job)
+
+      pool_workers = self.options.workers
+      if self.options.max_memory != None and len(large_jobs) > 0:
+         # Workers are shared, so the largest image decides how many fit
+         largest = max(large_jobs, key = lambda job: job[2])
+         budget = MemoryBudget(self.options.max_memory, self.instrumentation)
+         pool_workers = budget.fitOptions(self.options, largest[0]).workers
+      pool = TilePool(pool_workers)
+      try:
+         for job in large_jobs:
+            (source_path, image_path, pixel_count, tile_count, options) = job
+            try:
+               tiled_image = TiledImage(image_path, options)
+               tiled_image.initializeFromSource(source_path, pool)
+            except Exception, error:
+               self.failures.append((source_path, errorMessage(error)))
+               continue
+            self.countTiled(job)
+
+         # Small images are tiled serially inside the workers, a few per task
+         worker_options = copy.copy(self.options)
+         worker_options.workers = 1
+         if worker_options.max_memory != None:
+            worker_options.max_memory /= pool_workers
+         small_jobs = [job[:4] + (worker_options,) for job in small_jobs]
+         chunk_size = max(1, len(small_jobs) / (pool_workers * 4))
+         for (job, error) in pool.runUnordered(_tileWholeImage, small_jobs,
+                                               chunk_size):
+            if error == None:
+               self.countTiled(job)
+            else:
+               self.failures.append((job[0], error))
+      finally:
+         pool.close()
+
+      self.reportSummary(time.time() - start_time)
+
+   def countTiled(self, job):
+      """Add a tiled image to the totals"""
+      (source_path, image_path, pixel_count, tile_count, options) = job
+      self.tiled_count += 1
+      self.pixel_count += pixel_count
+      self.tile_count += tile_count
+
+   def reportSummary(self, seconds):
+      """Send totals for the batch, from which throughput is reported"""
+      self.instrumentation.event("batch_end", tiled = self.tiled_count,
+                                 skipped = self.skipped_count,
+                                 failures = self.failures, seconds = seconds,
+                                 pixels = self.pixel_count, tiles = self.tile_count)
+      self.instrumentation.close()
@@ -0,0 +1,136 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+import os.path, hashlib
+import Image, ImageChops
+from geometry import *
+
+HASH_FILE_NAME = "source_hashes.txt"
+
+def pixelBytes(image):
+   """Return the raw pixel data of an image"""
+   if hasattr(image, "tobytes"):
+      return image.tobytes()
+   return image.tostring()
+
+
+class ChangeDetector:
+   """Finds the areas of a source image that changed since it was tiled.
+
+   The source is compared a finest-layer tile at a time, either with a
+   previous version of the source, which finds the exact changed pixels
+   in each tile, or with an MD5 hash of each tile's source pixels stored
+   in the tiled image directory, which finds changed tiles.
+   """
+
+   def __init__(self, tiled_image, source_path):
+      self.tiled_image = tiled_image
+      self.pyramid = tiled_image.pyramid
+      self.source_path = source_path
+      self.finest_layer = self.pyramid.layer_count - 1
+      self.hashes = None
+
+   def tileBoxes(self):
+      """Return [((column, row), source box)] for tiles of the finest layer"""
+      pyramid = self.pyramid
+      tile_extent = pyramid.tileExtent(self.finest_layer)
+      grid_size = pyramid.tileGridSize(self.finest_layer)
+      boxes = []
+      for row in xrange(grid_size.height):
+         for column in xrange(grid_size.width):
+            left = tile_extent.width * column
+            top = tile_extent.height * row
+            right = min(left + tile_extent.width, pyramid.image_size.width)
+            bottom = min(top + tile_extent.height, pyramid.image_size.height)
+            boxes.append(((column, row), (left, top, right, bottom)))
+      return boxes
+
+   def openSource(self, path):
+      """Open a version of the source, as RGB if it is in another mode"""
+      image = Image.open(path)
+      (width, height) = image.size
+      if (width, height) != (self.pyramid.image_size.width,
+                             self.pyramid.image_size.height):
+         raise ValueError("%s is %i x %i, not the size of the tiled image" % (
+            path, width, height))
+      if image.mode == "RGB":
+         # Not converted, which would hold a second decoded copy
+         return image
+      return image.convert("RGB")
+
+   def changedRectangles(self, previous_path = None):
+      """Return Rectangles (in image coordinates) of changed source pixels.
+
+      Compares with the source at previous_path if given, or else with the
+      stored hashes. With neither, the whole image is considered changed.
+      """
+      if previous_path != None:
+         return self.changedSince(previous_path)
+      stored_hashes = self.readHashes()
+      hashes = {}
+      if stored_hashes != None:
+         hashes = self.sourceHashes()
+      return [Rectangle(*box) for (position, box) in self.tileBoxes()
+              if stored_hashes == None or 
+                 hashes[position] != stored_hashes.get(position)]
+
+   def changedSince(self, previous_path):
+      """Return Rectangles of pixels that differ from a previous source"""
+      source = self.openSource(self.source_path)
+      previous = self.openSource(previous_path)
+      changed = []
+      for (position, box) in self.tileBoxes():
+         difference = ImageChops.difference(source.crop(box), previous.crop(box))
+         bounds = difference.getbbox()
+         if bounds != None:
+            (left, top, right, bottom) = bounds
+            changed.append(Rectangle(box[0] + left,  box[1] + top,
+                                     box[0] + right, box[1] + bottom))
+      return changed
+
+   def sourceHashes(self):
+      """Return {(column, row): hash} of the source under each finest tile"""
+      if self.hashes == None:
+         source = self.openSource(self.source_path)
+         self.hashes = dict([
+            (position, hashlib.md5(pixelBytes(source.crop(box))).hexdigest())
+            for (position, box) in self.tileBoxes()])
+      return self.hashes
+
+   def hashFilePath(self):
+      """Return the path of the stored source hashes"""
+      return os.path.join(self.tiled_image.image_path, HASH_FILE_NAME)
+
+   def readHashes(self):
+      """Return stored {(column, row): hash}, or None if there are none"""
+      hash_path = self.hashFilePath()
+      if not os.path.exists(hash_path):
+         return None
+      hashes = {}
+      hash_file = open(hash_path, "r")
+      for line in hash_file:
+         (row, column, digest) = line.split()
+         hashes[(int(column), int(row))] = digest
+      hash_file.close()
+      return hashes
+
+   def writeHashes(self):
+      """Store the hash of the source under each finest tile"""
+      hashes = self.sourceHashes()
+      out = open(self.hashFilePath(), "w")
+      for ((column, row), digest) in sorted(hashes.items(),
+                                            key = lambda item: item[0][::-1]):
+         print >>out, "%i %i %s" % (row, column, digest)
+      out.close()
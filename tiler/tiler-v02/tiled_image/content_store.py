@@ -0,0 +1,304 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+
+# A content store keeps the tiles of many tiled images in one directory,
+# each distinct tile once, in a file named by the SHA-1 hash of its bytes:
+#
+#   <store>/<first two hex digits>/<hex digest>
+#   <store>/images.txt - paths, relative to the store, of the tiled images
+#                        that use the store
+#   <store>/images.lock - locked while images.txt is changed
+#
+# Each tiled image keeps a content index of the hash of each of its tiles:
+#
+#   header  - "TILEHASH", format version and layer grid sizes (see
+#             grid_index.py)
+#   index   - SHA-1 digest of each tile ("<20s" per tile), by layer, then
+#             row, then column; all zero bytes for no tile
+#
+# A tile's file is complete before its digest is written to an index, so
+# an indexed tile is always readable.
+
+import os, os.path, mmap, struct, hashlib, time
+from grid_index import GridIndex
+
+try:
+   import fcntl
+except ImportError:
+   fcntl = None
+
+STORE_INDEX_FILE_NAME = "tiles.index"
+IMAGES_FILE_NAME = "images.txt"
+IMAGES_LOCK_FILE_NAME = "images.lock"
+INDEX_MAGIC = "TILEHASH"
+INDEX_VERSION = 1
+ENTRY_FORMAT = "<20s"
+NO_DIGEST = "\0" * 20
+
+class ContentStore:
+   """A directory of tiles shared by tiled images, stored once by content.
+
+   Any number of processes may add tiles: each tile is written to a
+   temporary file and renamed into place, and a tile with the same
+   content is the same file.
+   """
+
+   def __init__(self, path):
+      self.path = path
+      self.registered_paths = set()
+
+   def tilePath(self, digest):
+      """Return the path of the file holding a tile with a binary digest"""
+      hex_digest = digest.encode("hex")
+      return os.path.join(self.path, hex_digest[:2], hex_digest)
+
+   def put(self, data):
+      """Store a tile's bytes, unless already stored, returning their digest"""
+      digest = hashlib.sha1(data).digest()
+      tile_path = self.tilePath(digest)
+      if os.path.exists(tile_path):
+         try:
+            # A reused tile counts as new, so garbage collection keeps it
+            # until this image has indexed it
+            os.utime(tile_path, None)
+            return digest
+         except OSError:
+            # Removed since it was found; stored again below
+            pass
+      directory = os.path.dirname(tile_path)
+      if not os.path.isdir(directory):
+         try:
+            os.makedirs(directory)
+         except OSError:
+            # Made at the same time by another process
+            if not os.path.isdir(directory):
+               raise
+      temporary_path = "%s.%i.tmp" % (tile_path, os.getpid())
+      out = open(temporary_path, "wb")
+      out.write(data)
+      # On disk before its name is, so a renamed tile is never empty
+      out.flush()
+      os.fsync(out.fileno())
+      out.close()
+      os.rename(temporary_path, tile_path)
+      return digest
+
+   def lockImages(self):
+      """Return an open lock file, held until closed, for changing images.txt"""
+      if not os.path.isdir(self.path):
+         os.makedirs(self.path)
+      lock_file = open(os.path.join(self.path, IMAGES_LOCK_FILE_NAME), "a")
+      if fcntl != None:
+         fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+      return lock_file
+
+   def register(self, image_path):
+      """Add a tiled image to the images whose tiles are kept.
+
+      The path is recorded relative to the store, so a store moved along
+      with its images still finds them.
+      """
+      image_path = os.path.abspath(image_path)
+      if image_path in self.registered_paths:
+         return
+      if image_path not in self.imagePaths():
+         lock_file = self.lockImages()
+         try:
+            if image_path not in self.imagePaths():
+               out = open(os.path.join(self.path, IMAGES_FILE_NAME), "a")
+               out.write(os.path.relpath(image_path, os.path.abspath(self.path)) + "\n")
+               out.close()
+         finally:
+            lock_file.close()
+      self.registered_paths.add(image_path)
+
+   def imagePaths(self):
+      """Return the absolute paths of the tiled images registered with the store"""
+      images_path = os.path.join(self.path, IMAGES_FILE_NAME)
+      if not os.path.exists(images_path):
+         return []
+      store_path = os.path.abspath(self.path)
+      images_file = open(images_path, "r")
+      image_paths = []
+      for line in images_file:
+         if not line.strip():
+            continue
+         # Paths registered before they were relative are absolute
+         image_path = os.path.normpath(os.path.join(store_path, line.strip()))
+         # Images tiled at the same time may each have added themselves
+         if image_path not in image_paths:
+            image_paths.append(image_path)
+      images_file.close()
+      return image_paths
+
+   def dropImages(self, dropped_paths):
+      """Remove images from the list of registered images.
+
+      The list is read again with the lock held, so images registered
+      meanwhile are kept.
+      """
+      lock_file = self.lockImages()
+      try:
+         store_path = os.path.abspath(self.path)
+         image_paths = [image_path for image_path in self.imagePaths()
+                        if image_path not in dropped_paths]
+         images_path = os.path.join(self.path, IMAGES_FILE_NAME)
+         temporary_path = "%s.%i.tmp" % (images_path, os.getpid())
+         out = open(temporary_path, "w")
+         out.write("".join([os.path.relpath(image_path, store_path) + "\n"
+                            for image_path in image_paths]))
+         out.close()
+         os.rename(temporary_path, images_path)
+      finally:
+         lock_file.close()
+
+   def referencedDigests(self):
+      """Return (digests of indexed tiles, images without a content index)"""
+      digests = set()
+      missing_paths = []
+      image_paths = self.imagePaths()
+      # Opening their indexes need not register them again
+      self.registered_paths.update(image_paths)
+      for image_path in image_paths:
+         index_path = os.path.join(image_path, STORE_INDEX_FILE_NAME)
+         if not os.path.exists(index_path):
+            missing_paths.append(image_path)
+            continue
+         index = ContentIndex(index_path, self)
+         digests.update(index.digests())
+         index.close()
+      return (digests, missing_paths)
+
+   def collectGarbage(self, grace_seconds = 3600, dry_run = False,
+                      prune_missing = False):
+      """Remove tiles no registered image indexes.
+
+      Tiles stored in the last grace_seconds are kept, since an image
+      being tiled writes a tile before it indexes it. A registered image
+      without a content index may only have moved, so nothing is removed
+      while there are any, unless prune_missing is True: then they are
+      dropped from the store. Returns (tiles removed, bytes removed, tiles
+      kept, paths of images dropped).
+      """
+      (referenced, missing_paths) = self.referencedDigests()
+      if len(missing_paths) > 0 and not prune_missing:
+         raise IOError("%s: %i registered images have no %s, moved or deleted: %s" % (
+            self.path, len(missing_paths), STORE_INDEX_FILE_NAME,
+            ", ".join(missing_paths)))
+      if len(missing_paths) > 0 and not dry_run:
+         self.dropImages(missing_paths)
+      oldest = time.time() - grace_seconds
+      (removed_count, removed_bytes, kept_count) = (0, 0, 0)
+      for directory in sorted(os.listdir(self.path)):
+         directory_path = os.path.join(self.path, directory)
+         if len(directory) != 2 or not os.path.isdir(directory_path):
+            continue
+         for name in os.listdir(directory_path):
+            tile_path = os.path.join(directory_path, name)
+            try:
+               digest = name.decode("hex")
+            except TypeError:
+               digest = None
+            status = os.stat(tile_path)
+            if (len(name) == 40 and digest in referenced) or status.st_mtime > oldest:
+               kept_count += 1
+               continue
+            if not dry_run:
+               os.remove(tile_path)
+            removed_count += 1
+            removed_bytes += status.st_size
+      return (removed_count, removed_bytes, kept_count, missing_paths)
+
+
+class ContentIndex(GridIndex):
+   """Reads and writes the tiles of a tiled image kept in a ContentStore.
+
+   Has the methods of a TileArchive, so a tiled image reads and writes
+   it the same way. The index is read through a read-only memory map.
+   Only one process may write an index.
+   """
+
+   MAGIC = INDEX_MAGIC
+   VERSION = INDEX_VERSION
+   KIND = "content index"
+   ENTRY_FORMAT = ENTRY_FORMAT
+   EMPTY_ENTRY = NO_DIGEST
+
+   def __init__(self, path, store, pyramid = None):
+      """Open an index, creating an empty one for pyramid if needed"""
+      GridIndex.__init__(self, path, pyramid)
+      self.store = store
+      self.index_map = None
+      # Again each time, in case the image moved or was dropped from the store
+      store.register(os.path.dirname(os.path.abspath(path)))
+
+   def readDigest(self, key):
+      """Return the digest of a tile, NO_DIGEST if none"""
+      if self.out != None:
+         self.out.flush()
+      if self.index_map == None:
+         # The index never grows, so one map sees every later write
+         self.index_map = mmap.mmap(self.read_file.fileno(), 0,
+                                    access = mmap.ACCESS_READ)
+      position = self.entryPosition(key)
+      return self.index_map[position:position + struct.calcsize(ENTRY_FORMAT)]
+
+   def contains(self, key):
+      """Return True if the index holds a tile"""
+      return self.readDigest(key) != NO_DIGEST
+
+   def tileFile(self, key):
+      """Return an open file reading a tile's bytes from the store"""
+      digest = self.readDigest(key)
+      if digest == NO_DIGEST:
+         raise IOError("%s has no tile %s" % (self.path, key))
+      return open(self.store.tilePath(digest), "rb")
+
+   def tileBytes(self, key):
+      """Return a tile's bytes"""
+      tile_file = self.tileFile(key)
+      data = tile_file.read()
+      tile_file.close()
+      return data
+
+   def tileBuffer(self, key):
+      """Return a tile's bytes, as TileArchive.tileBuffer() does"""
+      return self.tileBytes(key)
+
+   def digests(self):
+      """Return the set of digests of the tiles in the index"""
+      self.read_file.seek(self.index_start)
+      data = self.read_file.read(self.tile_count * struct.calcsize(ENTRY_FORMAT))
+      entry_size = struct.calcsize(ENTRY_FORMAT)
+      digests = set([data[position:position + entry_size]
+                     for position in xrange(0, len(data), entry_size)])
+      digests.discard(NO_DIGEST)
+      return digests
+
+   def write(self, key, data):
+      """Store a tile's bytes, then point its index entry at them"""
+      self.writeTiles([(key, data)])
+
+   def writeTiles(self, tiles):
+      """Store (key, bytes) tiles, then point their index entries at them"""
+      self.writeEntries([(key, self.store.put(data)) for (key, data) in tiles])
+
+   def close(self):
+      """Close the index"""
+      if self.index_map != None:
+         self.index_map.close()
+         self.index_map = None
+      GridIndex.close(self)
@@ -0,0 +1,243 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+import Image, time
+from math import *
+
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+LANCZOS_SUPPORT = 3.0
+BLOCK_OUTPUTS = 16
+
+def lanczos(x):
+   """Lanczos (a = 3) filter: the kernel of PIL's ANTIALIAS resize"""
+   x = numpy.abs(x)
+   result = numpy.sinc(x) * numpy.sinc(x / LANCZOS_SUPPORT)
+   result[x >= LANCZOS_SUPPORT] = 0.0
+   return result
+
+
+class FilterWeights:
+   """Separable filter weights from one row (or column) of pixels to another.
+
+   The weights are kept as dense matrices for blocks of BLOCK_OUTPUTS
+   outputs, each over just the span of inputs the block reads, so that
+   filtering is a few small matrix products.
+
+   self.blocks - [(start, end, matrix)] where matrix holds the normalized
+      [block outputs x (end - start)] weights of input indexes start to end
+   """
+
+   def __init__(self, input_centers, input_indexes, output_centers, spacing):
+      """Computes weights given the image coordinates of pixel centers.
+
+      input_centers - sorted image coordinates of the input pixels
+      input_indexes - index of each input pixel in the input array
+      output_centers - image coordinates of the output pixels
+      spacing - distance between output pixels in image coordinates
+      """
+      support = LANCZOS_SUPPORT * spacing
+      input_spacing = (input_centers[-1] - input_centers[0]) / max(1, len(input_centers) - 1)
+      taps = int(ceil(2 * support / max(input_spacing, 0.000001))) + 2
+      taps = min(taps, len(input_centers))
+
+      first = numpy.searchsorted(input_centers, output_centers - support)
+      first = numpy.clip(first, 0, len(input_centers) - taps)
+      positions = first[:, numpy.newaxis] + numpy.arange(taps)
+      offsets = (input_centers[positions] - output_centers[:, numpy.newaxis]) / spacing
+      weights = lanczos(offsets)
+      totals = weights.sum(axis = 1)
+      totals[totals == 0] = 1.0
+      weights = weights / totals[:, numpy.newaxis]
+
+      indexes = input_indexes[positions]
+      self.blocks = []
+      for first in xrange(0, len(output_centers), BLOCK_OUTPUTS):
+         block_indexes = indexes[first:first + BLOCK_OUTPUTS]
+         block_weights = weights[first:first + BLOCK_OUTPUTS]
+         start = block_indexes.min()
+         end = block_indexes.max() + 1
+         matrix = numpy.zeros((len(block_indexes), end - start), numpy.float32)
+         outputs = numpy.repeat(numpy.arange(len(block_indexes)), taps)
+         numpy.add.at(matrix, (outputs, (block_indexes - start).ravel()),
+                      block_weights.ravel())
+         self.blocks.append((start, end, matrix))
+
+   def apply(self, pixels, axis):
+      """Filter a two dimensional float32 array along an axis (0 or 1)"""
+      if axis == 0:
+         results = [numpy.dot(matrix, pixels[start:end])
+                    for (start, end, matrix) in self.blocks]
+      else:
+         results = [numpy.dot(pixels[:, start:end], matrix.T)
+                    for (start, end, matrix) in self.blocks]
+      return numpy.concatenate(results, axis)
+
+
+class LayerDownsampler:
+   """Builds the rows of a layer from the layer below it with NumPy.
+
+   Works on whole rows of tiles at once: the finer tiles under a row are
+   joined into one band array, filtered vertically and then horizontally
+   (a tile at a time) with precomputed Lanczos weights. Pixels are
+   placed exactly where the per-tile ANTIALIAS path puts them, but the
+   filter reads across tile boundaries, so there are no seams.
+   """
+
+   def __init__(self, tiled_image, layer_number):
+      self.tiled_image = tiled_image
+      self.pyramid = tiled_image.pyramid
+      self.layer_number = layer_number
+      self.finer_layer = layer_number + 1
+
+      # One block of horizontal weights for each column of tiles
+      (input_centers, input_indexes) = self.pixelCenters(self.finer_layer, 0)
+      (output_centers, output_indexes) = self.pixelCenters(layer_number, 0)
+      spacing = 1.0 / self.pyramid.scaleForLayer(layer_number)
+      self.horizontal = [
+         FilterWeights(input_centers, input_indexes,
+                       output_centers[offset:offset + count], spacing)
+         for (offset, count) in self.tileOffsets(layer_number, 0)]
+
+      # The finer rows read and the vertical weights for each row of tiles
+      self.vertical = []
+      for row in xrange(self.pyramid.tileGridSize(layer_number).height):
+         (first, last) = self.finerRows(row)
+         (input_centers, input_indexes) = self.pixelCenters(self.finer_layer, 1,
+                                                            first, last)
+         (output_centers, output_indexes) = self.pixelCenters(layer_number,
+                                                              1, row, row)
+         self.vertical.append((first, last,
+            FilterWeights(input_centers, input_indexes, output_centers, spacing)))
+
+   def tileBounds(self, layer_number, axis):
+      """Return (start, end) image coordinates of each tile on an axis"""
+      pyramid = self.pyramid
+      if axis == 0:
+         extent = pyramid.tileExtent(layer_number).width
+         count = pyramid.tileGridSize(layer_number).width
+         size = pyramid.image_size.width
+      else:
+         extent = pyramid.tileExtent(layer_number).height
+         count = pyramid.tileGridSize(layer_number).height
+         size = pyramid.image_size.height
+      return [(extent * index, min(extent * (index + 1), size))
+              for index in xrange(count)]
+
+   def tilePixelCount(self, layer_number, start, end):
+      """Return the number of pixels a tile uses to show start to end"""
+      scale = self.pyramid.scaleForLayer(layer_number)
+      return int(ceil(scale * (end - start)))
+
+   def pixelCenters(self, layer_number, axis, first = 0, last = None):
+      """Return image coordinates and array indexes of a layer's pixels.
+
+      Covers tiles first to last (inclusive) on the axis (0 = x, 1 = y).
+      Indexes count from the first pixel of tile first, and skip the
+      background padding at the end of short tiles.
+      """
+      tile_length = (self.pyramid.tile_size.width, self.pyramid.tile_size.height)[axis]
+      bounds = self.tileBounds(layer_number, axis)
+      if last == None:
+         last = len(bounds) - 1
+      centers = []
+      indexes = []
+      for tile in xrange(first, last + 1):
+         (start, end) = bounds[tile]
+         count = self.tilePixelCount(layer_number, start, end)
+         pixels = numpy.arange(count)
+         centers.append(start + (pixels + 0.5) * (float(end - start) / count))
+         indexes.append((tile - first) * tile_length + pixels)
+      return (numpy.concatenate(centers), numpy.concatenate(indexes))
+
+   def tileOffsets(self, layer_number, axis, first = 0, last = None):
+      """Return (offset, count) of each tile's pixels in the output arrays"""
+      bounds = self.tileBounds(layer_number, axis)
+      if last == None:
+         last = len(bounds) - 1
+      offsets = []
+      offset = 0
+      for tile in xrange(first, last + 1):
+         (start, end) = bounds[tile]
+         count = self.tilePixelCount(layer_number, start, end)
+         offsets.append((offset, count))
+         offset += count
+      return offsets
+
+   def finerRows(self, row):
+      """Return the first and last finer rows read when building a row"""
+      pyramid = self.pyramid
+      (top, bottom) = self.tileBounds(self.layer_number, 1)[row]
+      support = LANCZOS_SUPPORT / pyramid.scaleForLayer(self.layer_number)
+      finer_row_count = pyramid.tileGridSize(self.finer_layer).height
+      first = max(pyramid.tileRow(top - support, self.finer_layer), 0)
+      last = min(pyramid.tileRow(bottom + support, self.finer_layer),
+                 finer_row_count - 1)
+      return (first, last)
+
+   def readFinerBand(self, first_row, last_row):
+      """Return the finer tiles in rows first_row to last_row as one array"""
+      pyramid = self.pyramid
+      tile_size = pyramid.tile_size
+      columns = pyramid.tileGridSize(self.finer_layer).width
+      instrumentation = self.tiled_image.instrumentation
+      band = numpy.empty(((last_row - first_row + 1) * tile_size.height,
+                          columns * tile_size.width, 3), numpy.uint8)
+      for row in xrange(first_row, last_row + 1):
+         top = (row - first_row) * tile_size.height
+         for column in xrange(columns):
+            left = column * tile_size.width
+            tile = self.tiled_image.getTileImage(column, row, self.finer_layer)
+            start = time.time()
+            tile_pixels = numpy.asarray(tile.convert("RGB"))
+            (height, width) = tile_pixels.shape[:2]
+            band[top:top + height, left:left + width] = tile_pixels
+            instrumentation.timeStage("paste", start)
+      return band
+
+   def downsampleRow(self, row):
+      """Return one tile row filtered vertically, as [(rows x 3) x columns]"""
+      (first, last, vertical) = self.vertical[row]
+      band = self.readFinerBand(first, last)
+      start = time.time()
+      (rows, columns, bands) = band.shape
+      band = band.reshape(rows, columns * bands).astype(numpy.float32)
+      pixels = vertical.apply(band, 0)
+      pixels = pixels.reshape(len(pixels), columns, bands)
+      pixels = numpy.ascontiguousarray(pixels.transpose(0, 2, 1)).reshape(-1, columns)
+      self.tiled_image.instrumentation.timeStage("resize", start)
+      return pixels
+
+   def tileRow(self, row):
+      """Return [(column, tile image)] for a row of the layer"""
+      pixels = self.downsampleRow(row)
+      tile_size = self.pyramid.tile_size
+      background = self.tiled_image.background
+      instrumentation = self.tiled_image.instrumentation
+      tiles = []
+      for (column, horizontal) in enumerate(self.horizontal):
+         start = time.time()
+         section = horizontal.apply(pixels, 1)
+         section = numpy.clip(section + 0.5, 0, 255).astype(numpy.uint8)
+         section = section.reshape(-1, 3, section.shape[1]).transpose(0, 2, 1)
+         start = instrumentation.timeStage("resize", start)
+         tile = Image.new("RGB", (tile_size.width, tile_size.height), background)
+         tile.paste(Image.fromarray(numpy.ascontiguousarray(section), "RGB"), (0, 0))
+         instrumentation.timeStage("paste", start)
+         tiles.append((column, tile))
+      return tiles
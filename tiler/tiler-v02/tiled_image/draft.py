@@ -0,0 +1,48 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# JPEG decoders can scale an image by 1/2, 1/4 or 1/8 while decoding
+# (PIL's draft mode), which costs a fraction of a full decode. These
+# functions pick and apply such a reduction; other formats decode at
+# full size and are reduced afterwards.
+
+import Image
+from math import *
+
+DRAFT_REDUCTIONS = (8, 4, 2)
+
+def draftReduction(ratio):
+   """Return the largest draft reduction (8, 4, 2 or 1) no more than ratio"""
+   for reduction in DRAFT_REDUCTIONS:
+      if reduction <= ratio + 0.0000001:
+         return reduction
+   return 1
+
+def openDraft(path, reduction):
+   """Open an image, decoding it reduced in size by reduction.
+
+   Returns an image whose size is the full size divided by reduction
+   (rounded up), whether or not the decoder could reduce it directly.
+   """
+   image = Image.open(path)
+   if reduction == 1:
+      return image
+   (width, height) = image.size
+   reduced_size = (int(ceil(float(width) / reduction)),
+                   int(ceil(float(height) / reduction)))
+   image.draft(image.mode, reduced_size)
+   if image.size != reduced_size:
+      image = image.resize(reduced_size, Image.ANTIALIAS)
+   return image
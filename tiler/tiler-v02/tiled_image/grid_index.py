@@ -0,0 +1,144 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Tile archives, content indexes and occupancy maps start with the same
+# header, giving the tile grid of each layer of a tiled image:
+#
+#   header  - magic string, format version and layer count ("<8sII")
+#   layers  - tile columns and rows of each layer ("<II" per layer)
+#
+# A grid index follows it with a fixed size entry per tile, by layer,
+# then row, then column.
+
+import os, os.path, struct
+
+HEADER_FORMAT = "<8sII"
+LAYER_FORMAT = "<II"
+
+def pyramidGridSizes(pyramid):
+   """Return [(columns, rows)] of each layer of a pyramid"""
+   grid_sizes = []
+   for layer_number in xrange(pyramid.layer_count):
+      grid_size = pyramid.tileGridSize(layer_number)
+      grid_sizes.append((grid_size.width, grid_size.height))
+   return grid_sizes
+
+def packGridHeader(magic, version, grid_sizes):
+   """Return the header and layer grid sizes as a string"""
+   parts = [struct.pack(HEADER_FORMAT, magic, version, len(grid_sizes))]
+   for (columns, rows) in grid_sizes:
+      parts.append(struct.pack(LAYER_FORMAT, columns, rows))
+   return "".join(parts)
+
+def readGridHeader(read_file, magic, version, kind, path):
+   """Read a header from a file, returning the layer grid sizes.
+
+   Raises IOError naming path if the header is not of the given magic
+   and version; kind describes the file, e.g. "tile archive".
+   """
+   header_size = struct.calcsize(HEADER_FORMAT)
+   (file_magic, file_version, layer_count) = struct.unpack(
+      HEADER_FORMAT, read_file.read(header_size))
+   if file_magic != magic or file_version != version:
+      raise IOError("%s is not a version %i %s" % (path, version, kind))
+   layer_size = struct.calcsize(LAYER_FORMAT)
+   grid_sizes = []
+   for layer_number in xrange(layer_count):
+      grid_sizes.append(struct.unpack(LAYER_FORMAT, read_file.read(layer_size)))
+   return grid_sizes
+
+class GridIndex:
+   """A file of one fixed size entry per tile of a tiled image.
+
+   Subclasses give the MAGIC, VERSION and KIND of their header, the
+   ENTRY_FORMAT of their entries, the EMPTY_ENTRY of a missing tile,
+   and contains(key). Only one process may write a grid index.
+
+   self.grid_sizes - [(columns, rows)] of each layer
+   self.layer_starts - index entry number of each layer's first tile
+   self.index_start - file position of the first entry
+   self.tile_count - number of entries
+   """
+
+   def __init__(self, path, pyramid = None):
+      """Open a grid index, creating an empty one for pyramid if needed"""
+      self.path = path
+      if not os.path.exists(path):
+         self.create(pyramid)
+      self.out = None
+      self.read_file = open(path, "rb")
+      self.readHeader()
+
+   def create(self, pyramid):
+      """Write the header and an empty index for the tiles of a pyramid"""
+      grid_sizes = pyramidGridSizes(pyramid)
+      out = open(self.path, "wb")
+      out.write(packGridHeader(self.MAGIC, self.VERSION, grid_sizes))
+      tile_count = sum([columns * rows for (columns, rows) in grid_sizes])
+      out.truncate(out.tell() + tile_count * struct.calcsize(self.ENTRY_FORMAT))
+      out.close()
+
+   def readHeader(self):
+      """Read the layer grid sizes and locate the index"""
+      self.grid_sizes = readGridHeader(self.read_file, self.MAGIC,
+                                       self.VERSION, self.KIND, self.path)
+      self.layer_starts = []
+      tile_count = 0
+      for (columns, rows) in self.grid_sizes:
+         self.layer_starts.append(tile_count)
+         tile_count += columns * rows
+      self.index_start = self.read_file.tell()
+      self.tile_count = tile_count
+
+   def entryPosition(self, key):
+      """Return the file position of a tile's index entry"""
+      (layer_number, column, row) = [int(part) for part in key]
+      (columns, rows) = self.grid_sizes[layer_number]
+      entry = self.layer_starts[layer_number] + row * columns + column
+      return self.index_start + entry * struct.calcsize(self.ENTRY_FORMAT)
+
+   def keys(self):
+      """Return (layer_number, column, row) of every tile in the index"""
+      keys = []
+      for (layer_number, (columns, rows)) in enumerate(self.grid_sizes):
+         for row in xrange(rows):
+            for column in xrange(columns):
+               if self.contains((layer_number, column, row)):
+                  keys.append((layer_number, column, row))
+      return keys
+
+   def writeEntries(self, entries):
+      """Write (key, packed entry) index entries"""
+      if self.out == None:
+         self.out = open(self.path, "r+b")
+      for (key, entry) in entries:
+         self.out.seek(self.entryPosition(key))
+         self.out.write(entry)
+
+   def remove(self, keys):
+      """Clear the index entries of tiles"""
+      self.writeEntries([(key, self.EMPTY_ENTRY) for key in keys])
+
+   def flush(self):
+      """Push written entries to the file, where readers can see them"""
+      if self.out != None:
+         self.out.flush()
+
+   def close(self):
+      """Close the index"""
+      if self.out != None:
+         self.out.close()
+         self.out = None
+      self.read_file.close()
@@ -19,7 +19,24 @@ from geometry import Dimensions
 
 
 class ImageInformation:
-   """Tiled image information - converted to and from XML"""
+   """Tiled image information - converted to and from XML
+   
+   self.shard_rows - 0 when each layer's tiles are in one directory, or
+      the number of tile rows in each subdirectory of a layer
+   self.tile_archive - name of the file all tiles are packed in, or None
+      when tiles are separate files
+   self.tile_store - path, relative to the image, of a ContentStore the
+      tiles are kept in, or None
+   self.tile_encoding - TileEncoder spec of the tiles: their format, and
+      any encoder settings, such as "jpg" or "webp:quality=80"
+   self.eager_layers - 0 when every layer is tiled, or the number of
+      coarsest layers tiled; finer tiles are rendered when first requested
+   self.source_path - source image finer tiles are rendered from, when
+      eager_layers is not 0; kept out of contents.xml, which is served to
+      viewers (see TiledImage.writeSourcePath())
+   self.occupancy_map - name of the file marking tiles that are only
+      background and not stored, or None when every tile is stored
+   """
       
    def __init__(self):
       self.layer_count = 0
@@ -27,6 +44,13 @@ class ImageInformation:
       self.bgcolor = 0xFFFFFF
       self.image_size = Dimensions(0, 0)
       self.tile_size = Dimensions(255, 255)
+      self.shard_rows = 0
+      self.tile_archive = None
+      self.tile_store = None
+      self.tile_encoding = "jpg"
+      self.eager_layers = 0
+      self.source_path = None
+      self.occupancy_map = None
    
    def initializeFrom(self, document):
       """Initializes ImageInformation by parsing an XML document"""
@@ -37,6 +61,20 @@ class ImageInformation:
       self.resolution_multiplier = float(
          image_element.getAttribute("resolution_multiplier"))
       self.bgcolor = eval(image_element.getAttribute("bgcolor"))
+      if image_element.hasAttribute("shard_rows"):
+         self.shard_rows = int(image_element.getAttribute("shard_rows"))
+      if image_element.hasAttribute("tile_archive"):
+         self.tile_archive = image_element.getAttribute("tile_archive")
+      if image_element.hasAttribute("tile_store"):
+         self.tile_store = image_element.getAttribute("tile_store")
+      if image_element.hasAttribute("tile_encoding"):
+         self.tile_encoding = image_element.getAttribute("tile_encoding")
+      elif image_element.hasAttribute("tile_format"):
+         self.tile_encoding = image_element.getAttribute("tile_format")
+      if image_element.hasAttribute("eager_layers"):
+         self.eager_layers = int(image_element.getAttribute("eager_layers"))
+      if image_element.hasAttribute("occupancy_map"):
+         self.occupancy_map = image_element.getAttribute("occupancy_map")
       self.initializeDimensions(image_element)
       
    def initializeDimensions(self, element):
@@ -65,11 +103,24 @@ class ImageInformation:
       element = document.documentElement
       element.setAttribute("xmlns:ppad",
                            "http://dewey.at.northwestern.edu/ppad-defs.xml#")
-      element.setAttribute("tile_format", "jpg")
+      (tile_format, separator, settings) = self.tile_encoding.partition(":")
+      element.setAttribute("tile_format", tile_format)
+      if settings:
+         element.setAttribute("tile_encoding", self.tile_encoding)
       element.setAttribute("layers", str(self.layer_count))
       element.setAttribute("resolution_multiplier",
                            str(self.resolution_multiplier))
       element.setAttribute("bgcolor", "0x%X" % self.bgcolor)
+      if self.shard_rows > 0:
+         element.setAttribute("shard_rows", str(self.shard_rows))
+      if self.tile_archive != None:
+         element.setAttribute("tile_archive", self.tile_archive)
+      if self.tile_store != None:
+         element.setAttribute("tile_store", self.tile_store)
+      if self.eager_layers > 0:
+         element.setAttribute("eager_layers", str(self.eager_layers))
+      if self.occupancy_map != None:
+         element.setAttribute("occupancy_map", self.occupancy_map)
       
       self.generateSizeXML(document, element)
       self.generateTileXML(document, element)
@@ -0,0 +1,325 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+
+# Instruments a tiling run: the time spent in each stage of making tiles,
+# counts of the tiles made in each layer, and events describing the run
+# as it goes, sent as dicts to pluggable sinks:
+#
+#   source      - a source is being tiled: source, format, width, height, mode
+#   retile      - an image is being retiled: source, changed_areas
+#   message     - a line of text: text
+#   layer_start - a layer is started: layer, columns, rows, scale
+#   progress    - tiles made in a layer so far: layer, tiles, total, tiles_per_second
+#   layer_end   - a layer is done: layer, seconds and the layer's counts
+#   run_end     - the report: seconds, stages, layers and run totals
+#   memory_budget - options fitted to --max-memory: budget, workers, source,
+#                 tile_cache, downsampler
+#   memory_peak - peak resident memory: own_peak, worker_peak, total,
+#                 estimate, budget
+#   batch_end   - a batch is done: tiled, skipped, failures, seconds,
+#                 pixels, tiles
+#
+# Every event also has "event" (its kind), "image" and "time" (seconds
+# since the run began).
+
+import sys, time, json
+from memory_budget import MEGABYTE
+
+# Stages of making a tile, in the order they are reported
+STAGES = ("decode", "crop", "resize", "paste", "encode", "write")
+
+# Least seconds between progress events for a layer
+PROGRESS_SECONDS = 2.0
+
+def eventSinks(spec):
+   """Return the sinks described by a comma separated spec.
+
+   Each item is "summary" for readable lines on standard output, "quiet"
+   for nothing, or "json:path" for one JSON object per line appended to
+   the file at path.
+   """
+   sinks = []
+   for item in [item for item in spec.split(",") if item]:
+      (kind, separator, path) = item.partition(":")
+      if kind == "summary" and not separator:
+         sinks.append(SummarySink())
+      elif kind == "json" and path:
+         sinks.append(JsonLinesSink(path))
+      elif kind != "quiet" or separator:
+         raise ValueError("unknown progress sink %s: use summary, quiet or json:path" % item)
+   return sinks
+
+
+class SummarySink:
+   """Prints events as readable lines, ending with where the time went"""
+
+   def __init__(self, out = None):
+      self.out = out
+
+   def handle(self, event):
+      out = self.out
+      if out == None:
+         out = sys.stdout
+      kind = event["event"]
+      if kind == "source":
+         print >>out, "Tiling: %s as: %s" % (event["source"], event["image"])
+         print >>out, "Format: %s, Size: %i x %i, Mode: %s" % (
+            event["format"], event["width"], event["height"], event["mode"])
+      elif kind == "retile":
+         print >>out, "Retiling: %s, %i changed areas" % (
+            event["source"], event["changed_areas"])
+      elif kind == "message":
+         print >>out, event["text"]
+      elif kind == "layer_start":
+         print >>out, "generating layer%04i: %i x %i at scale = %1.5f" % (
+            event["layer"], event["columns"], event["rows"], event["scale"])
+      elif kind == "progress":
+         print >>out, "layer%04i: %i of %i tiles, %.1f tiles/s" % (
+            event["layer"], event["tiles"], event["total"], event["tiles_per_second"])
+      elif kind == "layer_end":
+         self.printLayer(out, event)
+      elif kind == "run_end":
+         self.printReport(out, event)
+      elif kind == "memory_budget":
+         print >>out, ("Memory budget %.0f MB: workers: %i, source: %s, "
+                       "tile caches: %.0f MB, downsampler: %s") % (
+            event["budget"] / float(MEGABYTE), event["workers"], event["source"],
+            event["tile_cache"] / float(MEGABYTE), event["downsampler"])
+      elif kind == "memory_peak":
+         print >>out, ("Peak resident memory: %.1f MB here, "
+                       "%.1f MB in the largest worker,") % (
+            event["own_peak"] / float(MEGABYTE), event["worker_peak"] / float(MEGABYTE))
+         print >>out, "  at most %.1f MB in all (estimated %.1f MB, budget %.1f MB)" % (
+            event["total"] / float(MEGABYTE), event["estimate"] / float(MEGABYTE),
+            event["budget"] / float(MEGABYTE))
+      elif kind == "batch_end":
+         self.printBatch(out, event)
+
+   def printLayer(self, out, event):
+      """Print the counts of a finished layer"""
+      print >>out, "layer%04i: %i tiles (%i background), %.1f KB in %.2f s" % (
+         event["layer"], event.get("tiles", 0), event.get("empty_tiles", 0),
+         event.get("bytes", 0) / 1024.0, event["seconds"])
+      if "finer_decoded" in event:
+         print >>out, "layer%04i source tiles: %i decoded, %i re-decoded %i times" % (
+            event["layer"] + 1, event["finer_decoded"], event["finer_redecoded"],
+            event["redecodes"])
+
+   def printBatch(self, out, event):
+      """Print the totals and throughput of a batch"""
+      seconds = max(event["seconds"], 0.001)
+      print >>out, "\nBatch: %i tiled, %i skipped, %i failed in %.1f s" % (
+         event["tiled"], event["skipped"], len(event["failures"]), seconds)
+      print >>out, "  %.2f images/s, %.2f megapixels/s, %.1f tiles/s" % (
+         event["tiled"] / seconds, event["pixels"] / seconds / 1000000.0,
+         event["tiles"] / seconds)
+      for (source_path, error) in event["failures"]:
+         print >>out, "  failed: %s: %s" % (source_path, error)
+
+   def printReport(self, out, event):
+      """Print the time of each stage and the counts of each layer"""
+      if "cache_hits" in event:
+         print >>out, "Tile cache: %i hits, %i misses, %i evictions" % (
+            event["cache_hits"], event["cache_misses"], event["cache_evictions"])
+      if "background_tiles" in event:
+         print >>out, "Background tiles not stored: %i" % event["background_tiles"]
+      stages = event["stages"]
+      total = max(sum([stage["seconds"] for stage in stages.values()]), 0.000001)
+      print >>out, "Time by stage (summed over workers):"
+      names = [name for name in STAGES if name in stages]
+      names += sorted([name for name in stages if name not in STAGES])
+      for name in names:
+         print >>out, "  %-8s %9.2f s %5.1f%% %9i calls" % (
+            name, stages[name]["seconds"], 100 * stages[name]["seconds"] / total,
+            stages[name]["calls"])
+      print >>out, "Layers:"
+      layers = event["layers"]
+      for layer_number in sorted(layers.keys(), reverse = True):
+         counts = layers[layer_number]
+         print >>out, "  layer%04i %7i tiles %7i background %10.1f KB %8.2f s" % (
+            layer_number, counts.get("tiles", 0), counts.get("empty_tiles", 0),
+            counts.get("bytes", 0) / 1024.0, counts.get("seconds", 0))
+      print >>out, "Run: %.2f s" % event["seconds"]
+
+   def close(self):
+      pass
+
+
+class JsonLinesSink:
+   """Appends events to a file as JSON, one object per line"""
+
+   def __init__(self, path):
+      self.path = path
+      self.out = None
+
+   def handle(self, event):
+      if self.out == None:
+         self.out = open(self.path, "a")
+      # One write a line, flushed, so readers following the file see whole lines
+      self.out.write(json.dumps(event, sort_keys = True) + "\n")
+      self.out.flush()
+
+   def close(self):
+      if self.out != None:
+         self.out.close()
+         self.out = None
+
+
+class Instrumentation:
+   """Times the stages of tiling, counts tiles by layer, and sends events.
+
+   Worker processes time and count into their own copy, without sinks.
+   What they gathered goes back with each task's tiles (takeStats) and is
+   added (addStats) to the copy of the process running the tiling, which
+   alone sends events.
+
+   self.sinks - objects whose handle(event) receives each event dict
+   self.stage_times - {stage: [seconds, calls]}
+   self.layer_counts - {layer_number: {counter: value}}
+   self.layers - {layer_number: {start, total, reported}} of begun layers
+   """
+
+   def __init__(self, image_path, sinks = None):
+      self.image_path = image_path
+      if sinks == None:
+         sinks = []
+      self.sinks = sinks
+      self.start_time = time.time()
+      self.stage_times = {}
+      self.layer_counts = {}
+      self.layers = {}
+
+   def __getstate__(self):
+      """Pickle state sent to worker processes: nothing gathered, no sinks"""
+      state = self.__dict__.copy()
+      state["sinks"] = []
+      state["stage_times"] = {}
+      state["layer_counts"] = {}
+      state["layers"] = {}
+      return state
+
+   def beginRun(self):
+      """Start timing a run, forgetting earlier runs"""
+      self.start_time = time.time()
+      self.stage_times = {}
+      self.layer_counts = {}
+      self.layers = {}
+
+   def timeStage(self, stage, start):
+      """Add the time since start to a stage, returning the time now"""
+      now = time.time()
+      times = self.stage_times.get(stage)
+      if times == None:
+         times = [0.0, 0]
+         self.stage_times[stage] = times
+      times[0] += now - start
+      times[1] += 1
+      return now
+
+   def count(self, layer_number, name, amount = 1):
+      """Add to a counter of a layer"""
+      counts = self.layer_counts.get(layer_number)
+      if counts == None:
+         counts = {}
+         self.layer_counts[layer_number] = counts
+      counts[name] = counts.get(name, 0) + amount
+      if name == "tiles" and self.sinks:
+         self.checkProgress(layer_number)
+
+   def takeStats(self):
+      """Return and forget the (stage times, layer counts) gathered"""
+      stats = (self.stage_times, self.layer_counts)
+      self.stage_times = {}
+      self.layer_counts = {}
+      return stats
+
+   def addStats(self, stats):
+      """Add stage times and layer counts gathered by takeStats()"""
+      (stage_times, layer_counts) = stats
+      for (stage, (seconds, calls)) in stage_times.items():
+         times = self.stage_times.setdefault(stage, [0.0, 0])
+         times[0] += seconds
+         times[1] += calls
+      for (layer_number, counts) in layer_counts.items():
+         for (name, amount) in counts.items():
+            self.count(layer_number, name, amount)
+
+   def event(self, kind, **fields):
+      """Send an event to every sink"""
+      if not self.sinks:
+         return
+      event = {"event": kind, "image": self.image_path,
+               "time": round(time.time() - self.start_time, 3)}
+      event.update(fields)
+      for sink in self.sinks:
+         sink.handle(event)
+
+   def message(self, text):
+      """Send a line of text"""
+      self.event("message", text = text)
+
+   def beginLayer(self, layer_number, columns, rows, scale):
+      """Start timing the generation of a layer"""
+      now = time.time()
+      self.layers[layer_number] = {"start": now, "total": columns * rows,
+                                   "reported": now}
+      self.event("layer_start", layer = layer_number, columns = columns,
+                 rows = rows, scale = scale)
+
+   def checkProgress(self, layer_number):
+      """Send a progress event for a layer, if none was sent lately"""
+      layer = self.layers.get(layer_number)
+      if layer == None:
+         return
+      now = time.time()
+      if now - layer["reported"] < PROGRESS_SECONDS:
+         return
+      layer["reported"] = now
+      tiles = self.layer_counts[layer_number]["tiles"]
+      self.event("progress", layer = layer_number, tiles = tiles,
+                 total = layer["total"],
+                 tiles_per_second = tiles / max(now - layer["start"], 0.000001))
+
+   def endLayer(self, layer_number, **fields):
+      """Finish timing a layer, sending its counts and any other fields"""
+      layer = self.layers.pop(layer_number, None)
+      if layer == None:
+         return
+      seconds = time.time() - layer["start"]
+      self.count(layer_number, "seconds", seconds)
+      fields.update(self.layer_counts.get(layer_number, {}))
+      fields["seconds"] = seconds
+      self.event("layer_end", layer = layer_number, **fields)
+
+   def report(self):
+      """Return {stage: {seconds, calls}} and {layer_number: counts}"""
+      stages = dict([(stage, {"seconds": seconds, "calls": calls})
+                     for (stage, (seconds, calls)) in self.stage_times.items()])
+      layers = dict([(layer_number, dict(counts))
+                     for (layer_number, counts) in self.layer_counts.items()])
+      return (stages, layers)
+
+   def endRun(self, **fields):
+      """Send the report of the run, with any run totals, and close sinks"""
+      (stages, layers) = self.report()
+      self.event("run_end", seconds = time.time() - self.start_time,
+                 stages = stages, layers = layers, **fields)
+      self.close()
+
+   def close(self):
+      """Close the sinks"""
+      for sink in self.sinks:
+         sink.close()
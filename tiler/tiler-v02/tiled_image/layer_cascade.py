@@ -0,0 +1,94 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+class LayerCascade:
+   """Tiles the layers of an image as one cascade of tile rows.
+
+   The second finest layer is cut from the source a row at a time. As
+   soon as the rows a coarser row samples from are done, that coarser row
+   is built from the finer tiles still held in memory by the TiledImage,
+   and finer rows no longer needed are released. Each tile is encoded
+   once and never decoded again while tiling, and only a few rows of each
+   layer are held in memory at a time.
+
+   Retained tiles live in this process, so everything except the finest
+   layer is tiled here rather than in a worker pool.
+   """
+
+   def __init__(self, tiled_image, source_tiler, sample_tiler):
+      self.tiled_image = tiled_image
+      self.source_tiler = source_tiler
+      self.sample_tiler = sample_tiler
+      self.pyramid = tiled_image.pyramid
+
+   def tileLayers(self):
+      """Generate the tiles of all layers"""
+      tiled_image = self.tiled_image
+      pyramid = self.pyramid
+      layer_count = pyramid.layer_count
+      source_layer = layer_count - 2
+
+      self.source_tiler.tileLayer(layer_count - 1)
+      if source_layer < 0:
+         return
+
+      self.sample_tiler.pool = None
+      self.source_tiler.pool = None
+      self.next_rows = {}
+      for layer_number in xrange(source_layer, -1, -1):
+         self.next_rows[layer_number] = 0
+         if layer_number > 0:
+            tiled_image.retainLayer(layer_number)
+
+      self.source_tiler.beginLayer(source_layer)
+      for row in xrange(pyramid.tileGridSize(source_layer).height):
+         self.source_tiler.tileRows(row, row + 1, source_layer)
+         self.next_rows[source_layer] = row + 1
+         self.advance(source_layer - 1)
+      self.source_tiler.endLayer(source_layer)
+      tiled_image.retained_tiles.clear()
+      tiled_image.retained_layers = []
+
+   def advance(self, layer_number):
+      """Generate every row of a layer whose finer rows are complete"""
+      if layer_number < 0:
+         return
+      pyramid = self.pyramid
+      finer_layer = layer_number + 1
+      finer_rows_done = self.next_rows[finer_layer]
+      row_count = pyramid.tileGridSize(layer_number).height
+
+      row = self.next_rows[layer_number]
+      while row < row_count and self.lastFinerRow(row, layer_number) < finer_rows_done:
+         if row == 0:
+            self.sample_tiler.beginLayer(layer_number)
+         self.sample_tiler.tileRows(row, row + 1, layer_number)
+         row += 1
+         self.next_rows[layer_number] = row
+         if row < row_count:
+            self.tiled_image.releaseTiles(finer_layer,
+                                          self.firstFinerRow(row, layer_number))
+         else:
+            self.sample_tiler.endLayer(layer_number)
+      if row > 0:
+         self.advance(layer_number - 1)
+
+   def firstFinerRow(self, row, layer_number):
+      """Return the first row of the finer layer that a row samples"""
+      return self.sample_tiler.finerRows(row, layer_number)[0]
+
+   def lastFinerRow(self, row, layer_number):
+      """Return the last row of the finer layer that a row samples"""
+      return self.sample_tiler.finerRows(row, layer_number)[1]
@@ -0,0 +1,183 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+
+import os, asyncore, heapq, itertools
+from collections import deque, OrderedDict
+from tiled_image import TiledImage
+from source_tiler import SourceTiler
+from tile_pool import TilePool
+from occupancy_map import EMPTY_TILE
+from memory_budget import MEGABYTE, decodedPixelBytes
+import Image
+
+# Default bytes of decoded sources a render worker keeps
+SOURCE_MEMORY = 256 * MEGABYTE
+
+# Source tilers kept open in a worker process, by image path
+_source_tilers = OrderedDict()
+
+def _renderTile(image_path, key, source_memory):
+   """Render and encode one tile from its image's source in a worker.
+
+   Sources are kept decoded between renders while they fit in
+   source_memory bytes, the least recently used let go first and the
+   last used always kept. A source larger than that has its full size
+   tiles read a band of rows at a time, if its format can be.
+
+   Returns (encoded tile, None), (EMPTY_TILE, None) for a tile that is
+   only background and not stored, or (None, error message). Any error
+   is returned, since the pool would otherwise never report the task
+   done.
+   """
+   try:
+      source_tiler = _source_tilers.pop(image_path, None)
+      if source_tiler == None:
+         tiled_image = TiledImage.fromDirectory(image_path)
+         source = Image.open(tiled_image.source_path)
+         (width, height) = source.size
+         if width * height * decodedPixelBytes(source.mode) > source_memory:
+            tiled_image.options.band_memory = source_memory
+         source_tiler = SourceTiler(tiled_image, tiled_image.source_path)
+         source_tiler.pyramid = tiled_image.pyramid
+      (layer_number, column, row) = key
+      tile = source_tiler.renderTile(column, row, layer_number)
+      _source_tilers[image_path] = source_tiler
+      while (len(_source_tilers) > 1 and
+             sum([tiler.decodedBytes()
+                  for tiler in _source_tilers.values()]) > source_memory):
+         _source_tilers.popitem(last = False)
+      if source_tiler.tiled_image.skipsTile(tile):
+         return (EMPTY_TILE, None)
+      return (source_tiler.tiled_image.getTileEncoder().encode(tile), None)
+   except Exception, error:
+      return (None, "%s: %s" % (error.__class__.__name__, error))
+
+
+class PendingTile:
+   """A tile waiting to be rendered, and the callbacks waiting for it"""
+
+   def __init__(self, tiled_image, key):
+      self.tiled_image = tiled_image
+      self.key = key
+      self.callbacks = []
+      self.started = False
+
+
+class RenderWakeup(asyncore.file_dispatcher):
+   """Wakes the event loop when a worker finishes a tile"""
+
+   def __init__(self, renderer, read_fd):
+      asyncore.file_dispatcher.__init__(self, read_fd)
+      self.renderer = renderer
+
+   def writable(self):
+      return False
+
+   def handle_read(self):
+      self.recv(4096)
+      self.renderer.deliverFinished()
+
+
+class LazyTileRenderer:
+   """Renders missing tiles of lazily tiled images on worker processes.
+
+   Requests for a tile that is already waiting or being rendered share
+   one render. No more tiles are started than there are workers, and
+   waiting tiles start in priority order: the tile with the most
+   requests waiting on it first, then coarser tiles, then oldest first.
+   Rendered tiles are stored in their tiled image, so each tile is only
+   rendered once.
+
+   Everything but the workers runs on the asyncore event loop: finished
+   renders are handed back through a pipe that wakes the loop.
+
+   Each worker keeps at most about source_memory bytes of decoded sources.
+   """
+
+   def __init__(self, workers = 2, source_memory = SOURCE_MEMORY):
+      self.workers = workers
+      self.source_memory = source_memory
+      self.pool = TilePool(workers)
+      self.pending = {}
+      self.queue = []
+      self.running = 0
+      self.sequence = itertools.count()
+      self.finished = deque()
+      (read_fd, self.wakeup_fd) = os.pipe()
+      self.wakeup = RenderWakeup(self, read_fd)
+      os.close(read_fd)
+      self.render_count = 0
+      self.coalesced_count = 0
+
+   def request(self, tiled_image, key, callback):
+      """Render a tile, then call callback(encoded tile or None)"""
+      tile_id = (tiled_image.image_path, key)
+      pending = self.pending.get(tile_id)
+      if pending == None:
+         pending = PendingTile(tiled_image, key)
+         self.pending[tile_id] = pending
+      else:
+         self.coalesced_count += 1
+      pending.callbacks.append(callback)
+      if not pending.started:
+         # Older entries for the tile are skipped once it has started
+         priority = (-len(pending.callbacks), key[0], self.sequence.next())
+         heapq.heappush(self.queue, (priority, tile_id))
+      self.startRenders()
+
+   def startRenders(self):
+      """Start the most wanted waiting tiles on idle workers"""
+      while self.running < self.workers and len(self.queue) > 0:
+         (priority, tile_id) = heapq.heappop(self.queue)
+         pending = self.pending.get(tile_id)
+         if pending == None or pending.started:
+            continue
+         pending.started = True
+         self.running += 1
+         self.pool.runAsync(_renderTile, tile_id + (self.source_memory,),
+                            self.callback(tile_id))
+
+   def callback(self, tile_id):
+      """Return a pool callback that queues a finished render"""
+      def renderFinished(result):
+         self.finished.append((tile_id, result))
+         os.write(self.wakeup_fd, "x")
+      return renderFinished
+
+   def deliverFinished(self):
+      """Store finished tiles and answer the requests waiting on them"""
+      while len(self.finished) > 0:
+         (tile_id, (data, error)) = self.finished.popleft()
+         self.running -= 1
+         pending = self.pending.pop(tile_id)
+         if error == None:
+            (layer_number, column, row) = pending.key
+            pending.tiled_image.storeTile(data, column, row, layer_number)
+            self.render_count += 1
+            if data == EMPTY_TILE:
+               data = pending.tiled_image.emptyTileBytes()
+         else:
+            pending.tiled_image.instrumentation.message(
+               "failed to render %s %s: %s" % (tile_id + (error,)))
+         for callback in pending.callbacks:
+            callback(data)
+      self.startRenders()
+
+   def close(self):
+      """Shut down the worker pool"""
+      self.pool.close()
+      self.wakeup.close()
+      os.close(self.wakeup_fd)
@@ -0,0 +1,222 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+
+import sys, copy, resource
+import Image
+from geometry import *
+from pyramid import Pyramid
+from source_bands import SourceBands
+
+MEGABYTE = 1024 * 1024
+
+# Smallest decoded-tile cache a process is given
+MIN_TILE_CACHE = 4 * MEGABYTE
+
+# Tiles a process works on at once: sections, resized and padded tiles
+WORKING_TILES = 16
+
+# Rows of finer tiles the NumPy downsampler joins into a band, and the
+# bytes it uses per band pixel: uint8 pixels, then float32 copies
+DOWNSAMPLER_ROWS = 4
+DOWNSAMPLER_PIXEL_BYTES = 3 * 9
+
+# Rows of tiles of each layer a layer cascade keeps in memory
+CASCADE_ROWS = 4
+
+def decodedPixelBytes(mode):
+   """Return the bytes PIL uses for each pixel of an image in mode"""
+   if mode in ("1", "L", "P"):
+      return 1
+   if mode.startswith("I;16"):
+      return 2
+   return 4
+
+def peakResidentBytes():
+   """Return peak resident memory of (this process, largest ended child)"""
+   # ru_maxrss is in kilobytes, except on Mac OS X where it is in bytes
+   scale = 1024
+   if sys.platform == "darwin":
+      scale = 1
+   return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+           resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+def residentBytes():
+   """Return the resident memory of this process, or its peak if unknown"""
+   try:
+      statm_file = open("/proc/self/statm", "r")
+      pages = int(statm_file.read().split()[1])
+      statm_file.close()
+      return pages * resource.getpagesize()
+   except (IOError, IndexError, ValueError):
+      return peakResidentBytes()[0]
+
+
+class MemoryBudget:
+   """Fits the memory a tiling run uses under a budget.
+
+   fitOptions() estimates what each process of a run holds: the decoded
+   source or a band of it, its decoded-tile cache, the tiles it is
+   working on, and NumPy downsampler bands. It then chooses options that
+   fit. It first checks that one process can afford the NumPy
+   downsampler, if the options choose it; the PIL downsampler makes
+   different pixels, so it is not switched to. Next it takes as many
+   workers as fit with the least source and cache each. Finally it gives
+   what is left to taller source bands and then to larger caches. Every
+   process is assumed to start the size this one is when the budget is
+   made.
+
+   self.max_memory - bytes the whole run may use
+   self.process_memory - bytes a process uses before it does any work
+   self.instrumentation - Instrumentation the plan and report are sent to
+   """
+
+   def __init__(self, max_memory, instrumentation):
+      self.max_memory = max_memory
+      self.instrumentation = instrumentation
+      self.process_memory = residentBytes()
+      self.estimate = 0
+      self.workers = 1
+
+   def fitOptions(self, options, source_path, pool_workers = None,
+                  whole_sources = 0):
+      """Return a copy of options that fits the budget when tiling a source.
+
+      pool_workers is the number of workers of a pool the caller already
+      has, or None if the run may choose its own. whole_sources is the
+      number of whole decoded sources this process holds before tiling,
+      such as when finding changes to retile. Raises ValueError if even
+      one process can not afford the NumPy downsampler's bands.
+      """
+      options = copy.copy(options)
+      source = Image.open(source_path)
+      (width, height) = source.size
+      pixel_bytes = decodedPixelBytes(source.mode)
+      pyramid = Pyramid(Dimensions(width, height))
+      tile_size = pyramid.tile_size
+      source_layer = max(pyramid.layer_count - 2, 0)
+
+      # The source is decoded whole, or in bands of at least a tile row
+      source_bytes = width * height * pixel_bytes
+      row_bytes = width * pixel_bytes
+      source_bands = SourceBands(source_path)
+      streamable = source_bands.isStreamable()
+      if streamable:
+         least_source = row_bytes * pyramid.tileExtent(source_layer).height
+      else:
+         least_source = source_bytes
+
+      tile_bytes = tile_size.width * tile_size.height * 4
+      columns = pyramid.tileGridSize(source_layer).width
+      self.work_bytes = WORKING_TILES * tile_bytes
+      self.downsampler_bytes = 0
+      if options.downsampler == "numpy":
+         self.downsampler_bytes = (DOWNSAMPLER_ROWS * tile_size.height * columns *
+                                   tile_size.width * DOWNSAMPLER_PIXEL_BYTES)
+      self.cascade_bytes = 0
+      if options.cascade:
+         # Rows held in coarser layers add up to about twice the source layer's
+         self.cascade_bytes = CASCADE_ROWS * columns * tile_bytes * 3
+
+      if options.downsampler == "numpy":
+         least_run = self.estimateRun(options, 1, least_source, MIN_TILE_CACHE)
+         if least_run > self.max_memory:
+            raise ValueError(
+               "a memory budget of %.0f MB is too little for the NumPy downsampler, "
+               "which needs about %.0f MB: raise it or use the PIL downsampler" % (
+                  self.max_memory / float(MEGABYTE), least_run / float(MEGABYTE)))
+
+      if pool_workers != None:
+         workers = pool_workers
+      else:
+         workers = max(options.workers, 1)
+         while (workers > 1 and self.estimateRun(options, workers, least_source,
+                                                 MIN_TILE_CACHE) > self.max_memory):
+            workers -= 1
+         options.workers = workers
+      self.workers = workers
+
+      # What is left goes to taller source bands, then to larger caches
+      spare = self.max_memory - self.estimateRun(options, workers, least_source,
+                                                 MIN_TILE_CACHE)
+      if spare < 0:
+         self.instrumentation.message(
+            "Memory budget: %.0f MB is too little, the run needs about %.0f MB" % (
+               self.max_memory / float(MEGABYTE),
+               (self.max_memory - spare) / float(MEGABYTE)))
+         spare = 0
+      (source_holders, cache_holders) = self.holderCounts(options, workers)
+      source_part = min(source_bytes, least_source + spare / source_holders)
+      spare -= (source_part - least_source) * source_holders
+      options.tile_cache_memory = min(options.tile_cache_memory,
+                                      MIN_TILE_CACHE + spare / cache_holders)
+
+      if streamable and source_part < source_bytes:
+         # band_memory is counted in the row size SourceBands reports
+         band_memory = int(source_part * source_bands.bytesPerRow() / float(row_bytes))
+         if options.band_memory != None:
+            band_memory = min(band_memory, options.band_memory)
+         options.band_memory = band_memory
+      self.estimate = self.estimateRun(options, workers, source_part,
+                                       options.tile_cache_memory)
+      compare_bytes = self.process_memory + whole_sources * source_bytes
+      if whole_sources > 0 and compare_bytes > self.max_memory:
+         self.instrumentation.message(
+            "Memory budget: comparing sources needs about %.0f MB" % (
+               compare_bytes / float(MEGABYTE)))
+      self.estimate = max(self.estimate, compare_bytes)
+
+      if options.band_memory == None:
+         source_plan = "decoded whole"
+      else:
+         source_plan = "in %.0f MB bands" % (options.band_memory / float(MEGABYTE))
+      self.instrumentation.event("memory_budget", budget = self.max_memory,
+                                 workers = workers, source = source_plan,
+                                 tile_cache = options.tile_cache_memory,
+                                 downsampler = options.downsampler)
+      return options
+
+   def holderCounts(self, options, workers):
+      """Return (processes decoding the source, processes with a cache)"""
+      if workers <= 1:
+         return (1, 1)
+      if options.cascade:
+         # A cascade cuts the second finest layer in this process
+         return (workers + 1, workers + 1)
+      return (workers, workers + 1)
+
+   def estimateRun(self, options, workers, source_part, cache):
+      """Return the bytes a run is expected to use at its peak"""
+      process = self.process_memory + cache + self.work_bytes + self.downsampler_bytes
+      if workers <= 1:
+         return process + source_part + self.cascade_bytes
+      parent = self.process_memory + cache
+      if options.cascade:
+         parent = process + source_part + self.cascade_bytes
+      return parent + workers * (process + source_part)
+
+   def report(self):
+      """Send the peak resident memory of the run against the budget.
+
+      Workers are only counted once they have ended.
+      """
+      (own_peak, worker_peak) = peakResidentBytes()
+      if self.workers > 1:
+         total = own_peak + self.workers * worker_peak
+      else:
+         total = own_peak
+      self.instrumentation.event("memory_peak", own_peak = own_peak,
+                                 worker_peak = worker_peak, total = total,
+                                 estimate = self.estimate, budget = self.max_memory)
@@ -0,0 +1,121 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+
+# An occupancy map marks the tiles of a tiled image that are nothing but
+# the background color, which are not stored:
+#
+#   header  - "TILEMASK", format version and layer grid sizes (see
+#             grid_index.py)
+#   bitmaps - a bit per tile of each layer, by row, then column, low bit
+#             first; each layer's bitmap starts on a new byte
+#
+# A set bit marks a background tile; readers make it from the background
+# color given in contents.xml.
+
+import os, os.path
+from grid_index import pyramidGridSizes, packGridHeader, readGridHeader
+
+OCCUPANCY_FILE_NAME = "occupancy.map"
+OCCUPANCY_MAGIC = "TILEMASK"
+OCCUPANCY_VERSION = 1
+
+# Stands in for the encoded bytes of a background tile that is not stored
+EMPTY_TILE = ""
+
+class OccupancyMap:
+   """A bitmap of the background tiles of each layer of a tiled image.
+
+   The map is written to its file by save(), through a temporary file
+   renamed into place. Background tiles found after the last save are
+   just generated again if tiling is interrupted and resumed.
+
+   self.grid_sizes - [(columns, rows)] of each layer
+   self.bitmaps - bytearray of each layer's bits
+   """
+
+   def __init__(self, path, pyramid = None):
+      """Read a map, or start an empty one for pyramid if there is none"""
+      self.path = path
+      self.changed = False
+      if os.path.exists(path):
+         self.load()
+         return
+      self.grid_sizes = pyramidGridSizes(pyramid)
+      self.bitmaps = [bytearray((columns * rows + 7) / 8)
+                      for (columns, rows) in self.grid_sizes]
+
+   def load(self):
+      """Read the layer grid sizes and bitmaps"""
+      map_file = open(self.path, "rb")
+      self.grid_sizes = readGridHeader(map_file, OCCUPANCY_MAGIC,
+                                       OCCUPANCY_VERSION, "occupancy map",
+                                       self.path)
+      data = map_file.read()
+      map_file.close()
+      position = 0
+      self.bitmaps = []
+      for (columns, rows) in self.grid_sizes:
+         length = (columns * rows + 7) / 8
+         self.bitmaps.append(bytearray(data[position:position + length]))
+         position += length
+
+   def bitPosition(self, key):
+      """Return (layer_number, byte, bit mask) of a tile's bit"""
+      (layer_number, column, row) = [int(part) for part in key]
+      (columns, rows) = self.grid_sizes[layer_number]
+      entry = row * columns + column
+      return (layer_number, entry >> 3, 1 << (entry & 7))
+
+   def isEmpty(self, key):
+      """Return True if a tile is only background"""
+      (layer_number, byte, mask) = self.bitPosition(key)
+      return (self.bitmaps[layer_number][byte] & mask) != 0
+
+   def markEmpty(self, keys):
+      """Mark (layer_number, column, row) tiles as only background"""
+      for key in keys:
+         (layer_number, byte, mask) = self.bitPosition(key)
+         self.bitmaps[layer_number][byte] |= mask
+         self.changed = True
+
+   def clear(self, keys):
+      """Mark tiles as not known to be background (stored, or not made)"""
+      for key in keys:
+         (layer_number, byte, mask) = self.bitPosition(key)
+         if self.bitmaps[layer_number][byte] & mask:
+            self.bitmaps[layer_number][byte] &= ~mask
+            self.changed = True
+
+   def emptyCount(self):
+      """Return the number of background tiles in all layers"""
+      count = 0
+      for bitmap in self.bitmaps:
+         count += sum([bin(byte).count("1") for byte in bitmap])
+      return count
+
+   def save(self):
+      """Write the map, if it changed since it was read or last saved"""
+      if not self.changed:
+         return
+      temporary_path = "%s.%i.tmp" % (self.path, os.getpid())
+      out = open(temporary_path, "wb")
+      out.write(packGridHeader(OCCUPANCY_MAGIC, OCCUPANCY_VERSION,
+                               self.grid_sizes))
+      for bitmap in self.bitmaps:
+         out.write(bitmap)
+      out.close()
+      os.rename(temporary_path, self.path)
+      self.changed = False
@@ -16,8 +16,17 @@
 from math import *
 from geometry import Dimensions
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class Pyramid:
-    """Coordinate model of a tiled image."""
+    """Coordinate model of a tiled image.
+    
+    The scale, tile extent and grid size of every layer are computed once,
+    when the pyramid is made, and looked up after that.
+    """
 
     def __init__(self, image_size, tile_size=Dimensions(256, 256), 
                  resolution_multiplier=sqrt(2)):
@@ -25,53 +34,140 @@ class Pyramid:
         self.image_size = image_size
         self.tile_size = tile_size
         self.resolution_multiplier = resolution_multiplier
+        self.log_multiplier = log(resolution_multiplier)
         self.initializeLayerCount()
+        self.initializeLayerTables()
         
     def initializeLayerCount(self):
         """Computes the number of layers in an image pyramid"""
         image_size = self.image_size
         tile_size = self.tile_size
-        log_multiplier = log(self.resolution_multiplier)
+        log_multiplier = self.log_multiplier
         width_layers = (log(image_size.width) - log(tile_size.width)) / log_multiplier
         height_layers = (log(image_size.height) - log(tile_size.height)) / log_multiplier
         self.layer_count = int(ceil(max(width_layers, height_layers)) + 1)
         
-    def scaleForLayer(self, layer_number):
-        """Returns the image scale at the specified layer"""
+    def initializeLayerTables(self):
+        """Computes the scale, tile spans, extent and grid size of each layer.
+        
+        Tables are keyed by layer number. Layers outside the pyramid are
+        not in them, and are computed when asked for.
+        """
+        self.layer_scales = {}
+        self.tile_spans = {}
+        self.tile_extents = {}
+        self.grid_sizes = {}
+        for layer_number in xrange(self.layer_count):
+            self.layer_scales[layer_number] = self.computeScale(layer_number)
+            self.tile_spans[layer_number] = self.computeTileSpan(layer_number)
+            self.tile_extents[layer_number] = self.computeTileExtent(layer_number)
+            self.grid_sizes[layer_number] = self.computeGridSize(layer_number)
+        
+    def computeScale(self, layer_number):
+        """Computes the image scale at a layer"""
         layer_index = self.layer_count - layer_number - 1
         return 1 / self.resolution_multiplier ** layer_index
         
+    def computeTileSpan(self, layer_number):
+        """Computes the exact (width, height) of image a tile spans at a layer"""
+        layer_index = self.layer_count - layer_number - 1
+        multiple = self.resolution_multiplier ** layer_index
+        return (self.tile_size.width * multiple, self.tile_size.height * multiple)
+        
+    def computeTileExtent(self, layer_number):
+        """Computes the whole pixels of image covered by a tile at a layer"""
+        (width, height) = self.computeTileSpan(layer_number)
+        return Dimensions(int(width), int(height))
+        
+    def computeGridSize(self, layer_number):
+        """Computes the number of tile (columns, rows) in a layer"""
+        image_size = self.image_size
+        extent = self.tileExtent(layer_number)
+        return Dimensions(int(ceil(float(image_size.width)  / extent.width)),
+                          int(ceil(float(image_size.height) / extent.height)) )
+        
+    def scaleForLayer(self, layer_number):
+        """Returns the image scale at the specified layer"""
+        return (self.layer_scales.get(layer_number) or 
+                self.computeScale(layer_number))
+        
     def layerForScale(self, scale):
         """Returns the layer number at or just above the specified scale"""
         last_layer = self.layer_count - 1;
-        level = log(scale) / -log(self.resolution_multiplier)
+        level = log(scale) / -self.log_multiplier
         return max(last_layer - floor(level + 0.0000001), 0)
         
     def tileExtent(self, layer_number):
         """Returns the (width, height) of the image area covered by a tile"""
-        tile_size = self.tile_size
-        layer_index = self.layer_count - layer_number - 1
-        scale = self.resolution_multiplier ** layer_index
-        return Dimensions(int(tile_size.width * scale), 
-                          int(tile_size.height * scale))
+        return (self.tile_extents.get(layer_number) or 
+                self.computeTileExtent(layer_number))
         
     def tileGridSize(self, layer_number):
         """Returns the number of tile (columns, rows) in a layer"""
-        image_size = self.image_size
-        extent = self.tileExtent(layer_number)
-        return Dimensions(int(ceil(float(image_size.width)  / extent.width)),
-                          int(ceil(float(image_size.height) / extent.height)) )
+        return (self.grid_sizes.get(layer_number) or 
+                self.computeGridSize(layer_number))
                  
     def tileColumn(self, x, layer_number):
         """Returns the tile column corresponding to x on layer_number"""
-        tile_width = self.tile_size.width
-        layer_index = self.layer_count - layer_number - 1
-        extent = tile_width * (self.resolution_multiplier ** layer_index)
-        return int(floor(x / extent))
+        span = self.tile_spans.get(layer_number) or self.computeTileSpan(layer_number)
+        return int(floor(x / span[0]))
         
     def tileRow(self, y, layer_number):
         """Returns the tile row corresponding to y on layer layer_number"""
-        tile_height = self.tile_size.height
-        layer_index = self.layer_count - layer_number - 1
-        extent = tile_height * (self.resolution_multiplier ** layer_index)
-        return int(floor(y / extent))
\ No newline at end of file
+        span = self.tile_spans.get(layer_number) or self.computeTileSpan(layer_number)
+        return int(floor(y / span[1]))
+        
+    def tileRange(self, rectangle, layer_number):
+        """Returns the range of tiles of a layer that cover a rectangle.
+        
+        See tileRanges().
+        """
+        image_size = self.image_size
+        extent = self.tileExtent(layer_number)
+        left   = max(float(rectangle.left), 0.0)
+        top    = max(float(rectangle.top), 0.0)
+        right  = min(float(rectangle.right), float(image_size.width))
+        bottom = min(float(rectangle.bottom), float(image_size.height))
+        if right <= left or bottom <= top:
+            return (0, 0, -1, -1)
+        return (int(floor(left / extent.width)), int(floor(top / extent.height)),
+                int(ceil(right / extent.width)) - 1, 
+                int(ceil(bottom / extent.height)) - 1)
+        
+    def tileRanges(self, rectangles, layer_numbers):
+        """Returns the ranges of tiles that cover rectangles on many layers.
+        
+        Rectangles are in image coordinates, with the right and bottom
+        edges exclusive. Returns a list for each layer number, holding a
+        (left_column, top_row, right_column, bottom_row) range for each
+        rectangle: the tiles whose pixels the rectangle overlaps, with
+        the last column and row included. A rectangle that overlaps no
+        pixels of the image gives (0, 0, -1, -1).
+        
+        With NumPy, every range is computed in one set of array operations.
+        """
+        if numpy == None:
+            return [[self.tileRange(rectangle, layer_number) 
+                     for rectangle in rectangles]
+                    for layer_number in layer_numbers]
+        
+        # Rectangles are (left, top, right, bottom) tuples
+        bounds = numpy.array(rectangles, numpy.float64).reshape(1, -1, 4)
+        # Clipped to the image, so the last tiles' padding is not covered
+        bounds[:, :, :2] = numpy.maximum(bounds[:, :, :2], 0.0)
+        bounds[:, :, 2:] = numpy.minimum(bounds[:, :, 2:], 
+                                         (self.image_size.width, self.image_size.height))
+        empty = ((bounds[:, :, 2] <= bounds[:, :, 0]) | 
+                 (bounds[:, :, 3] <= bounds[:, :, 1]))
+        extents = numpy.array([(self.tileExtent(layer_number).width,
+                                self.tileExtent(layer_number).height)
+                               for layer_number in layer_numbers], numpy.float64)
+        extents = extents.reshape(-1, 1, 2)
+        
+        # [layer, rectangle, (column, row)] of the first and last tiles
+        firsts = numpy.floor(bounds[:, :, :2] / extents)
+        lasts = numpy.ceil(bounds[:, :, 2:] / extents) - 1
+        ranges = numpy.concatenate((firsts, lasts), 2).astype(numpy.int64)
+        ranges[numpy.broadcast_to(empty, ranges.shape[:2])] = (0, 0, -1, -1)
+        return [[tuple(tile_range) for tile_range in layer_ranges]
+                for layer_ranges in ranges.tolist()]
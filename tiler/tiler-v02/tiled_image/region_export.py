@@ -0,0 +1,288 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+
+# Exports an area of a tiled image at any scale without holding the whole
+# result in memory: the result is rendered and written a strip of rows at
+# a time. Each output row maps to an exact (fractional) row of the layer
+# read, so strips join without seams whatever their height.
+
+import os, os.path, struct, zlib, mmap, tempfile
+import Image
+from math import *
+from geometry import *
+from change_detector import pixelBytes
+
+# Layer pixels read beyond a strip, for the resampling filter
+BAND_MARGIN = 3
+
+class PNGStripWriter:
+   """Writes an RGB PNG a strip at a time, deflating rows as they come"""
+
+   def __init__(self, path, size):
+      (self.width, self.height) = size
+      self.out = open(path, "wb")
+      self.out.write("\x89PNG\r\n\x1a\n")
+      self.writeChunk("IHDR", struct.pack(">IIBBBBB", self.width, self.height,
+                                          8, 2, 0, 0, 0))
+      self.compressor = zlib.compressobj(6)
+
+   def writeChunk(self, chunk_type, data):
+      self.out.write(struct.pack(">I", len(data)))
+      self.out.write(chunk_type)
+      self.out.write(data)
+      crc = zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF
+      self.out.write(struct.pack(">I", crc))
+
+   def writeStrip(self, strip):
+      """Append a strip of rows, as wide as the image"""
+      data = pixelBytes(strip)
+      row_bytes = self.width * 3
+      rows = ["\x00" + data[start:start + row_bytes]
+              for start in xrange(0, len(data), row_bytes)]
+      compressed = self.compressor.compress("".join(rows))
+      if len(compressed) > 0:
+         self.writeChunk("IDAT", compressed)
+
+   def close(self):
+      self.writeChunk("IDAT", self.compressor.flush())
+      self.writeChunk("IEND", "")
+      self.out.close()
+
+
+class TIFFStripWriter:
+   """Writes an uncompressed RGB TIFF with one TIFF strip per strip written.
+
+   Strips are written as they come and the directory, which lists where
+   they are, last. Every strip but the last must have the same height.
+   """
+
+   def __init__(self, path, size):
+      (self.width, self.height) = size
+      if self.width * self.height * 3 >= 2 ** 32 - 4096:
+         raise ValueError("%i x %i is too large for a TIFF file" % size)
+      self.out = open(path, "wb")
+      self.out.write(struct.pack("<2sHI", "II", 42, 0))
+      self.strip_offsets = []
+      self.strip_sizes = []
+      self.rows_per_strip = None
+
+   def writeStrip(self, strip):
+      """Append a strip of rows, as wide as the image"""
+      if self.rows_per_strip == None:
+         self.rows_per_strip = strip.size[1]
+      data = pixelBytes(strip)
+      self.strip_offsets.append(self.out.tell())
+      self.strip_sizes.append(len(data))
+      self.out.write(data)
+
+   def close(self):
+      # Arrays of more than one value go after the directory entries
+      strip_count = len(self.strip_offsets)
+      entry_count = 10
+      directory_offset = self.out.tell() + self.out.tell() % 2
+      values_offset = directory_offset + 2 + entry_count * 12 + 4
+      bits_offset = values_offset
+      offsets_offset = bits_offset + 6
+      sizes_offset = offsets_offset + 4 * strip_count
+      if strip_count == 1:
+         offsets_offset = self.strip_offsets[0]
+         sizes_offset = self.strip_sizes[0]
+
+      entries = [(256, 4, 1, self.width),
+                 (257, 4, 1, self.height),
+                 (258, 3, 3, bits_offset),
+                 (259, 3, 1, 1),
+                 (262, 3, 1, 2),
+                 (273, 4, strip_count, offsets_offset),
+                 (277, 3, 1, 3),
+                 (278, 4, 1, self.rows_per_strip or self.height),
+                 (279, 4, strip_count, sizes_offset),
+                 (284, 3, 1, 1)]
+      self.out.write("\x00" * (directory_offset - self.out.tell()))
+      self.out.write(struct.pack("<H", entry_count))
+      for (tag, value_type, count, value) in entries:
+         if value_type == 3 and count == 1:
+            self.out.write(struct.pack("<HHIHH", tag, value_type, count, value, 0))
+         else:
+            self.out.write(struct.pack("<HHII", tag, value_type, count, value))
+      self.out.write(struct.pack("<I", 0))
+      self.out.write(struct.pack("<HHH", 8, 8, 8))
+      if strip_count > 1:
+         self.out.write(struct.pack("<%iI" % strip_count, *self.strip_offsets))
+         self.out.write(struct.pack("<%iI" % strip_count, *self.strip_sizes))
+      self.out.seek(4)
+      self.out.write(struct.pack("<I", directory_offset))
+      self.out.close()
+
+
+class JPEGStripWriter:
+   """Writes a JPEG from strips collected in a scratch file.
+
+   PIL can only encode a JPEG from a whole image, so strips are written
+   to an unnamed scratch file beside the output, which is then mapped
+   into memory and encoded. The pixels are paged in and out by the
+   operating system rather than held in memory.
+   """
+
+   def __init__(self, path, size, quality = 90):
+      self.path = path
+      self.size = size
+      self.quality = quality
+      self.scratch = tempfile.TemporaryFile(
+         dir = os.path.dirname(os.path.abspath(path)))
+
+   def writeStrip(self, strip):
+      """Append a strip of rows, as wide as the image"""
+      self.scratch.write(pixelBytes(strip.convert("RGBX")))
+
+   def close(self):
+      self.scratch.flush()
+      pixel_map = mmap.mmap(self.scratch.fileno(), 0, access = mmap.ACCESS_READ)
+      image = Image.frombuffer("RGBX", self.size, pixel_map, "raw", "RGBX", 0, 1)
+      image.save(self.path, "JPEG", quality = self.quality)
+      del image
+      pixel_map.close()
+      self.scratch.close()
+
+
+STRIP_WRITERS = {".png": PNGStripWriter, ".tif": TIFFStripWriter,
+                 ".tiff": TIFFStripWriter, ".jpg": JPEGStripWriter,
+                 ".jpeg": JPEGStripWriter}
+
+def stripWriter(path, size):
+   """Return a strip writer for an output path, by its extension"""
+   (name, ext) = os.path.splitext(path)
+   writer_class = STRIP_WRITERS.get(ext.lower())
+   if writer_class == None:
+      raise ValueError("can not export to %s: use .png, .tif or .jpg" % path)
+   return writer_class(path, size)
+
+
+class RegionExporter:
+   """Renders an area of a tiled image at a scale, a strip at a time.
+
+   Layer pixels are read from the layer Pyramid.layerForScale() picks
+   (the finest layer when enlarging), reduced while decoding where that
+   layer is twice the scale or more, so they are at most twice as dense
+   as output pixels. Each strip is resampled from a band of layer pixels
+   a little taller than it. Tiles read for one strip are kept for the
+   next, which usually shares them.
+   """
+
+   def __init__(self, tiled_image, request_area, scale, layer_number = None):
+      self.tiled_image = tiled_image
+      self.pyramid = tiled_image.pyramid
+      self.request_area = request_area
+      self.scale = scale
+      if layer_number == None:
+         layer_number = min(self.pyramid.layerForScale(scale),
+                            self.pyramid.layer_count - 1)
+      self.layer_number = int(layer_number)
+      self.reduction = tiled_image.decodeReduction(scale, self.layer_number)
+      self.layer_scale = self.pyramid.scaleForLayer(self.layer_number) / self.reduction
+      self.ratio = self.layer_scale / scale
+      self.size = (
+         int(ceil((request_area.right  - request_area.left) * scale)),
+         int(ceil((request_area.bottom - request_area.top ) * scale)))
+      self.band_tiles = {}
+
+   def export(self, path, strip_height = 256):
+      """Write the area to path as PNG, TIFF or JPEG, by its extension"""
+      writer = stripWriter(path, self.size)
+      for top in xrange(0, self.size[1], strip_height):
+         bottom = min(top + strip_height, self.size[1])
+         writer.writeStrip(self.renderStrip(top, bottom))
+      writer.close()
+
+   def renderStrip(self, top, bottom):
+      """Return output rows top up to (not including) bottom"""
+      request_area = self.request_area
+      layer_scale = self.layer_scale
+      (width, height) = self.size
+
+      # Exact layer pixel coordinates of the strip's edges
+      left_edge   = request_area.left * layer_scale
+      right_edge  = left_edge + width * self.ratio
+      top_edge    = request_area.top * layer_scale + top * self.ratio
+      bottom_edge = request_area.top * layer_scale + bottom * self.ratio
+
+      # Shrinking, output pixels beyond the strip are also rendered, for
+      # the antialiasing filter, and so layer pixels beyond those
+      if self.ratio > 1.0:
+         filter_margin = BAND_MARGIN
+      else:
+         filter_margin = 0
+      margin = int(ceil(filter_margin * self.ratio)) + BAND_MARGIN
+      (layer_width, layer_height) = self.layerPixelSize()
+      band_left   = max(int(floor(left_edge))   - margin, 0)
+      band_top    = max(int(floor(top_edge))    - margin, 0)
+      band_right  = min(int(ceil(right_edge))   + margin, layer_width)
+      band_bottom = min(int(ceil(bottom_edge))  + margin, layer_height)
+      band = self.readBand(band_left, band_top, band_right, band_bottom)
+
+      # At a layer's own scale, on its pixel grid, the strip is just copied
+      if (self.ratio == 1.0 and left_edge == floor(left_edge) and
+          top_edge == floor(top_edge)):
+         crop_left = int(left_edge) - band_left
+         crop_top = int(top_edge) - band_top
+         return band.crop((crop_left, crop_top, crop_left + width,
+                           crop_top + bottom - top))
+
+      if self.ratio <= 1.0:
+         # The same ratio for every strip, so rows are placed identically
+         affine = (self.ratio, 0, left_edge - band_left,
+                   0, self.ratio, top_edge - band_top)
+         return band.transform((width, bottom - top), Image.AFFINE, affine,
+                               Image.BICUBIC)
+
+      # Shrinking, the strip and its margin are placed at a whole multiple
+      # of the output size, which only magnifies the band, and then filtered
+      # down by that multiple. Every strip's pixels fall on the same grid.
+      multiple = int(ceil(self.ratio))
+      step = self.ratio / multiple
+      affine = (step, 0, left_edge - band_left - filter_margin * self.ratio,
+                0, step, top_edge - band_top - filter_margin * self.ratio)
+      margin_size = (width + 2 * filter_margin, bottom - top + 2 * filter_margin)
+      fine = band.transform((margin_size[0] * multiple, margin_size[1] * multiple),
+                            Image.AFFINE, affine, Image.BICUBIC)
+      strip = fine.resize(margin_size, Image.ANTIALIAS)
+      return strip.crop((filter_margin, filter_margin,
+                         filter_margin + width, filter_margin + bottom - top))
+
+   def layerPixelSize(self):
+      """Return the (width, height) of the layer's tile grid in pixels"""
+      grid_size = self.pyramid.tileGridSize(self.layer_number)
+      tile_size = self.pyramid.tile_size
+      return (grid_size.width  * tile_size.width  / self.reduction,
+              grid_size.height * tile_size.height / self.reduction)
+
+   def readBand(self, left, top, right, bottom):
+      """Return the layer's pixels in a box, pasted from its tiles"""
+      tile_width  = self.pyramid.tile_size.width  / self.reduction
+      tile_height = self.pyramid.tile_size.height / self.reduction
+      band = Image.new("RGB", (right - left, bottom - top),
+                       self.tiled_image.background)
+      band_tiles = {}
+      for row in xrange(top / tile_height, (bottom - 1) / tile_height + 1):
+         for column in xrange(left / tile_width, (right - 1) / tile_width + 1):
+            tile = self.band_tiles.get((column, row))
+            if tile == None:
+               tile = self.tiled_image.getTileImage(column, row, self.layer_number,
+                                                    self.reduction)
+            band_tiles[(column, row)] = tile
+            band.paste(tile, (column * tile_width - left, row * tile_height - top))
+      self.band_tiles = band_tiles
+      return band
@@ -14,13 +14,19 @@
 # Author: Jonathan A, Smith
 
 import Image
-import os.path
+import os.path, time
 from math import *
 from geometry import *
 from tiler import Tiler
+from downsampler import LayerDownsampler
 
 class SampleTiler(Tiler):
-   """Tiles image layers by resampling already existing tiled image layers."""
+   """Tiles image layers by resampling already existing tiled image layers.
+   
+   By default each tile is resampled on its own with PIL. When
+   tiled_image.options.downsampler is "numpy", whole rows of tiles are
+   resampled at once by a LayerDownsampler.
+   """
    
    def __init__(self, tiled_image):
       from tiled_image import TiledImage
@@ -29,42 +35,121 @@ class SampleTiler(Tiler):
       
       self.tile_path  = tiled_image.image_path
       self.background = tiled_image.background
+      self.pyramid = tiled_image.pyramid
+      self.downsampler = None
+      
+   def __getstate__(self):
+      """Pickle state sent to worker processes, without filter tables"""
+      state = Tiler.__getstate__(self)
+      state["downsampler"] = None
+      return state
+      
+   def beginLayer(self, layer_number):
+      """Prepare to generate a layer, counting decodes of the layer below"""
+      Tiler.beginLayer(self, layer_number)
+      self.tiled_image.decode_counts = {}
       
-   def tileLayer(self, layer_number):
-      """Generate tiles for a specified layer"""
-      self.pyramid = self.tiled_image.pyramid
+   def endLayer(self, layer_number):
+      """Finish a layer, with how often tiles of the layer below were decoded"""
+      decode_counts = self.tiled_image.decode_counts
+      self.tiled_image.decode_counts = None
+      fields = {}
+      if decode_counts:
+         decodes = sum(decode_counts.values())
+         repeated = [count for count in decode_counts.values() if count > 1]
+         fields = {"finer_decoded": len(decode_counts),
+                   "finer_redecoded": len(repeated),
+                   "redecodes": decodes - len(decode_counts)}
+      self.tiled_image.instrumentation.endLayer(layer_number, **fields)
+      
+   def finerRows(self, row, layer_number):
+      """Return the first and last rows of the layer below read for a row"""
+      if self.usesDownsampler():
+         return self.getDownsampler(layer_number).finerRows(row)
       pyramid = self.pyramid
-      scale = pyramid.scaleForLayer(layer_number)
-      grid_size = pyramid.tileGridSize(layer_number)
-      print "generating layer%04i: %i x %i at scale = %1.5f" % (
-               layer_number, grid_size.width, grid_size.height, scale)
-      for row in xrange(grid_size.height):
-         for column in xrange(grid_size.width):
-               self.generateTile(column, row, layer_number)
-                                 
+      area = self.tileSourceRectangle(0, row, layer_number)
+      finer_row_count = pyramid.tileGridSize(layer_number + 1).height
+      return (pyramid.tileRow(area.top, layer_number + 1), 
+              min(pyramid.tileRow(area.bottom, layer_number + 1), 
+                  finer_row_count - 1))
+      
+   def usesDownsampler(self):
+      """Return True if rows are resampled with the NumPy downsampler"""
+      return self.tiled_image.options.downsampler == "numpy"
+      
+   def getDownsampler(self, layer_number):
+      """Return a LayerDownsampler for a layer"""
+      if self.downsampler == None or self.downsampler.layer_number != layer_number:
+         self.downsampler = LayerDownsampler(self.tiled_image, layer_number)
+      return self.downsampler
+      
+   def tileRows(self, top_row, bottom_row, layer_number):
+      """Generate tiles in rows top_row up to (not including) bottom_row"""
+      if not self.usesDownsampler():
+         Tiler.tileRows(self, top_row, bottom_row, layer_number)
+         return
+      positions = self.tilePositions(top_row, bottom_row, layer_number)
+      self.runTasks("generateRow", self.rowTasks(positions, layer_number))
+      
+   def retileTiles(self, positions, layer_number):
+      """Generate the tiles at (column, row) positions of a layer"""
+      if not self.usesDownsampler():
+         Tiler.retileTiles(self, positions, layer_number)
+         return
+      self.runTasks("generateRow", self.rowTasks(positions, layer_number))
+      
+   def rowTasks(self, positions, layer_number):
+      """Return (row, layer_number, columns) tasks that cover positions"""
+      columns = {}
+      for (column, row) in positions:
+         columns.setdefault(row, []).append(column)
+      return [(row, layer_number, sorted(columns[row])) 
+              for row in sorted(columns.keys())]
+      
+   def generateRow(self, row, layer_number, columns):
+      """Resample a whole row with the NumPy downsampler, writing columns"""
+      tiled_image = self.tiled_image
+      for (column, tile) in self.getDownsampler(layer_number).tileRow(row):
+         if column in columns:
+            tiled_image.writeTile(tile, column, row, layer_number)
+      
    def generateTile(self, column, row, layer_number):
       """Generate and write an image tile"""
       pyramid = self.pyramid
       tile_size = pyramid.tile_size
       tiled_image = self.tiled_image
       
-      file_path = self.tiled_image.tileFilePath(column, row, layer_number)
-      if os.path.exists(file_path): return
-      
       source_rectangle = self.tileSourceRectangle(column, row, layer_number) 
-      
       scale = pyramid.scaleForLayer(layer_number)
-      width  = int(ceil(scale * (source_rectangle.right  - source_rectangle.left)))
-      height = int(ceil(scale * (source_rectangle.bottom - source_rectangle.top )))
       
-      name = os.path.basename(file_path)
-      print "\tl%s %s: %s x %s" % (layer_number, name, width, height)
+      # A tile sampled only from background tiles is background
+      if self.isBackgroundArea(source_rectangle, layer_number + 1):
+         tiled_image.writeTile(tiled_image.emptyTile(), column, row, layer_number)
+         return
       
       scaled_tile = tiled_image.getScaledImage(source_rectangle, scale, 
                                                layer_number + 1)
+      start = time.time()
       tile = Image.new("RGB", (tile_size.width, tile_size.height), self.background)
       tile.paste(scaled_tile, (0, 0))
-      tile.save(file_path, "jpeg")
+      tiled_image.instrumentation.timeStage("paste", start)
+      self.tiled_image.writeTile(tile, column, row, layer_number)
+         
+   def isBackgroundArea(self, area, layer_number):
+      """Return True if the tiles of a layer that cover an area are background"""
+      tiled_image = self.tiled_image
+      if tiled_image.occupancy_map == None:
+         return False
+      pyramid = self.pyramid
+      grid_size = pyramid.tileGridSize(layer_number)
+      bottom_row = min(pyramid.tileRow(area.bottom, layer_number), grid_size.height - 1)
+      right_column = min(pyramid.tileColumn(area.right, layer_number), grid_size.width - 1)
+      for row in xrange(pyramid.tileRow(area.top, layer_number), bottom_row + 1):
+         for column in xrange(pyramid.tileColumn(area.left, layer_number),
+                              right_column + 1):
+            if not tiled_image.isEmptyTile(column, row, layer_number):
+               return False
+      return True
          
    def tileSourceRectangle(self, column, row, layer_number):
       """Return area of source image to be put on tile"""
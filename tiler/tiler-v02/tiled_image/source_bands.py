@@ -0,0 +1,142 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+import Image
+
+# Bytes per pixel for raw modes whose stride PIL leaves as 0
+RAW_PIXEL_BYTES = {"L": 1, "P": 1, "LA": 2, "I;16": 2, "I;16B": 2,
+                   "RGB": 3, "BGR": 3, "RGBA": 4, "RGBX": 4, "CMYK": 4}
+
+READ_BLOCK_SIZE = 65536
+
+class SourceBands:
+   """Decodes horizontal bands of a source image without decoding it all.
+
+   Uses the tile descriptors PIL finds when opening an image. Uncompressed
+   images (PPM, BMP, plain TIFF) are read row by row directly from the
+   file; images stored as separately compressed strips or tiles (TIFF)
+   are decoded one strip at a time. Formats compressed as one stream
+   (JPEG, PNG) and palette images cannot be read in bands: see
+   isStreamable().
+   """
+
+   def __init__(self, source_path):
+      image = Image.open(source_path)
+      self.source_path = source_path
+      self.mode = image.mode
+      self.size = image.size
+      self.tiles = image.tile
+
+   def isStreamable(self):
+      """Return True if bands can be read without decoding the full image"""
+      (width, height) = self.size
+      if self.mode == "P":
+         return False
+      for tile in self.tiles:
+         (decoder_name, extents, offset, arguments) = tile
+         if self.rawStride(tile) == None and extents[3] - extents[1] >= height:
+            return False
+      return True
+
+   def bytesPerRow(self):
+      """Return the approximate decoded size of one full image row"""
+      return self.size[0] * len(Image.new(self.mode, (1, 1)).getbands())
+
+   def readBand(self, top, bottom):
+      """Return an image of the full width of source rows top to bottom"""
+      width = self.size[0]
+      band = Image.new(self.mode, (width, bottom - top))
+      source_file = open(self.source_path, "rb")
+      try:
+         for tile in self.tiles:
+            (decoder_name, extents, offset, arguments) = tile
+            (left, tile_top, right, tile_bottom) = extents
+            if tile_bottom <= top or tile_top >= bottom:
+               continue
+            if self.rawStride(tile) != None:
+               self.readRawRows(source_file, band, tile, top, bottom)
+            else:
+               self.readTile(source_file, band, tile, top)
+      finally:
+         source_file.close()
+      return band
+
+   def readRawRows(self, source_file, band, tile, top, bottom):
+      """Decode just the rows of an uncompressed tile that are in a band"""
+      (decoder_name, extents, offset, arguments) = tile
+      (left, tile_top, right, tile_bottom) = extents
+      stride = self.rawStride(tile)
+      orientation = self.rawOrientation(tile)
+      first_row = max(tile_top, top)
+      last_row = min(tile_bottom, bottom)
+      if orientation < 0:
+         row_offset = offset + (tile_bottom - last_row) * stride
+      else:
+         row_offset = offset + (first_row - tile_top) * stride
+      band_extents = (left, first_row - top, right, last_row - top)
+      self.decode(source_file, band, decoder_name, band_extents,
+                  row_offset, arguments)
+
+   def readTile(self, source_file, band, tile, top):
+      """Decode a whole compressed tile and paste the part in a band"""
+      (decoder_name, extents, offset, arguments) = tile
+      (left, tile_top, right, tile_bottom) = extents
+      tile_image = Image.new(self.mode, (right - left, tile_bottom - tile_top))
+      self.decode(source_file, tile_image, decoder_name,
+                  (0, 0, right - left, tile_bottom - tile_top), offset, arguments)
+      band.paste(tile_image, (left, tile_top - top))
+
+   def decode(self, source_file, image, decoder_name, extents, offset, arguments):
+      """Run a PIL decoder on file data, writing to an area of image"""
+      decoder = Image._getdecoder(self.mode, decoder_name, arguments)
+      decoder.setimage(image.im, extents)
+      source_file.seek(offset)
+      buffer = ""
+      while True:
+         data = source_file.read(READ_BLOCK_SIZE)
+         if not data:
+            break
+         buffer = buffer + data
+         (consumed, error) = decoder.decode(buffer)
+         if consumed < 0:
+            break
+         buffer = buffer[consumed:]
+
+   def rawStride(self, tile):
+      """Return bytes per row of an uncompressed tile, or None if unknown"""
+      (decoder_name, extents, offset, arguments) = tile
+      if decoder_name != "raw":
+         return None
+      if isinstance(arguments, tuple):
+         raw_mode = arguments[0]
+         stride = len(arguments) > 1 and arguments[1] or 0
+      else:
+         raw_mode = arguments
+         stride = 0
+      if stride != 0:
+         return stride
+      width = extents[2] - extents[0]
+      if raw_mode == "1":
+         return (width + 7) / 8
+      if raw_mode not in RAW_PIXEL_BYTES:
+         return None
+      return width * RAW_PIXEL_BYTES[raw_mode]
+
+   def rawOrientation(self, tile):
+      """Return 1 for top-down and -1 for bottom-up uncompressed rows"""
+      arguments = tile[3]
+      if isinstance(arguments, tuple) and len(arguments) > 2:
+         return arguments[2]
+      return 1
@@ -14,13 +14,24 @@
 # Author: Jonathan A, Smith
 
 import Image
-import os.path
+import os.path, time
 from math import *
 from geometry import *
 from tiler import Tiler
+from source_bands import SourceBands
+from draft import draftReduction, openDraft
+from memory_budget import decodedPixelBytes
 
 class SourceTiler(Tiler):
-   """Creates tiles from a source image"""
+   """Creates tiles from a source image.
+   
+   When tiled_image.options.band_memory is set and the source format allows
+   it, the source is decoded in horizontal bands of whole tile rows that
+   fit in band_memory bytes, rather than all at once.
+   
+   Layers at half scale or less are cut from a copy of the source reduced
+   while it is decoded (for JPEG sources), then resized exactly.
+   """
    
    def __init__(self, tiled_image, source_path):
       from tiled_image import TiledImage
@@ -31,51 +42,176 @@ class SourceTiler(Tiler):
       self.background = tiled_image.background
       self.source_path = source_path
       self.source_image = Image.open(source_path)
-      print "Tiling: %s as: %s" % (source_path, self.tile_path)
-      print "Format: %s, Size: %s, Mode: %s" % (
-               self.source_image.format, self.source_image.size, self.source_image.mode)
+      self.source_loaded = False
+      self.source_bands = None
+      self.draft_images = {}
+      self.band = None
+      self.band_top = 0
+      instrumentation = tiled_image.instrumentation
+      (width, height) = self.source_image.size
+      instrumentation.event("source", source = source_path, 
+                            format = self.source_image.format, width = width,
+                            height = height, mode = self.source_image.mode)
+      
+      if tiled_image.options.band_memory != None:
+         source_bands = SourceBands(source_path)
+         if source_bands.isStreamable():
+            self.source_bands = source_bands
+         else:
+            instrumentation.message("Format can not be read in bands, decoding full image")
       
    def getImageSize(self):
       (width, height) = self.source_image.size
       return Dimensions(width, height)
       
-   def tileLayer(self, layer_number):
-      """Generate tiles for a specified layer"""
-      self.pyramid = self.tiled_image.pyramid
+   def __getstate__(self):
+      """Pickle state sent to worker processes, without the decoded source"""
+      state = Tiler.__getstate__(self)
+      del state["source_image"]
+      state["source_loaded"] = False
+      state["draft_images"] = {}
+      return state
+      
+   def __setstate__(self, state):
+      """Restore a tiler in a worker process, reopening the source image"""
+      self.__dict__.update(state)
+      self.source_image = Image.open(self.source_path)
+      
+   def tileRows(self, top_row, bottom_row, layer_number):
+      """Generate tiles in rows top_row up to (not including) bottom_row"""
+      if self.source_bands == None:
+         Tiler.tileRows(self, top_row, bottom_row, layer_number)
+         return
+      band_rows = self.bandRowCount(layer_number)
+      tasks = []
+      for band_row in xrange(top_row, bottom_row, band_rows):
+         band_bottom = min(band_row + band_rows, bottom_row)
+         positions = self.tilePositions(band_row, band_bottom, layer_number)
+         if len(positions) > 0:
+            tasks.append((band_row, band_bottom, layer_number, positions))
+      self.runTasks("generateBand", tasks)
+      
+   def retileTiles(self, positions, layer_number):
+      """Generate the tiles at (column, row) positions of a layer"""
+      if self.source_bands == None or len(positions) == 0:
+         Tiler.retileTiles(self, positions, layer_number)
+         return
+      # Finished tiles are skipped, so only bands with changes are decoded
+      for row in sorted(set([row for (column, row) in positions])):
+         self.tileRows(row, row + 1, layer_number)
+      
+   def bandRowCount(self, layer_number):
+      """Return the number of tile rows in a band that fits band_memory"""
+      tile_extent = self.pyramid.tileExtent(layer_number)
+      row_bytes = self.source_bands.bytesPerRow() * tile_extent.height
+      return max(1, int(self.tiled_image.options.band_memory / row_bytes))
+      
+   def generateBand(self, top_row, bottom_row, layer_number, positions):
+      """Decode the source under a band of tile rows, then tile positions"""
       pyramid = self.pyramid
-      scale = pyramid.scaleForLayer(layer_number)
-      grid_size = pyramid.tileGridSize(layer_number)
-      print "generating layer%04i: %i x %i at scale = %1.5f" % (
-               layer_number, grid_size.width, grid_size.height, scale)
-      for row in xrange(grid_size.height):
-         for column in xrange(grid_size.width):
-               self.generateTile(column, row, layer_number)
-                                 
+      tile_extent = pyramid.tileExtent(layer_number)
+      top = tile_extent.height * top_row
+      bottom = min(tile_extent.height * bottom_row, pyramid.image_size.height)
+      
+      start = time.time()
+      self.band = self.source_bands.readBand(top, bottom)
+      self.tiled_image.instrumentation.timeStage("decode", start)
+      self.band_top = top
+      try:
+         for (column, row) in positions:
+            self.generateTile(column, row, layer_number)
+      finally:
+         self.band = None
+      
+   def cropSource(self, source_box, scale):
+      """Return the area of the source image in a box, for use at scale"""
+      (left, top, right, bottom) = source_box
+      reduction = draftReduction(1 / scale)
+      if self.band == None and reduction == 1:
+         self.loadSource()
+      elif self.band == None:
+         draft_image = self.getDraftImage(reduction)
+      
+      start = time.time()
+      if self.band != None:
+         band_top = self.band_top
+         area = self.band.crop((left, top - band_top, right, bottom - band_top))
+      elif reduction == 1:
+         area = self.source_image.crop(source_box)
+      else:
+         x_scale = float(draft_image.size[0]) / self.source_image.size[0]
+         y_scale = float(draft_image.size[1]) / self.source_image.size[1]
+         area = draft_image.crop((int(round(left  * x_scale)), int(round(top    * y_scale)),
+                                  int(round(right * x_scale)), int(round(bottom * y_scale))))
+      self.tiled_image.instrumentation.timeStage("crop", start)
+      return area
+      
+   def loadSource(self):
+      """Decode the whole source image, if it has not been"""
+      if not self.source_loaded:
+         start = time.time()
+         self.source_image.load()
+         self.tiled_image.instrumentation.timeStage("decode", start)
+         self.source_loaded = True
+      
+   def decodedBytes(self):
+      """Return about how many bytes of decoded source images are held"""
+      images = self.draft_images.values()
+      if self.source_loaded:
+         images.append(self.source_image)
+      return sum([image.size[0] * image.size[1] * decodedPixelBytes(image.mode)
+                  for image in images])
+      
+   def getDraftImage(self, reduction):
+      """Return the source image reduced in size while being decoded"""
+      draft_image = self.draft_images.get(reduction)
+      if draft_image == None:
+         start = time.time()
+         draft_image = openDraft(self.source_path, reduction)
+         draft_image.load()
+         self.tiled_image.instrumentation.timeStage("decode", start)
+         self.draft_images[reduction] = draft_image
+      return draft_image
+      
    def generateTile(self, column, row, layer_number):
       """Crop, scale, and write an image tile"""
+      tile = self.renderTile(column, row, layer_number)
+      self.tiled_image.writeTile(tile, column, row, layer_number)
+         
+   def renderTile(self, column, row, layer_number):
+      """Crop and scale the source under a tile, returning the tile image"""
       pyramid = self.pyramid
-      source_image = self.source_image
       tile_size = pyramid.tile_size
-      
-      file_path = self.tiled_image.tileFilePath(column, row, layer_number)
-      if os.path.exists(file_path): return
+      instrumentation = self.tiled_image.instrumentation
       
       source_box = self.tileSourceBox(column, row, layer_number) 
       
       scale = pyramid.scaleForLayer(layer_number)
       width  = int(ceil(scale * (source_box[2] - source_box[0])))
       height = int(ceil(scale * (source_box[3] - source_box[1])))
-      
-      name = os.path.basename(file_path)
-      print "\t%s: %s x %s" % (name, width, height)
            
-      tile_source = source_image.crop(source_box)
+      if (self.source_bands != None and self.band == None and
+          draftReduction(1 / scale) == 1):
+         # A full size tile rendered on its own only decodes the rows
+         # under it; smaller layers come from reduced drafts
+         start = time.time()
+         self.band = self.source_bands.readBand(source_box[1], source_box[3])
+         instrumentation.timeStage("decode", start)
+         self.band_top = source_box[1]
+         try:
+            tile_source = self.cropSource(source_box, scale)
+         finally:
+            self.band = None
+      else:
+         tile_source = self.cropSource(source_box, scale)
+      start = time.time()
       scaled_tile = tile_source.resize((width, height), Image.ANTIALIAS)
+      start = instrumentation.timeStage("resize", start)
       tile = Image.new("RGB", (tile_size.width, tile_size.height), 
                        self.background)
       tile.paste(scaled_tile, (0, 0))
-
-      tile.save(file_path, "jpeg")
+      instrumentation.timeStage("paste", start)
+      return tile
          
    def tileSourceBox(self, column, row, layer_number):
       """Return area of source image to be put on tile"""
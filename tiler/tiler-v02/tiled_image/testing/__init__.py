@@ -0,0 +1 @@
+# ispace.tiled_image.testing
\ No newline at end of file
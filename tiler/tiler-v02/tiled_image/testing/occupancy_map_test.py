@@ -0,0 +1,74 @@
+
+import unittest, os, shutil, tempfile
+from ispace.geometry.dimensions import *
+from ispace.tiled_image.pyramid import *
+from ispace.tiled_image.occupancy_map import *
+
+class OccupancyMapTest(unittest.TestCase):
+   
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.path = os.path.join(self.directory, OCCUPANCY_FILE_NAME)
+      self.pyramid = Pyramid(Dimensions(3000, 1100))
+      self.last_layer = self.pyramid.layer_count - 1
+      
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+      
+   def testEmpty(self):
+      occupancy = OccupancyMap(self.path, self.pyramid)
+      self.assertEqual(0, occupancy.emptyCount())
+      self.assertFalse(occupancy.isEmpty((0, 0, 0)))
+      occupancy.save()
+      self.assertFalse(os.path.exists(self.path))
+      
+   def testSaveLoad(self):
+      (columns, rows) = self.pyramid.tileGridSize(self.last_layer)
+      keys = [(0, 0, 0), (self.last_layer, 0, 0), (self.last_layer, 7, 1),
+              (self.last_layer, columns - 1, rows - 1), (self.last_layer - 2, 1, 1)]
+      occupancy = OccupancyMap(self.path, self.pyramid)
+      occupancy.markEmpty(keys)
+      occupancy.save()
+      self.assertEqual([OCCUPANCY_FILE_NAME], os.listdir(self.directory))
+      occupancy = OccupancyMap(self.path)
+      self.assertEqual(len(keys), occupancy.emptyCount())
+      for key in keys:
+         self.assertTrue(occupancy.isEmpty(key))
+      self.assertFalse(occupancy.isEmpty((self.last_layer, 6, 1)))
+      self.assertFalse(occupancy.isEmpty((self.last_layer, 0, 1)))
+      
+   def testGridSizes(self):
+      occupancy = OccupancyMap(self.path, self.pyramid)
+      occupancy.markEmpty([(0, 0, 0)])
+      occupancy.save()
+      occupancy = OccupancyMap(self.path)
+      self.assertEqual(self.pyramid.layer_count, len(occupancy.grid_sizes))
+      for (layer_number, (columns, rows)) in enumerate(occupancy.grid_sizes):
+         grid_size = self.pyramid.tileGridSize(layer_number)
+         self.assertEqual((grid_size.width, grid_size.height), (columns, rows))
+      
+   def testClear(self):
+      occupancy = OccupancyMap(self.path, self.pyramid)
+      occupancy.markEmpty([(self.last_layer, 2, 3), (self.last_layer, 3, 3)])
+      occupancy.save()
+      occupancy = OccupancyMap(self.path)
+      occupancy.clear([(self.last_layer, 2, 3), (self.last_layer, 4, 3)])
+      self.assertTrue(occupancy.changed)
+      occupancy.save()
+      occupancy = OccupancyMap(self.path)
+      self.assertEqual(1, occupancy.emptyCount())
+      self.assertTrue(occupancy.isEmpty((self.last_layer, 3, 3)))
+      occupancy.clear([(self.last_layer, 2, 3)])
+      self.assertFalse(occupancy.changed)
+      
+   def testNotOccupancyMap(self):
+      out = open(self.path, "wb")
+      out.write("TILEPACK" + "\x00" * 64)
+      out.close()
+      self.assertRaises(IOError, OccupancyMap, self.path)
+      
+def suite():
+   return unittest.makeSuite(OccupancyMapTest)
+   
+if __name__ == "__main__":
+   unittest.TextTestRunner(verbosity=2).run(suite())
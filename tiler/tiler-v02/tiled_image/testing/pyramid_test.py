@@ -0,0 +1,92 @@
+
+import unittest, random, sys
+from ispace.geometry.rectangle import *
+from ispace.geometry.dimensions import *
+from ispace.tiled_image.pyramid import *
+
+pyramid_module = sys.modules["ispace.tiled_image.pyramid"]
+
+def sampleRectangles(image_size, count):
+   """Return rectangles inside, across, outside and on the image's edges"""
+   generator = random.Random(7)
+   (width, height) = (image_size.width, image_size.height)
+   rectangles = [Rectangle(0, 0, width, height),
+                 Rectangle(-100, -100, width + 100, height + 100),
+                 Rectangle(0, 0, 1, 1),
+                 Rectangle(width - 1, height - 1, width, height),
+                 Rectangle(256, 256, 512, 512),
+                 Rectangle(255.5, 0, 256.5, 10),
+                 Rectangle(10, 10, 10, 20),
+                 Rectangle(-50, -50, 0, 0),
+                 Rectangle(width, 0, width + 10, 10),
+                 Rectangle(30, 40, 20, 50)]
+   for index in xrange(count):
+      left = generator.uniform(-0.2 * width, 1.1 * width)
+      top = generator.uniform(-0.2 * height, 1.1 * height)
+      rectangles.append(Rectangle(left, top, left + generator.uniform(0, 0.5 * width),
+                                  top + generator.uniform(0, 0.5 * height)))
+   return rectangles
+
+class PyramidTest(unittest.TestCase):
+   
+   def setUp(self):
+      self.pyramid = Pyramid(Dimensions(3000, 1100))
+      self.rectangles = sampleRectangles(self.pyramid.image_size, 200)
+      self.layer_numbers = range(self.pyramid.layer_count)
+      
+   def assertRangesMatch(self):
+      pyramid = self.pyramid
+      ranges = pyramid.tileRanges(self.rectangles, self.layer_numbers)
+      self.assertEqual(len(self.layer_numbers), len(ranges))
+      for (layer_number, layer_ranges) in zip(self.layer_numbers, ranges):
+         expected = [pyramid.tileRange(rectangle, layer_number)
+                     for rectangle in self.rectangles]
+         self.assertEqual(expected, [tuple(tile_range) for tile_range in layer_ranges])
+      
+   def testTileRange(self):
+      last_layer = self.pyramid.layer_count - 1
+      (columns, rows) = self.pyramid.tileGridSize(last_layer)
+      self.assertEqual((0, 0, columns - 1, rows - 1),
+                       self.pyramid.tileRange(Rectangle(0, 0, 3000, 1100), last_layer))
+      self.assertEqual((1, 1, 1, 1),
+                       self.pyramid.tileRange(Rectangle(256, 256, 512, 512), last_layer))
+      self.assertEqual((0, 0, 1, 0),
+                       self.pyramid.tileRange(Rectangle(255.5, 0, 256.5, 10), last_layer))
+      self.assertEqual((0, 0, -1, -1),
+                       self.pyramid.tileRange(Rectangle(10, 10, 10, 20), last_layer))
+      self.assertEqual((0, 0, 0, 0),
+                       self.pyramid.tileRange(Rectangle(0, 0, 3000, 1100), 0))
+      
+   def testTileRanges(self):
+      self.assertRangesMatch()
+      
+   def testTileRangesWithoutNumPy(self):
+      numpy = pyramid_module.numpy
+      pyramid_module.numpy = None
+      try:
+         self.assertRangesMatch()
+      finally:
+         pyramid_module.numpy = numpy
+      
+   def testSomeLayers(self):
+      self.layer_numbers = [self.pyramid.layer_count - 1, 0, 3]
+      self.assertRangesMatch()
+      
+   def testNoRectangles(self):
+      self.assertEqual([[], []], self.pyramid.tileRanges([], [0, 1]))
+      
+   def testTables(self):
+      pyramid = self.pyramid
+      for layer_number in self.layer_numbers:
+         self.assertEqual(pyramid.computeTileExtent(layer_number),
+                          pyramid.tileExtent(layer_number))
+         self.assertEqual(pyramid.computeGridSize(layer_number),
+                          pyramid.tileGridSize(layer_number))
+         self.assertEqual(pyramid.computeScale(layer_number),
+                          pyramid.scaleForLayer(layer_number))
+      
+def suite():
+   return unittest.makeSuite(PyramidTest)
+   
+if __name__ == "__main__":
+   unittest.TextTestRunner(verbosity=2).run(suite())
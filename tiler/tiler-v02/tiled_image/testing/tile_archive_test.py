@@ -0,0 +1,115 @@
+
+import unittest, os, shutil, tempfile
+from ispace.geometry.dimensions import *
+from ispace.tiled_image.pyramid import *
+from ispace.tiled_image.tile_archive import *
+
+class TileArchiveTest(unittest.TestCase):
+   
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.path = os.path.join(self.directory, ARCHIVE_FILE_NAME)
+      self.pyramid = Pyramid(Dimensions(1000, 700))
+      
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+      
+   def sampleTiles(self):
+      last_layer = self.pyramid.layer_count - 1
+      (columns, rows) = self.pyramid.tileGridSize(last_layer)
+      return {(0, 0, 0): "first",
+              (last_layer, 0, 0): "top left" * 100,
+              (last_layer, columns - 1, rows - 1): "bottom right",
+              (last_layer - 1, 1, 0): "\x00\xff" * 1000}
+      
+   def testEmpty(self):
+      archive = TileArchive(self.path, self.pyramid)
+      self.assertEqual([], archive.keys())
+      self.assertFalse(archive.contains((0, 0, 0)))
+      self.assertRaises(IOError, archive.tileBytes, (0, 0, 0))
+      archive.close()
+      
+   def testGridSizes(self):
+      archive = TileArchive(self.path, self.pyramid)
+      self.assertEqual(self.pyramid.layer_count, len(archive.grid_sizes))
+      for (layer_number, (columns, rows)) in enumerate(archive.grid_sizes):
+         grid_size = self.pyramid.tileGridSize(layer_number)
+         self.assertEqual((grid_size.width, grid_size.height), (columns, rows))
+      archive.close()
+      
+   def testRoundTrip(self):
+      tiles = self.sampleTiles()
+      archive = TileArchive(self.path, self.pyramid)
+      for key in sorted(tiles.keys()):
+         archive.write(key, tiles[key])
+      archive.close()
+      archive = TileArchive(self.path)
+      self.assertEqual(sorted(tiles.keys()), archive.keys())
+      for (key, data) in tiles.items():
+         self.assertEqual(data, archive.tileBytes(key))
+      self.assertFalse(archive.contains((1, 0, 0)))
+      archive.close()
+      
+   def testReadWhileWriting(self):
+      archive = TileArchive(self.path, self.pyramid)
+      archive.write((0, 0, 0), "first")
+      archive.flush()
+      self.assertEqual("first", archive.tileBytes((0, 0, 0)))
+      archive.write((1, 0, 0), "second")
+      archive.flush()
+      self.assertEqual("second", archive.tileBytes((1, 0, 0)))
+      self.assertEqual("first", archive.tileBytes((0, 0, 0)))
+      archive.close()
+      
+   def testTileFile(self):
+      archive = TileArchive(self.path, self.pyramid)
+      archive.write((0, 0, 0), "0123456789")
+      tile_file = archive.tileFile((0, 0, 0))
+      self.assertEqual("0123", tile_file.read(4))
+      self.assertEqual(4, tile_file.tell())
+      tile_file.seek(8)
+      self.assertEqual("89", tile_file.read())
+      archive.close()
+      
+   def testWriteTilesByLayer(self):
+      tiles = self.sampleTiles()
+      archive = TileArchive(self.path, self.pyramid)
+      archive.writeTiles(tiles.items())
+      offsets = [archive.readEntry(key)[0] for key in sorted(tiles.keys())]
+      self.assertEqual(sorted(offsets), offsets)
+      for (key, data) in tiles.items():
+         self.assertEqual(data, archive.tileBytes(key))
+      archive.close()
+      
+   def testTileBuffer(self):
+      archive = TileArchive(self.path, self.pyramid)
+      archive.write((0, 0, 0), "0123456789")
+      tile_buffer = archive.tileBuffer((0, 0, 0))
+      self.assertEqual(10, len(tile_buffer))
+      self.assertEqual("0123456789", str(tile_buffer))
+      self.assertRaises(IOError, archive.tileBuffer, (1, 0, 0))
+      archive.close()
+      
+   def testRemove(self):
+      tiles = self.sampleTiles()
+      archive = TileArchive(self.path, self.pyramid)
+      for key in sorted(tiles.keys()):
+         archive.write(key, tiles[key])
+      archive.remove([(0, 0, 0)])
+      archive.close()
+      archive = TileArchive(self.path)
+      self.assertFalse(archive.contains((0, 0, 0)))
+      self.assertEqual(len(tiles) - 1, len(archive.keys()))
+      archive.close()
+      
+   def testNotArchive(self):
+      out = open(self.path, "wb")
+      out.write("TILEMASK" + "\x00" * 64)
+      out.close()
+      self.assertRaises(IOError, TileArchive, self.path)
+      
+def suite():
+   return unittest.makeSuite(TileArchiveTest)
+   
+if __name__ == "__main__":
+   unittest.TextTestRunner(verbosity=2).run(suite())
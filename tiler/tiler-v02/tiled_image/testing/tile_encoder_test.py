@@ -0,0 +1,53 @@
+
+import unittest, Image
+from ispace.tiled_image.tile_encoder import *
+
+class TileEncoderTest(unittest.TestCase):
+   
+   def testDefault(self):
+      encoder = TileEncoder()
+      self.assertEqual("jpg", encoder.tile_format)
+      self.assertEqual({}, encoder.settings)
+      self.assertEqual("jpg", encoder.spec())
+      self.assertEqual("image/jpeg", encoder.contentType())
+      
+   def testSettings(self):
+      encoder = TileEncoder("jpg:quality=80,subsampling=4:2:0,progressive")
+      self.assertEqual({"quality": 80, "subsampling": "4:2:0", "progressive": True},
+                       encoder.settings)
+      self.assertEqual({"quality": 80, "subsampling": 2, "progressive": True},
+                       encoder.saveOptions())
+      
+   def testSpecRoundTrip(self):
+      for spec in ("jpg", "png:optimize", "jpg:optimize,quality=75",
+                   "png:compress_level=9"):
+         self.assertEqual(spec, TileEncoder(spec).spec())
+      encoder = TileEncoder("jpg:quality=75,optimize")
+      self.assertEqual("jpg:optimize,quality=75", encoder.spec())
+      self.assertEqual(encoder.settings, TileEncoder(encoder.spec()).settings)
+      
+   def testEmptySettings(self):
+      self.assertEqual({}, TileEncoder("jpg:").settings)
+      self.assertEqual({"optimize": True}, TileEncoder("png:optimize,").settings)
+      
+   def testUnknownFormat(self):
+      self.assertRaises(ValueError, TileEncoder, "gif")
+      self.assertRaises(ValueError, TileEncoder, "JPG")
+      self.assertRaises(ValueError, TileEncoder, "")
+      
+   def testBadSettings(self):
+      for spec in ("jpg:quality=high", "jpg:quality", "jpg:quality=-5",
+                   "jpg:subsampling=4:1:1", "jpg:progressive=1", "jpg:lossless",
+                   "png:quality=80", "jpg:speed=3"):
+         self.assertRaises(ValueError, TileEncoder, spec)
+      
+   def testEncode(self):
+      encoder = TileEncoder("png")
+      data = encoder.encode(Image.new("RGB", (16, 16), (255, 0, 0)))
+      self.assertEqual("\x89PNG", data[:4])
+      
+def suite():
+   return unittest.makeSuite(TileEncoderTest)
+   
+if __name__ == "__main__":
+   unittest.TextTestRunner(verbosity=2).run(suite())
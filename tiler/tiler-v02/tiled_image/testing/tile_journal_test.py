@@ -0,0 +1,71 @@
+
+import unittest, os, shutil, tempfile
+from ispace.tiled_image.tile_journal import *
+
+class TileJournalTest(unittest.TestCase):
+   
+   def setUp(self):
+      self.image_path = tempfile.mkdtemp()
+      self.path = os.path.join(self.image_path, JOURNAL_FILE_NAME)
+      
+   def tearDown(self):
+      shutil.rmtree(self.image_path)
+      
+   def readJournal(self):
+      journal_file = open(self.path, "rb")
+      data = journal_file.read()
+      journal_file.close()
+      return data
+      
+   def writeJournal(self, data):
+      journal_file = open(self.path, "wb")
+      journal_file.write(data)
+      journal_file.close()
+      
+   def testEmpty(self):
+      journal = TileJournal(self.image_path)
+      self.assertEqual(0, len(journal))
+      self.assertFalse(os.path.exists(self.path))
+      
+   def testRecord(self):
+      journal = TileJournal(self.image_path)
+      journal.record([(0, 0, 0), (3, 1, 2)])
+      journal.record([(3, 1, 2), (3, 2, 2)])
+      journal.close()
+      self.assertEqual("0 0 0\n3 1 2\n3 2 2\n", self.readJournal())
+      journal = TileJournal(self.image_path)
+      self.assertEqual(3, len(journal))
+      self.assertTrue((3, 2, 2) in journal)
+      self.assertFalse((3, 2, 1) in journal)
+      
+   def testRemove(self):
+      journal = TileJournal(self.image_path)
+      journal.record([(0, 0, 0), (1, 0, 0), (1, 1, 0)])
+      journal.remove([(1, 0, 0), (2, 0, 0)])
+      journal.close()
+      journal = TileJournal(self.image_path)
+      self.assertEqual(set([(0, 0, 0), (1, 1, 0)]), journal.tiles)
+      journal.record([(1, 0, 0)])
+      journal.close()
+      self.assertTrue((1, 0, 0) in TileJournal(self.image_path))
+      
+   def testPartialLastLine(self):
+      self.writeJournal("0 0 0\n1 0 0\n2 1")
+      journal = TileJournal(self.image_path)
+      self.assertEqual(set([(0, 0, 0), (1, 0, 0)]), journal.tiles)
+      self.assertEqual("0 0 0\n1 0 0\n", self.readJournal())
+      journal.record([(2, 1, 0)])
+      journal.close()
+      self.assertEqual("0 0 0\n1 0 0\n2 1 0\n", self.readJournal())
+      
+   def testPartialRemoveLine(self):
+      self.writeJournal("0 0 0\n1 0 0\n- 1 0")
+      journal = TileJournal(self.image_path)
+      self.assertEqual(set([(0, 0, 0), (1, 0, 0)]), journal.tiles)
+      self.assertEqual("0 0 0\n1 0 0\n", self.readJournal())
+      
+def suite():
+   return unittest.makeSuite(TileJournalTest)
+   
+if __name__ == "__main__":
+   unittest.TextTestRunner(verbosity=2).run(suite())
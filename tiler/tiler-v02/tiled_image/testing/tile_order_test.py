@@ -0,0 +1,54 @@
+
+import unittest
+from ispace.tiled_image.tile_order import *
+
+GRID_SIZES = [(1, 1), (2, 1), (3, 5), (7, 2), (8, 8), (16, 9), (13, 31)]
+
+class TileOrderTest(unittest.TestCase):
+   
+   def assertPermutation(self, positions, columns, rows):
+      self.assertEqual(columns * rows, len(positions))
+      self.assertEqual(sorted(rowMajorOrder(columns, rows)), sorted(positions))
+      
+   def testRowMajor(self):
+      self.assertEqual([(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)],
+                       rowMajorOrder(3, 2))
+      
+   def testMortonPermutation(self):
+      for (columns, rows) in GRID_SIZES:
+         self.assertPermutation(mortonOrder(columns, rows), columns, rows)
+      
+   def testHilbertPermutation(self):
+      for (columns, rows) in GRID_SIZES:
+         self.assertPermutation(hilbertOrder(columns, rows), columns, rows)
+      
+   def testMortonBlocks(self):
+      self.assertEqual([(0, 0), (1, 0), (0, 1), (1, 1), (2, 0), (3, 0), (2, 1), (3, 1)],
+                       mortonOrder(4, 4)[:8])
+      self.assertEqual(range(64), sorted([mortonIndex(column, row)
+                                          for (column, row) in rowMajorOrder(8, 8)]))
+      
+   def testHilbertSteps(self):
+      for side in (2, 4, 8, 16):
+         positions = hilbertOrder(side, side)
+         self.assertEqual((0, 0), positions[0])
+         self.assertEqual((side - 1, 0), positions[-1])
+         for (first, second) in zip(positions, positions[1:]):
+            distance = abs(first[0] - second[0]) + abs(first[1] - second[1])
+            self.assertEqual(1, distance)
+      
+   def testHilbertIndex(self):
+      self.assertEqual(range(256), sorted([hilbertIndex(16, column, row)
+                                           for (column, row) in rowMajorOrder(16, 16)]))
+      
+   def testTileOrder(self):
+      self.assertEqual(mortonOrder(5, 3), tileOrder("morton", 5, 3))
+      self.assertEqual(hilbertOrder(5, 3), tileOrder("hilbert", 5, 3))
+      self.assertEqual(rowMajorOrder(5, 3), tileOrder("row", 5, 3))
+      self.assertRaises(KeyError, tileOrder, "spiral", 5, 3)
+      
+def suite():
+   return unittest.makeSuite(TileOrderTest)
+   
+if __name__ == "__main__":
+   unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,154 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# A tile archive holds every tile of a tiled image in one file:
+#
+#   header  - "TILEPACK", format version and layer grid sizes (see
+#             grid_index.py)
+#   index   - offset and length of each tile's bytes ("<QI" per tile),
+#             by layer, then row, then column; zero length for no tile
+#   data    - encoded tiles, appended a batch at a time, each batch in
+#             layer, row and column order
+#
+# Tiles are appended in batches as they are written, so tiles of
+# different layers written at the same time, as the layer cascade does,
+# are mixed in the data. A batch's bytes are synced to disk before its
+# index entries are written, so a tile with an index entry is always
+# complete, even after a crash.
+
+import os, os.path, mmap, struct
+from grid_index import GridIndex
+
+ARCHIVE_FILE_NAME = "tiles.pack"
+ARCHIVE_MAGIC = "TILEPACK"
+ARCHIVE_VERSION = 1
+ENTRY_FORMAT = "<QI"
+
+class ArchiveTileFile:
+   """Read-only file object over one tile's bytes in a mapped archive.
+
+   PIL parses what it reads as strings, so each read copies the bytes
+   asked for out of the map; the rest of the tile is not copied.
+   """
+
+   def __init__(self, archive_map, offset, length):
+      self.archive_map = archive_map
+      self.offset = offset
+      self.length = length
+      self.position = 0
+
+   def read(self, size = -1):
+      end = self.length
+      if size >= 0:
+         end = min(self.position + size, self.length)
+      data = self.archive_map[self.offset + self.position:self.offset + end]
+      self.position = max(end, self.position)
+      return data
+
+   def seek(self, position, whence = 0):
+      if whence == 1:
+         position += self.position
+      elif whence == 2:
+         position += self.length
+      self.position = max(0, position)
+
+   def tell(self):
+      return self.position
+
+
+class TileArchive(GridIndex):
+   """Reads and writes the tiles of a tiled image packed into one file.
+
+   Tiles are read through a read-only memory map of the file, without
+   opening a file per tile. Only one process may write an archive.
+   """
+
+   MAGIC = ARCHIVE_MAGIC
+   VERSION = ARCHIVE_VERSION
+   KIND = "tile archive"
+   ENTRY_FORMAT = ENTRY_FORMAT
+   EMPTY_ENTRY = struct.pack(ENTRY_FORMAT, 0, 0)
+
+   def __init__(self, path, pyramid = None):
+      """Open an archive, creating an empty one for pyramid if needed"""
+      GridIndex.__init__(self, path, pyramid)
+      self.archive_map = None
+
+   def getMap(self, end):
+      """Return a memory map of the archive covering at least end bytes"""
+      if self.out != None:
+         self.out.flush()
+      if self.archive_map == None or len(self.archive_map) < end:
+         # Tiles still being read keep the old map open until they are done
+         self.archive_map = mmap.mmap(self.read_file.fileno(), 0,
+                                      access = mmap.ACCESS_READ)
+      return self.archive_map
+
+   def readEntry(self, key):
+      """Return (offset, length) of a tile's bytes, length 0 if none"""
+      position = self.entryPosition(key)
+      entry_size = struct.calcsize(ENTRY_FORMAT)
+      archive_map = self.getMap(position + entry_size)
+      return struct.unpack(ENTRY_FORMAT, archive_map[position:position + entry_size])
+
+   def contains(self, key):
+      """Return True if the archive holds a tile"""
+      return self.readEntry(key)[1] > 0
+
+   def tileFile(self, key):
+      """Return a file object reading a tile's bytes from the memory map"""
+      (offset, length) = self.readEntry(key)
+      if length == 0:
+         raise IOError("%s has no tile %s" % (self.path, key))
+      return ArchiveTileFile(self.getMap(offset + length), offset, length)
+
+   def tileBytes(self, key):
+      """Return a copy of a tile's bytes"""
+      return self.tileFile(key).read()
+
+   def tileBuffer(self, key):
+      """Return a read-only buffer over a tile's bytes in the map, not a copy"""
+      (offset, length) = self.readEntry(key)
+      if length == 0:
+         raise IOError("%s has no tile %s" % (self.path, key))
+      return buffer(self.getMap(offset + length), offset, length)
+
+   def write(self, key, data):
+      """Append a tile's bytes, then point its index entry at them"""
+      self.writeTiles([(key, data)])
+
+   def writeTiles(self, tiles):
+      """Append (key, bytes) tiles, then point their index entries at them.
+
+      The tiles are appended in key order, so by layer, and synced to
+      disk before any of their entries is written.
+      """
+      if self.out == None:
+         self.out = open(self.path, "r+b")
+      self.out.seek(0, 2)
+      entries = []
+      for (key, data) in sorted(tiles, key = lambda tile: tile[0]):
+         entries.append((key, struct.pack(ENTRY_FORMAT, self.out.tell(), len(data))))
+         self.out.write(data)
+      self.out.flush()
+      os.fsync(self.out.fileno())
+      self.writeEntries(entries)
+
+   def close(self):
+      """Close the archive"""
+      if self.archive_map != None:
+         self.archive_map.close()
+         self.archive_map = None
+      GridIndex.close(self)
@@ -0,0 +1,89 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+from collections import OrderedDict
+
+class TileCache:
+   """Least recently used cache of decoded tile images.
+
+   Tiles are keyed by (layer_number, column, row). The cache holds at most
+   byte_budget bytes of decoded pixels, evicting the least recently used
+   tiles to make room.
+
+   self.hits - number of get() calls answered from the cache
+   self.misses - number of get() calls that found nothing
+   self.evictions - number of tiles dropped to stay within the budget
+   """
+
+   def __init__(self, byte_budget):
+      self.byte_budget = byte_budget
+      self.byte_count = 0
+      self.tiles = OrderedDict()
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+
+   def get(self, key):
+      """Return the cached tile for a key, or None"""
+      tile = self.tiles.pop(key, None)
+      if tile == None:
+         self.misses += 1
+         return None
+      self.tiles[key] = tile
+      self.hits += 1
+      return tile
+
+   def put(self, key, tile):
+      """Add a decoded tile, evicting old tiles if over budget"""
+      self.discard(key)
+      size = self.imageBytes(tile)
+      if size > self.byte_budget:
+         return
+      self.tiles[key] = tile
+      self.byte_count += size
+      while self.byte_count > self.byte_budget:
+         (old_key, old_tile) = self.tiles.popitem(last = False)
+         self.byte_count -= self.imageBytes(old_tile)
+         self.evictions += 1
+
+   def discard(self, key):
+      """Remove a tile from the cache if present"""
+      tile = self.tiles.pop(key, None)
+      if tile != None:
+         self.byte_count -= self.imageBytes(tile)
+
+   def takeCounts(self):
+      """Return and reset (hits, misses, evictions)"""
+      counts = (self.hits, self.misses, self.evictions)
+      (self.hits, self.misses, self.evictions) = (0, 0, 0)
+      return counts
+
+   def addCounts(self, counts):
+      """Add (hits, misses, evictions) counted by another cache"""
+      (hits, misses, evictions) = counts
+      self.hits += hits
+      self.misses += misses
+      self.evictions += evictions
+
+   def imageBytes(self, tile):
+      """Return the approximate memory used by a decoded tile"""
+      (width, height) = tile.size
+      return width * height * len(tile.getbands())
+
+   def __repr__(self):
+      """Return a summary of cache use"""
+      return "TileCache(%i tiles, %i bytes, hits=%i, misses=%i, evictions=%i)" % (
+         len(self.tiles), self.byte_count, self.hits, self.misses,
+         self.evictions)
@@ -0,0 +1,106 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+
+from cStringIO import StringIO
+import Image
+
+# Tile format (file extension): (PIL format, MIME type)
+TILE_FORMATS = {"jpg":  ("JPEG", "image/jpeg"),
+                "webp": ("WEBP", "image/webp"),
+                "png":  ("PNG",  "image/png")}
+
+# Chroma subsampling names, as PIL's JPEG encoder numbers them
+SUBSAMPLINGS = {"4:4:4": 0, "4:2:2": 1, "4:2:0": 2}
+
+# Settings each format accepts: the valued ones, then the flags
+FORMAT_SETTINGS = {"jpg":  (("quality", "subsampling"), ("progressive", "optimize")),
+                   "webp": (("quality", "method"), ("lossless",)),
+                   "png":  (("compress_level",), ("optimize",))}
+
+class TileEncoder:
+   """Encodes tile images in one format with fixed settings.
+
+   An encoder is described by a spec string: the tile format, then
+   optionally a colon and comma separated settings, for example
+   "jpg:quality=80,subsampling=4:2:0,progressive,optimize",
+   "webp:quality=75" or "png:optimize". Settings not given are left at
+   PIL's defaults, so "jpg" encodes tiles exactly as PIL always has.
+
+   self.tile_format - file extension of the tiles: "jpg", "webp" or "png"
+   self.settings - {name: value} of settings, True for flags
+   """
+
+   def __init__(self, spec = "jpg"):
+      (tile_format, separator, settings) = spec.partition(":")
+      if tile_format not in TILE_FORMATS:
+         raise ValueError("unknown tile format %s: use %s" % (
+            tile_format, ", ".join(sorted(TILE_FORMATS.keys()))))
+      self.tile_format = tile_format
+      self.settings = {}
+      (valued, flags) = FORMAT_SETTINGS[tile_format]
+      for setting in [setting for setting in settings.split(",") if setting]:
+         (name, equals, value) = setting.partition("=")
+         if name in flags and not equals:
+            self.settings[name] = True
+         elif name == "subsampling" and value in SUBSAMPLINGS:
+            self.settings[name] = value
+         elif name in valued and value.isdigit():
+            self.settings[name] = int(value)
+         else:
+            raise ValueError("bad %s setting: %s" % (tile_format, setting))
+      self.checkSupported()
+
+   def checkSupported(self):
+      """Raise ValueError if this PIL can not write the format"""
+      try:
+         self.encode(Image.new("RGB", (8, 8)))
+      except (IOError, KeyError), error:
+         raise ValueError("PIL can not write %s tiles: %s" % (
+            self.tile_format, error))
+
+   def spec(self):
+      """Return the spec string describing this encoder"""
+      settings = []
+      for name in sorted(self.settings.keys()):
+         value = self.settings[name]
+         if value is True:
+            settings.append(name)
+         else:
+            settings.append("%s=%s" % (name, value))
+      if len(settings) == 0:
+         return self.tile_format
+      return "%s:%s" % (self.tile_format, ",".join(settings))
+
+   def saveOptions(self):
+      """Return keyword arguments for PIL's Image.save"""
+      options = dict(self.settings)
+      if "subsampling" in options:
+         options["subsampling"] = SUBSAMPLINGS[options["subsampling"]]
+      return options
+
+   def contentType(self):
+      """Return the MIME type of encoded tiles"""
+      return TILE_FORMATS[self.tile_format][1]
+
+   def save(self, tile, path):
+      """Write a tile image to a file"""
+      tile.save(path, TILE_FORMATS[self.tile_format][0], **self.saveOptions())
+
+   def encode(self, tile):
+      """Return a tile image encoded as a string"""
+      data = StringIO()
+      self.save(tile, data)
+      return data.getvalue()
@@ -0,0 +1,90 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+import os, os.path
+
+JOURNAL_FILE_NAME = "tiles.journal"
+
+class TileJournal:
+   """Append-only record of the tiles of an image that are complete.
+
+   Each line is "layer column row" for a tile that has been written, or
+   "- layer column row" for a tile that was deleted since. Tiles are only
+   recorded after their file has been synced to disk and renamed into
+   place, so a recorded tile is never partly written, and each append is
+   synced before tiling goes on. Only one process writes a journal.
+
+   self.tiles - set of (layer_number, column, row) keys of complete tiles
+   """
+
+   def __init__(self, image_path):
+      self.path = os.path.join(image_path, JOURNAL_FILE_NAME)
+      self.tiles = set()
+      self.out = None
+      self.load()
+
+   def load(self):
+      """Read the journal, if there is one, in a single pass"""
+      if not os.path.exists(self.path):
+         return
+      journal_file = open(self.path, "rb")
+      data = journal_file.read()
+      journal_file.close()
+
+      # Cut off a line left incomplete by a crash before appending more
+      end = data.rfind("\n") + 1
+      if end < len(data):
+         journal_file = open(self.path, "r+b")
+         journal_file.truncate(end)
+         journal_file.close()
+
+      for line in data[:end].splitlines():
+         fields = line.split()
+         if fields[0] == "-":
+            self.tiles.discard(tuple([int(field) for field in fields[1:]]))
+         else:
+            self.tiles.add(tuple([int(field) for field in fields]))
+
+   def __contains__(self, key):
+      return key in self.tiles
+
+   def __len__(self):
+      return len(self.tiles)
+
+   def record(self, keys):
+      """Add (layer_number, column, row) keys of tiles that are complete"""
+      self.write(["%i %i %i\n" % key for key in keys if key not in self.tiles])
+      self.tiles.update(keys)
+
+   def remove(self, keys):
+      """Record that tiles have been deleted"""
+      self.write(["- %i %i %i\n" % key for key in keys if key in self.tiles])
+      self.tiles.difference_update(keys)
+
+   def write(self, lines):
+      """Append lines to the journal file, and sync them to disk"""
+      if len(lines) == 0:
+         return
+      if self.out == None:
+         self.out = open(self.path, "a")
+      self.out.write("".join(lines))
+      self.out.flush()
+      os.fsync(self.out.fileno())
+
+   def close(self):
+      """Close the journal file"""
+      if self.out != None:
+         self.out.close()
+         self.out = None
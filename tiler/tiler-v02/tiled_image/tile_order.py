@@ -0,0 +1,73 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+# Orders in which to visit the tiles of a grid. Morton (Z-order) and
+# Hilbert orders visit tiles in small square blocks, so the finer tiles
+# a block samples from are used close together in time.
+
+def rowMajorOrder(columns, rows):
+   """Return (column, row) positions a row at a time"""
+   return [(column, row) for row in xrange(rows) for column in xrange(columns)]
+
+def mortonOrder(columns, rows):
+   """Return (column, row) positions in Morton (Z-curve) order"""
+   positions = rowMajorOrder(columns, rows)
+   positions.sort(key = lambda position: mortonIndex(*position))
+   return positions
+
+def hilbertOrder(columns, rows):
+   """Return (column, row) positions in Hilbert curve order"""
+   side = 1
+   while side < max(columns, rows):
+      side *= 2
+   positions = rowMajorOrder(columns, rows)
+   positions.sort(key = lambda position: hilbertIndex(side, *position))
+   return positions
+
+def mortonIndex(column, row):
+   """Return the position of a tile on the Morton curve"""
+   index = 0
+   bit = 0
+   while (column >> bit) or (row >> bit):
+      index |= ((column >> bit) & 1) << (2 * bit)
+      index |= ((row >> bit) & 1) << (2 * bit + 1)
+      bit += 1
+   return index
+
+def hilbertIndex(side, column, row):
+   """Return the position of a tile on a Hilbert curve filling side x side"""
+   index = 0
+   step = side / 2
+   while step > 0:
+      column_bit = (column & step) > 0
+      row_bit = (row & step) > 0
+      index += step * step * ((3 * column_bit) ^ row_bit)
+      # Rotate the quadrant so the curve inside it starts and ends correctly
+      if not row_bit:
+         if column_bit:
+            column = side - 1 - column
+            row = side - 1 - row
+         (column, row) = (row, column)
+      step /= 2
+   return index
+
+TILE_ORDERS = {
+   "row": rowMajorOrder,
+   "morton": mortonOrder,
+   "hilbert": hilbertOrder }
+
+def tileOrder(order_name, columns, rows):
+   """Return (column, row) positions of a grid in a named order"""
+   return TILE_ORDERS[order_name](columns, rows)
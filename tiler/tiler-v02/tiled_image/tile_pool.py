@@ -0,0 +1,90 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+import multiprocessing
+
+# Tilers unpickled in a worker process, by class name. Keeping the
+# tiler between tasks lets it hold on to an open source image.
+_worker_tilers = {}
+
+def _runTask(task):
+   """Run one tiler method call in a worker process.
+
+   Returns the tiles written, as TiledImage.takeWrittenTiles() gives them,
+   for the parent process to record in the image's journal or archive,
+   and the stage times, tile counts and decode counts of the task, as
+   TiledImage.takeStats() gives them.
+   """
+   (tiler, method_name, arguments) = task
+   class_name = tiler.__class__.__name__
+   worker_tiler = _worker_tilers.get(class_name)
+   if (worker_tiler == None or
+       worker_tiler.tiled_image.image_path != tiler.tiled_image.image_path):
+      _worker_tilers[class_name] = tiler
+      worker_tiler = tiler
+   worker_tiler.pyramid = tiler.pyramid
+   # Tiles found to be background since the tiler was kept come with each task
+   worker_tiler.tiled_image.occupancy = tiler.tiled_image.occupancy
+   # Decodes are counted for each task while the tiling process counts them.
+   # Tasks of a chunk share one unpickled tiler, so each gets a new dict.
+   if tiler.tiled_image.decode_counts == None:
+      worker_tiler.tiled_image.decode_counts = None
+   else:
+      worker_tiler.tiled_image.decode_counts = {}
+   getattr(worker_tiler, method_name)(*arguments)
+   tiled_image = worker_tiler.tiled_image
+   return (tiled_image.takeWrittenTiles(), tiled_image.takeStats())
+
+def releaseWorkerTilers():
+   """Forget the tilers kept in this worker process, and their sources"""
+   _worker_tilers.clear()
+
+
+class TilePool:
+   """Runs tiler tasks on a pool of worker processes.
+
+   run() returns the results of its tasks as they finish, in order. The
+   caller reads them all before starting more work, so a layer that
+   samples from the layer below it is never started early.
+   """
+
+   def __init__(self, workers):
+      self.workers = workers
+      self.pool = multiprocessing.Pool(workers)
+
+   def run(self, tiler, method_name, tasks):
+      """Call tiler.method_name(*arguments) for each task in a worker.
+
+      Returns an iterator over (tiles written, stats) of each task.
+      """
+      chunk_size = max(1, len(tasks) / (self.workers * 4))
+      work = [(tiler, method_name, arguments) for arguments in tasks]
+      return self.pool.imap(_runTask, work, chunk_size)
+
+   def runUnordered(self, function, arguments, chunk_size = 1):
+      """Return an iterator over function(argument) results as they finish"""
+      return self.pool.imap_unordered(function, arguments, chunk_size)
+
+   def runAsync(self, function, arguments, callback):
+      """Call function(*arguments) in a worker, then callback(result).
+
+      The callback is called on a thread of the pool, not the caller's.
+      """
+      self.pool.apply_async(function, arguments, callback = callback)
+
+   def close(self):
+      """Wait for workers to finish and shut down the pool"""
+      self.pool.close()
+      self.pool.join()
@@ -0,0 +1,354 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+
+import os, os.path, re, socket, asyncore, asynchat, hashlib, mimetypes, urllib
+from email.utils import formatdate
+from collections import OrderedDict
+from tiled_image import TiledImage, SOURCE_FILE_NAME
+from lazy_renderer import LazyTileRenderer, SOURCE_MEMORY
+
+# Tile URLs as the viewer requests them, in the flat layout
+TILE_URL_PATTERN = re.compile(r"^(.*?)/?layer(\d+)/tile(\d+)n(\d+)\.(\w+)$")
+# Seconds browsers may reuse a response before revalidating it by ETag.
+# Tiles are not kept longer than other files: retiling an image, or
+# changing its occupancy map, replaces them at the same URLs.
+TILE_MAX_AGE = 5 * 60
+FILE_MAX_AGE = 5 * 60
+MAX_HEADER_BYTES = 16 * 1024
+
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request",
+               404: "Not Found", 405: "Method Not Allowed",
+               500: "Internal Server Error"}
+
+class EncodedTileCache:
+   """Least recently used cache of encoded responses, keyed by URL path.
+
+   Entries are (body, etag, content_type, max_age). The cache holds at
+   most byte_budget bytes of bodies, evicting the least recently used.
+   """
+
+   def __init__(self, byte_budget):
+      self.byte_budget = byte_budget
+      self.byte_count = 0
+      self.entries = OrderedDict()
+      self.hits = 0
+      self.misses = 0
+
+   def get(self, path):
+      """Return the cached entry for a path, or None"""
+      entry = self.entries.pop(path, None)
+      if entry == None:
+         self.misses += 1
+         return None
+      self.entries[path] = entry
+      self.hits += 1
+      return entry
+
+   def put(self, path, entry):
+      """Add an entry, evicting old entries if over budget"""
+      old_entry = self.entries.pop(path, None)
+      if old_entry != None:
+         self.byte_count -= len(old_entry[0])
+      size = len(entry[0])
+      if size > self.byte_budget:
+         return
+      self.entries[path] = entry
+      self.byte_count += size
+      while self.byte_count > self.byte_budget:
+         (old_path, old_entry) = self.entries.popitem(last = False)
+         self.byte_count -= len(old_entry[0])
+
+   def __repr__(self):
+      """Return a summary of cache use"""
+      return "EncodedTileCache(%i entries, %i bytes, hits=%i, misses=%i)" % (
+         len(self.entries), self.byte_count, self.hits, self.misses)
+
+
+class TileStore:
+   """Finds the bytes served for URL paths under a root directory.
+
+   Tile URLs inside a tiled image directory are answered through its
+   TiledImage, so sharded and archived layouts are served at the flat
+   layout's URLs the viewer asks for. Other paths are served as files.
+   Served directories are assumed not to change while the server runs,
+   other than by tiles of lazily tiled images rendered on request.
+   """
+
+   def __init__(self, root_path, cache_bytes):
+      self.root_path = os.path.abspath(root_path)
+      self.cache = EncodedTileCache(cache_bytes)
+      self.tiled_images = {}
+
+   def lookup(self, url_path):
+      """Return (body, etag, content_type, max_age) for a path, or None"""
+      entry = self.cache.get(url_path)
+      if entry == None:
+         entry = self.load(url_path)
+         if entry != None:
+            self.cache.put(url_path, entry)
+      return entry
+
+   def load(self, url_path):
+      """Read the bytes for a path from disk"""
+      relative_path = self.relativePath(url_path)
+      if relative_path == None:
+         return None
+      tile = self.tileForPath(relative_path)
+      if tile != None:
+         (tiled_image, (layer_number, column, row)) = tile
+         body = tiled_image.tileBytes(column, row, layer_number)
+         if body == None:
+            return None
+         return self.entry(body, tiled_image.getTileEncoder().contentType(),
+                           TILE_MAX_AGE)
+
+      file_path = os.path.join(self.root_path, relative_path)
+      if os.path.isdir(file_path):
+         file_path = os.path.join(file_path, "index.html")
+      if not os.path.isfile(file_path):
+         return None
+      in_file = open(file_path, "rb")
+      body = in_file.read()
+      in_file.close()
+      (content_type, encoding) = mimetypes.guess_type(file_path)
+      if content_type == None:
+         content_type = "application/octet-stream"
+      return self.entry(body, content_type, FILE_MAX_AGE)
+
+   def relativePath(self, url_path):
+      """Return a URL path relative to the root, or None if outside it or
+      a source path file, which names a path on this machine"""
+      relative_path = os.path.normpath(urllib.unquote(url_path).lstrip("/"))
+      if relative_path == os.path.pardir or relative_path.startswith(
+            os.path.pardir + os.path.sep) or os.path.isabs(relative_path):
+         return None
+      if os.path.basename(relative_path) == SOURCE_FILE_NAME:
+         return None
+      if relative_path == os.path.curdir:
+         relative_path = ""
+      return relative_path
+
+   def tileForPath(self, relative_path):
+      """Return (TiledImage, key) for a tile URL, or None for other paths"""
+      match = TILE_URL_PATTERN.match(relative_path)
+      if match == None:
+         return None
+      tiled_image = self.tiledImage(match.group(1))
+      if (tiled_image == None or
+          match.group(5) != tiled_image.getTileEncoder().tile_format):
+         return None
+      (layer_number, row, column) = [int(part) for part in match.groups()[1:4]]
+      return (tiled_image, (layer_number, column, row))
+
+   def missingTile(self, url_path):
+      """Return (TiledImage, key) for a tile that can be rendered, or None"""
+      relative_path = self.relativePath(url_path)
+      if relative_path == None:
+         return None
+      tile = self.tileForPath(relative_path)
+      if tile == None:
+         return None
+      (tiled_image, (layer_number, column, row)) = tile
+      if (tiled_image.source_path == None or
+          layer_number < tiled_image.tiledLayerCount() or
+          not tiled_image.isTilePosition(column, row, layer_number)):
+         return None
+      return tile
+
+   def addTile(self, url_path, tiled_image, body):
+      """Cache and return the entry of a tile rendered on request"""
+      entry = self.entry(body, tiled_image.getTileEncoder().contentType(),
+                         TILE_MAX_AGE)
+      self.cache.put(url_path, entry)
+      return entry
+
+   def entry(self, body, content_type, max_age):
+      """Return a cache entry with an ETag computed from the body"""
+      etag = '"%s"' % hashlib.md5(body).hexdigest()
+      return (body, etag, content_type, max_age)
+
+   def tiledImage(self, relative_path):
+      """Return the TiledImage in a directory, or None if it holds none"""
+      if relative_path not in self.tiled_images:
+         image_path = os.path.join(self.root_path, relative_path)
+         tiled_image = None
+         if os.path.exists(os.path.join(image_path, "contents.xml")):
+            tiled_image = TiledImage.fromDirectory(image_path)
+         self.tiled_images[relative_path] = tiled_image
+      return self.tiled_images[relative_path]
+
+
+class TileRequestHandler(asynchat.async_chat):
+   """Answers the GET and HEAD requests of one connection.
+
+   Connections are kept alive between requests unless the client asks
+   otherwise, and pipelined requests are answered in order: while a tile
+   is rendered, later requests wait.
+   """
+
+   ac_out_buffer_size = 64 * 1024
+
+   def __init__(self, connection, server):
+      asynchat.async_chat.__init__(self, connection)
+      self.server = server
+      self.header_data = []
+      self.header_size = 0
+      self.waiting = False
+      self.queued_headers = []
+      self.set_terminator("\r\n\r\n")
+
+   def readable(self):
+      return not self.waiting and asynchat.async_chat.readable(self)
+
+   def collect_incoming_data(self, data):
+      self.header_data.append(data)
+      self.header_size += len(data)
+      if self.header_size > MAX_HEADER_BYTES:
+         self.header_data = []
+         self.header_size = 0
+         self.respond(400, False)
+
+   def found_terminator(self):
+      header = "".join(self.header_data)
+      self.header_data = []
+      self.header_size = 0
+      if self.waiting:
+         self.queued_headers.append(header)
+      else:
+         self.handleRequest(header)
+
+   def handleRequest(self, header):
+      """Parse one request header and send the response"""
+      lines = header.split("\r\n")
+      request = lines[0].split()
+      if len(request) != 3:
+         self.respond(400, False)
+         return
+      (method, target, version) = request
+      headers = {}
+      for line in lines[1:]:
+         if ":" in line:
+            (name, value) = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+      connection = headers.get("connection", "").lower()
+      if version == "HTTP/1.1":
+         keep_alive = connection != "close"
+      else:
+         keep_alive = connection == "keep-alive"
+
+      if method not in ("GET", "HEAD"):
+         self.respond(405, keep_alive)
+         return
+      url_path = target.split("?", 1)[0]
+      entry = self.server.store.lookup(url_path)
+      if entry != None:
+         self.respondWith(entry, headers, keep_alive, method)
+         return
+      tile = None
+      if self.server.renderer != None:
+         tile = self.server.store.missingTile(url_path)
+      if tile == None:
+         self.respond(404, keep_alive)
+         return
+
+      # Answer once the tile is rendered, then any requests read meanwhile
+      def tileRendered(body):
+         if not self.connected:
+            return
+         self.waiting = False
+         if body == None:
+            self.respond(500, keep_alive)
+         else:
+            entry = self.server.store.addTile(url_path, tile[0], body)
+            self.respondWith(entry, headers, keep_alive, method)
+         while len(self.queued_headers) > 0 and not self.waiting:
+            self.handleRequest(self.queued_headers.pop(0))
+      self.waiting = True
+      (tiled_image, key) = tile
+      self.server.renderer.request(tiled_image, key, tileRendered)
+
+   def respondWith(self, entry, headers, keep_alive, method):
+      """Send a cached entry, or Not Modified if the client has it"""
+      (body, etag, content_type, max_age) = entry
+      if_none_match = headers.get("if-none-match", "")
+      response_headers = [("ETag", etag),
+                          ("Cache-Control", "public, max-age=%i" % max_age)]
+      if etag in [tag.strip() for tag in if_none_match.split(",")] or (
+            if_none_match == "*"):
+         self.respond(304, keep_alive, response_headers)
+      else:
+         response_headers.append(("Content-Type", content_type))
+         self.respond(200, keep_alive, response_headers, body,
+                      method == "HEAD")
+
+   def respond(self, status, keep_alive, headers = [], body = "",
+               head_only = False):
+      """Send a response, closing the connection afterwards if not kept"""
+      if status >= 400 and body == "":
+         body = "%i %s\n" % (status, STATUS_TEXT[status])
+         headers = headers + [("Content-Type", "text/plain")]
+      lines = ["HTTP/1.1 %i %s" % (status, STATUS_TEXT[status]),
+               "Date: %s" % formatdate(usegmt = True),
+               "Connection: %s" % (keep_alive and "keep-alive" or "close")]
+      if status != 304:
+         lines.append("Content-Length: %i" % len(body))
+      lines.extend(["%s: %s" % header for header in headers])
+      self.push("\r\n".join(lines) + "\r\n\r\n")
+      if status != 304 and not head_only:
+         self.push(body)
+      if not keep_alive:
+         self.close_when_done()
+
+
+class TileServer(asyncore.dispatcher):
+   """HTTP server for the tiled images under a root directory.
+
+   One thread serves every connection from an asyncore event loop, with
+   the encoded bytes of recently served tiles and files kept in memory.
+   Missing tiles of lazily tiled images are rendered by render_workers
+   processes, if any, each keeping at most about source_memory bytes of
+   decoded sources. They are started before the server opens sockets,
+   which they would otherwise inherit.
+   """
+
+   def __init__(self, root_path, address = ("", 8000),
+                cache_bytes = 64 * 1024 * 1024, render_workers = 2,
+                source_memory = SOURCE_MEMORY):
+      asyncore.dispatcher.__init__(self)
+      self.store = TileStore(root_path, cache_bytes)
+      self.renderer = None
+      if render_workers > 0:
+         self.renderer = LazyTileRenderer(render_workers, source_memory)
+      self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+      self.set_reuse_addr()
+      self.bind(address)
+      self.listen(128)
+
+   def handle_accept(self):
+      pair = self.accept()
+      if pair != None:
+         (connection, address) = pair
+         TileRequestHandler(connection, self)
+
+   def serveForever(self):
+      """Run the event loop until interrupted"""
+      try:
+         asyncore.loop(timeout = 30, use_poll = True)
+      finally:
+         if self.renderer != None:
+            self.renderer.close()
+
@@ -13,24 +13,45 @@
 #
 # Author: Jonathan A, Smith
 
-import os, os.path, xml.dom
+import os, os.path, time, xml.dom
 import Image
 from math import *
 from geometry import *
 from image_information import ImageInformation
 from pyramid import Pyramid
+from tiling_options import TilingOptions
+from tile_pool import TilePool
+from layer_cascade import LayerCascade
+from tile_cache import TileCache
+from tile_order import tileOrder
+from draft import draftReduction, openDraft
+from change_detector import ChangeDetector
+from tile_journal import TileJournal
+from tile_archive import TileArchive, ARCHIVE_FILE_NAME
+from content_store import ContentStore, ContentIndex, STORE_INDEX_FILE_NAME
+from downsampler import LANCZOS_SUPPORT
+from region_export import RegionExporter
+from tile_encoder import TileEncoder
+from occupancy_map import OccupancyMap, OCCUPANCY_FILE_NAME, EMPTY_TILE
+from memory_budget import MemoryBudget
+from instrumentation import Instrumentation, eventSinks
 
 from source_tiler import SourceTiler
 from sample_tiler import SampleTiler
 
-IMAGE_TEMPLATE = "tile%04in%04i.jpg"
+IMAGE_TEMPLATE = "tile%04in%04i.%s"
 LAYER_TEMPLATE = "layer%04i"
+SHARD_TEMPLATE = "row%04i"
+THUMBNAIL_WIDTH = 150.0
+
+# Holds the source path of a lazily tiled image; never served
+SOURCE_FILE_NAME = "source.txt"
 
 class TiledImage(ImageInformation):
    """Represents a tiled image on disk."""
    
    @classmethod
-   def fromDirectory(self, image_path):
+   def fromDirectory(self, image_path, options = None):
       """Creates ImageInformation by reading an XML file."""
       
       contents_path = os.path.join(image_path, "contents.xml")
@@ -38,70 +59,468 @@ class TiledImage(ImageInformation):
       contents_document = xml.dom.minidom.parse(contents_file)
       contents_file.close()
       
-      tiled_image = TiledImage(image_path)
+      tiled_image = TiledImage(image_path, options)
       tiled_image.initializeFromXML(contents_document)
+      tiled_image.readSourcePath()
       return tiled_image
    
    @classmethod
-   def fromSourceImage(self, source_path, image_path = None):
+   def fromSourceImage(self, source_path, image_path = None, options = None):
       
       # If no image_path specified, use default
       if image_path == None:
-        (directory, file_name) = os.path.split(source_path)
-        (name, ext) = os.path.splitext(file_name)
-        image_path = os.path.join(directory, "_images", name)
+        image_path = TiledImage.defaultImagePath(source_path)
         
       # Create and initialize image from source image
-      tiled_image = TiledImage(image_path)
+      tiled_image = TiledImage(image_path, options)
       tiled_image.initializeFromSource(source_path)
       return tiled_image
    
-   def __init__(self, image_path):
+   @classmethod
+   def defaultImagePath(self, source_path):
+      """Return the path of an _images directory beside the source image"""
+      (directory, file_name) = os.path.split(source_path)
+      (name, ext) = os.path.splitext(file_name)
+      return os.path.join(directory, "_images", name)
+      
+   def __init__(self, image_path, options = None):
       ImageInformation.__init__(self)
       self.image_path = image_path
       self.background = (255, 255, 255)
+      if options == None:
+         options = TilingOptions()
+      self.options = options
+      self.retained_layers = []
+      self.retained_tiles = {}
+      self.tile_cache = TileCache(options.tile_cache_memory)
+      self.decode_counts = None
+      self.journal = None
+      self.archive = None
+      self.writes_archive = False
+      self.written_tiles = []
+      self.layer_paths = {}
+      self.tile_encoder = None
+      self.occupancy = None
+      self.empty_tile_data = None
+      self.instrumentation = Instrumentation(image_path, eventSinks(options.progress))
+      
+   def __getstate__(self):
+      """Pickle state sent to worker processes, without tiles in memory.
+      
+      Workers do not see the journal or write the archive: they only
+      generate unfinished tiles, and hand back the tiles they write for
+      this process to record. The occupancy map goes with them, so
+      background tiles of finer layers are not read from disk.
+      """
+      state = self.__dict__.copy()
+      state["retained_layers"] = []
+      state["retained_tiles"] = {}
+      state["tile_cache"] = TileCache(self.options.tile_cache_memory)
+      state["journal"] = None
+      state["archive"] = None
+      state["writes_archive"] = False
+      state["written_tiles"] = []
+      return state
       
    def initializeFromXML(self, document):
       """Initialize this tiled image from a contents.xml document"""
       ImageInformation.initializeFrom(self, document)
       self.pyramid = Pyramid(self.image_size)
+      self.tile_encoder = None
+      self.occupancy = None
+      self.empty_tile_data = None
+      
+   def initializeFromSource(self, source_path, pool = None):
+      """Initialize this image from a source image: tiling the image.
       
-   def initializeFromSource(self, source_path):
-      """Initialize this image from a source image: tiling the image"""
+      Tiles are generated by pool, if specified, or else by a pool with
+      self.options.workers processes when more than one worker is requested.
+      """
+      budget = self.fitMemoryBudget(source_path, pool)
+      self.instrumentation.beginRun()
       source_tiler = SourceTiler(self, source_path)
       image_size = source_tiler.getImageSize()
       
       self.image_size = image_size
       self.pyramid = Pyramid(image_size)
       self.layer_count = self.pyramid.layer_count
+      self.shard_rows = self.options.shard_rows
+      if self.options.tile_archive:
+         self.tile_archive = ARCHIVE_FILE_NAME
+      if self.options.tile_store != None:
+         # Relative, so images moved along with their store still find it
+         self.tile_store = os.path.relpath(os.path.abspath(self.options.tile_store),
+                                           os.path.abspath(self.image_path))
+      self.tile_encoder = TileEncoder(self.options.tile_encoding)
+      self.tile_encoding = self.tile_encoder.spec()
+      if self.options.skip_empty_tiles:
+         self.occupancy_map = OCCUPANCY_FILE_NAME
+      self.setEagerLayers(self.options.eager_layers, source_path)
       self.generateContentsXML()
+      self.openTileStore()
    
       sample_tiler = SampleTiler(self)
       
-      layer_count = self.layer_count
-      for layer_number in xrange(layer_count - 1, -1, -1):
-         if layer_number >= (layer_count - 2):
-            source_tiler.tileLayer(layer_number)
-         else:
-            sample_tiler.tileLayer(layer_number)
+      own_pool = None
+      if pool == None and self.options.workers > 1:
+         own_pool = TilePool(self.options.workers)
+         pool = own_pool
+      source_tiler.pool = pool
+      sample_tiler.pool = pool
+      
+      if self.options.cascade and self.eager_layers == 0:
+         LayerCascade(self, source_tiler, sample_tiler).tileLayers()
+      else:
+         # Each layer is complete before the next (coarser) layer samples it
+         layer_count = self.tiledLayerCount()
+         for layer_number in xrange(layer_count - 1, -1, -1):
+            if layer_number >= (layer_count - 2):
+               source_tiler.tileLayer(layer_number)
+            else:
+               sample_tiler.tileLayer(layer_number)
+      
+      if own_pool != None:
+         own_pool.close()
             
       self.generateThumbnail()
+      if self.options.source_hashes:
+         ChangeDetector(self, source_path).writeHashes()
       self.copyResources()
+      self.closeTileStore()
+      if budget != None:
+         budget.report()
+      self.endRun()
+      
+   def endRun(self):
+      """Send the report of a run, with the tile cache's counts.
+      
+      The counts include those of worker caches, added by addStats().
+      """
+      totals = {"cache_hits": self.tile_cache.hits,
+                "cache_misses": self.tile_cache.misses,
+                "cache_evictions": self.tile_cache.evictions}
+      if self.occupancy_map != None:
+         totals["background_tiles"] = self.getOccupancy().emptyCount()
+      self.instrumentation.endRun(**totals)
+      
+   def fitMemoryBudget(self, source_path, pool = None, whole_sources = 0):
+      """Fit options to options.max_memory, if set, returning the MemoryBudget"""
+      if self.options.max_memory == None:
+         return None
+      budget = MemoryBudget(self.options.max_memory, self.instrumentation)
+      pool_workers = None
+      if pool != None:
+         pool_workers = pool.workers
+      self.options = budget.fitOptions(self.options, source_path, pool_workers,
+                                       whole_sources)
+      self.tile_cache.byte_budget = self.options.tile_cache_memory
+      return budget
+      
+   def setEagerLayers(self, eager_layers, source_path):
+      """Tile only the eager_layers coarsest layers, if fewer than all.
+      
+      At least the layers the thumbnail is made from are tiled.
+      """
+      if eager_layers > 0:
+         thumbnail_layer = self.pyramid.layerForScale(
+            THUMBNAIL_WIDTH / self.image_size.width)
+         eager_layers = max(eager_layers, int(thumbnail_layer) + 1)
+      if eager_layers == 0 or eager_layers >= self.layer_count:
+         self.eager_layers = 0
+         self.source_path = None
+      else:
+         self.eager_layers = eager_layers
+         self.source_path = os.path.abspath(source_path)
+      
+   def tiledLayerCount(self):
+      """Return the number of coarsest layers tiled ahead of requests"""
+      if self.eager_layers == 0:
+         return self.layer_count
+      return self.eager_layers
+      
+   def retileFromSource(self, source_path, previous_path = None, pool = None):
+      """Regenerate only the tiles affected by changes to the source image.
+      
+      Changed areas are found by comparing the source with previous_path,
+      if given, or else with the stored source hashes. Tiles over those
+      areas are regenerated a layer at a time, from the finest layer up.
+      After each layer the areas grow by the reach of its resampling
+      filter, since pixels that near a change may differ.
+      """
+      whole_sources = 1
+      if previous_path != None:
+         whole_sources = 2
+      budget = self.fitMemoryBudget(source_path, pool, whole_sources)
+      self.instrumentation.beginRun()
+      detector = ChangeDetector(self, source_path)
+      rectangles = detector.changedRectangles(previous_path)
+      self.instrumentation.event("retile", source = source_path,
+                                 changed_areas = len(rectangles))
+      
+      self.openTileStore()
+      source_tiler = SourceTiler(self, source_path)
+      sample_tiler = SampleTiler(self)
+      own_pool = None
+      if pool == None and self.options.workers > 1:
+         own_pool = TilePool(self.options.workers)
+         pool = own_pool
+      source_tiler.pool = pool
+      sample_tiler.pool = pool
+      
+      # Tiles of layers rendered on request are just removed
+      tiled_layer_count = self.tiledLayerCount()
+      positions = []
+      for layer_number in xrange(self.layer_count - 1, -1, -1):
+         positions = self.tilesInRectangles(rectangles, layer_number)
+         if len(positions) == 0:
+            break
+         self.removeTiles(positions, layer_number)
+         if layer_number < tiled_layer_count:
+            if layer_number >= (tiled_layer_count - 2):
+               tiler = source_tiler
+            else:
+               tiler = sample_tiler
+            tiler.beginLayer(layer_number)
+            tiler.retileTiles(positions, layer_number)
+            tiler.endLayer(layer_number)
+         support = LANCZOS_SUPPORT / self.pyramid.scaleForLayer(layer_number) + 1
+         rectangles = [rectangle.inset(Dimensions(-support, -support))
+                       for rectangle in rectangles]
+      
+      if own_pool != None:
+         own_pool.close()
+      
+      if len(positions) > 0:
+         self.generateThumbnail()
+      if self.options.source_hashes or detector.readHashes() != None:
+         detector.writeHashes()
+      self.closeTileStore()
+      if budget != None:
+         budget.report()
+      self.endRun()
+      
+   def openTileStore(self):
+      """Prepare to write tiles: to the archive, or to layer directories"""
+      if self.packsTiles():
+         self.archive = self.openArchive(self.pyramid)
+         self.writes_archive = True
+      else:
+         self.createLayerDirectories()
+         self.removeTemporaryFiles()
+         self.journal = TileJournal(self.image_path)
+      
+   def closeTileStore(self):
+      """Finish writing tiles, saving the occupancy map"""
+      self.recordWrittenTiles()
+      if self.occupancy != None:
+         self.occupancy.save()
+      if self.archive != None:
+         self.archive.close()
+         self.archive = None
+         self.writes_archive = False
+      if self.journal != None:
+         self.journal.close()
+      
+   def packsTiles(self):
+      """Return True if tiles are kept in an archive or a content store"""
+      return self.tile_archive != None or self.tile_store != None
+      
+   def openArchive(self, pyramid = None):
+      """Open the tiles' TileArchive, or their ContentIndex in a shared store.
+      
+      Either is created empty for pyramid if it does not exist.
+      """
+      if self.tile_store != None:
+         store = ContentStore(os.path.join(self.image_path, self.tile_store))
+         return ContentIndex(os.path.join(self.image_path, STORE_INDEX_FILE_NAME),
+                             store, pyramid)
+      return TileArchive(os.path.join(self.image_path, self.tile_archive), pyramid)
+      
+   def getArchive(self):
+      """Return the tile archive or index, opening it for reading if need be"""
+      if self.archive == None:
+         self.archive = self.openArchive()
+      return self.archive
+      
+   def getOccupancy(self):
+      """Return the occupancy map, reading or starting it if need be"""
+      if self.occupancy == None:
+         self.occupancy = OccupancyMap(os.path.join(self.image_path, 
+                                                    self.occupancy_map), 
+                                       self.pyramid)
+      return self.occupancy
+      
+   def tilesInRectangles(self, rectangles, layer_number):
+      """Return (column, row) of the tiles of a layer that overlap rectangles"""
+      positions = set()
+      tile_ranges = self.pyramid.tileRanges(rectangles, [layer_number])[0]
+      for (left_column, top_row, right_column, bottom_row) in tile_ranges:
+         for row in xrange(top_row, bottom_row + 1):
+            for column in xrange(left_column, right_column + 1):
+               positions.add((column, row))
+      return sorted(positions, key = lambda position: (position[1], position[0]))
+      
+   def removeTiles(self, positions, layer_number):
+      """Delete the tiles at (column, row) positions of a layer"""
+      keys = [(layer_number, column, row) for (column, row) in positions]
+      for key in keys:
+         self.tile_cache.discard(key)
+      if self.occupancy_map != None:
+         self.getOccupancy().clear(keys)
+      if self.packsTiles():
+         self.getArchive().remove(keys)
+         return
+      for (column, row) in positions:
+         tile_path = self.tileFilePath(column, row, layer_number)
+         if os.path.exists(tile_path):
+            os.remove(tile_path)
+      self.journal.remove(keys)
       
    def generateContentsXML(self):
       """Write a contents.xml file with a description of the image"""
       document = self.toXML()
       if not os.path.exists(self.image_path):
          os.makedirs(self.image_path)
+      self.writeSourcePath()
       contents_file = os.path.join(self.image_path, "contents.xml")
       out = open(contents_file, "w")
       print >>out, document.toxml("UTF-8")
       out.close()
       
+   def writeSourcePath(self):
+      """Write the source path of a lazily tiled image to SOURCE_FILE_NAME.
+      
+      The path is on the machine that tiled the image, so it is kept out
+      of contents.xml, which viewers read. The file is removed once every
+      layer is tiled.
+      """
+      source_file_path = os.path.join(self.image_path, SOURCE_FILE_NAME)
+      if self.source_path == None:
+         if os.path.exists(source_file_path):
+            os.remove(source_file_path)
+         return
+      out = open(source_file_path, "w")
+      print >>out, self.source_path
+      out.close()
+      
+   def readSourcePath(self):
+      """Read the source path of a lazily tiled image, if there is one"""
+      source_file_path = os.path.join(self.image_path, SOURCE_FILE_NAME)
+      if self.eager_layers == 0 or not os.path.exists(source_file_path):
+         return
+      source_file = open(source_file_path, "r")
+      self.source_path = source_file.readline().rstrip("\n")
+      source_file.close()
+      
+   def createLayerDirectories(self):
+      """Create the directories of every layer, before tiles are written"""
+      for directory in self.tileDirectories():
+         if not os.path.isdir(directory):
+            os.makedirs(directory)
+      
+   def removeTemporaryFiles(self):
+      """Delete tile files left partly written by a run that was stopped"""
+      for directory in self.tileDirectories():
+         for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+               os.remove(os.path.join(directory, name))
+      
+   def syncTileDirectories(self, keys):
+      """Flush to disk the directories of tiles, so their renames last"""
+      directories = set([os.path.dirname(self.tileFilePath(column, row, layer_number))
+                         for (layer_number, column, row) in keys])
+      for directory in directories:
+         descriptor = os.open(directory, os.O_RDONLY)
+         try:
+            os.fsync(descriptor)
+         finally:
+            os.close(descriptor)
+      
+   def tileDirectories(self):
+      """Return the paths of the directories that hold tiles"""
+      directories = []
+      for layer_number in xrange(self.layer_count):
+         layer_path = self.layerPath(layer_number)
+         if self.shard_rows == 0:
+            directories.append(layer_path)
+            continue
+         row_count = self.pyramid.tileGridSize(layer_number).height
+         for first_row in xrange(0, row_count, self.shard_rows):
+            directories.append(os.path.join(layer_path, SHARD_TEMPLATE % first_row))
+      return directories
+      
+   def convertLayout(self, shard_rows):
+      """Move tiles in place into a flat (0) or sharded layout.
+      
+      The new layout is written to contents.xml after all tiles have
+      moved. If interrupted, converting again to the same layout finishes
+      the job.
+      """
+      if self.packsTiles():
+         raise ValueError("%s keeps its tiles in %s: extract them first" % (
+            self.image_path, self.tile_archive or self.tile_store))
+      target = TiledImage(self.image_path, self.options)
+      target.initializeFromXML(self.toXML())
+      target.shard_rows = shard_rows
+      target.createLayerDirectories()
+      
+      move_count = 0
+      for layer_number in xrange(self.layer_count):
+         grid_size = self.pyramid.tileGridSize(layer_number)
+         for row in xrange(grid_size.height):
+            for column in xrange(grid_size.width):
+               old_path = self.tileFilePath(column, row, layer_number)
+               new_path = target.tileFilePath(column, row, layer_number)
+               if old_path != new_path and os.path.exists(old_path):
+                  os.rename(old_path, new_path)
+                  move_count += 1
+      target.generateContentsXML()
+      
+      # Remove shard directories left empty (layer directories stay)
+      new_directories = set(target.tileDirectories())
+      for directory in self.tileDirectories():
+         if (self.shard_rows > 0 and directory not in new_directories and 
+             os.path.isdir(directory)):
+            try:
+               os.rmdir(directory)
+            except OSError:
+               self.instrumentation.message("not removed, not empty: %s" % directory)
+      self.shard_rows = shard_rows
+      self.instrumentation.message("Moved %i tiles of %s" % (move_count, self.image_path))
+      
+   def extractArchive(self, keep = False):
+      """Write the tiles of the archive out as files, in the image's layout.
+      
+      The archive, or the content index of an image in a content store,
+      is deleted afterwards, unless keep is True. Tiles in a content
+      store stay until the store's garbage is collected.
+      """
+      archive = self.getArchive()
+      self.tile_archive = None
+      self.tile_store = None
+      self.createLayerDirectories()
+      self.removeTemporaryFiles()
+      self.journal = TileJournal(self.image_path)
+      keys = archive.keys()
+      for (layer_number, column, row) in keys:
+         self.writeTileFile(archive.tileBuffer((layer_number, column, row)),
+                            column, row, layer_number)
+      self.syncTileDirectories(keys)
+      self.journal.record(keys)
+      self.journal.close()
+      self.generateContentsXML()
+      archive.close()
+      self.archive = None
+      if not keep:
+         os.remove(archive.path)
+      self.instrumentation.message("Extracted %i tiles of %s" % (len(keys),
+                                                                 self.image_path))
+      
+      
    def generateThumbnail(self):
       """Generate an image thumbnail"""
       image_size = self.image_size
-      scale = 150.0 / image_size.width
+      scale = THUMBNAIL_WIDTH / image_size.width
       thumbnail_height = scale * image_size.height
       bounds = Rectangle(0, 0, image_size.width - 1, image_size.height - 1)
       thumbnail = self.getScaledImage(bounds, scale)
@@ -112,7 +531,7 @@ class TiledImage(ImageInformation):
       """Copy resources into the image folder"""
       resource_folder = os.path.join(os.path.curdir, "resources")
       for name in os.listdir(resource_folder):
-         print "installing %s" % name
+         self.instrumentation.message("installing %s" % name)
          in_file = open(os.path.join(resource_folder, name), "r")
          data = in_file.read()
          in_file.close
@@ -121,67 +540,360 @@ class TiledImage(ImageInformation):
          out.close()
       
    def getScaledImage(self, request_area, scale, layer_number = None):
-      """Get an image covering the request_area at a specified scale."""
+      """Get an image covering the request_area at a specified scale.
+      
+      When the layer read is at least twice the requested scale, its tiles
+      are reduced while they are decoded and then resized to fit.
+      """
       assert isinstance(request_area, Rectangle)
       pyramid = self.pyramid
       if layer_number == None:
          layer_number = pyramid.layerForScale(scale)
+      reduction = self.decodeReduction(scale, layer_number)
       
-      tile_section = self.getTileSection(request_area, layer_number)
-      tile_section = self.cropTileSection(tile_section, request_area, layer_number) 
+      tile_section = self.getTileSection(request_area, layer_number, reduction)
+      start = time.time()
+      tile_section = self.cropTileSection(tile_section, request_area, 
+                                          layer_number, reduction) 
+      start = self.instrumentation.timeStage("crop", start)
       
       result_width  = int(ceil((request_area.right  - request_area.left) * scale))
       result_height = int(ceil((request_area.bottom - request_area.top ) * scale))
       
-      return tile_section.resize((result_width, result_height), Image.ANTIALIAS)
+      result = tile_section.resize((result_width, result_height), Image.ANTIALIAS)
+      self.instrumentation.timeStage("resize", start)
+      return result
+      
+   def exportScaledImage(self, request_area, scale, path, strip_height = 256):
+      """Write the request_area at a scale to an image file, a strip at a time.
+      
+      The format (PNG, TIFF or JPEG) follows the extension of path. Only
+      strip_height rows of the result are in memory at once.
+      """
+      assert isinstance(request_area, Rectangle)
+      RegionExporter(self, request_area, scale).export(path, strip_height)
+      
+   def decodeReduction(self, scale, layer_number):
+      """Return how much tiles of a layer may be reduced to read at scale"""
+      tile_size = self.pyramid.tile_size
+      ratio = self.pyramid.scaleForLayer(layer_number) / scale
+      reduction = draftReduction(ratio)
+      while tile_size.width % reduction or tile_size.height % reduction:
+         reduction /= 2
+      return reduction
+      
+   def getTileSection(self, request_area, layer_number, reduction = 1):
+      """Return an image on tile boundries that covers a requested area.
       
-   def getTileSection(self, request_area, layer_number):
-      """Return an image on tile boundries that covers a requested area."""
+      Tiles are reduced in size by reduction, which must divide the tile size.
+      """
       pyramid = self.pyramid
-      tile_size = pyramid.tile_size
             
       left_column  = pyramid.tileColumn(request_area.left,   layer_number)
       right_column = pyramid.tileColumn(request_area.right,  layer_number)
       top_row      = pyramid.tileRow   (request_area.top,    layer_number)
       bottom_row   = pyramid.tileRow   (request_area.bottom, layer_number)
       
-      tile_size = pyramid.tile_size
+      tile_size = Dimensions(pyramid.tile_size.width  / reduction,
+                             pyramid.tile_size.height / reduction)
       section_width  = ((right_column - left_column + 1) * tile_size.width )
       section_height = ((bottom_row   - top_row     + 1) * tile_size.height)
       section_size = (section_width, section_height)
       section_image = Image.new("RGB", section_size, self.background)
       
-      for row in xrange(top_row, bottom_row + 1):
-         for column in xrange(left_column, right_column + 1):
-            tile_image = self.getTileImage(column, row, layer_number)
-            paste_left = (column - left_column) * tile_size.width
-            paste_top  = (row - top_row) * tile_size.height
-            section_image.paste(tile_image, (paste_left, paste_top))
+      positions = tileOrder(self.options.tile_order, 
+                            right_column - left_column + 1, bottom_row - top_row + 1)
+      for (column_offset, row_offset) in positions:
+         tile_image = self.getTileImage(left_column + column_offset, 
+                                        top_row + row_offset, layer_number,
+                                        reduction)
+         paste_left = column_offset * tile_size.width
+         paste_top  = row_offset * tile_size.height
+         start = time.time()
+         section_image.paste(tile_image, (paste_left, paste_top))
+         self.instrumentation.timeStage("paste", start)
 
       return section_image
    
-   def cropTileSection(self, section, request_area, layer_number):
+   def cropTileSection(self, section, request_area, layer_number, reduction = 1):
       """Crop section image (at a specified layer) to fit the request area."""
       pyramid = self.pyramid
-      scale = pyramid.scaleForLayer(layer_number)
+      scale = pyramid.scaleForLayer(layer_number) / reduction
       tile_size = pyramid.tile_size
-      left   = int(round(request_area.left * scale)) % tile_size.width
-      top    = int(round(request_area.top  * scale)) % tile_size.height
+      left   = int(round(request_area.left * scale)) % (tile_size.width  / reduction)
+      top    = int(round(request_area.top  * scale)) % (tile_size.height / reduction)
       right  = left + int(round((request_area.right  - request_area.left) * scale))
       bottom = top  + int(round((request_area.bottom - request_area.top ) * scale))
       return section.crop((left, top, right, bottom))
       
-   def getTileImage(self, column, row, layer_number):
-      """Return a tile for a specified column, row, and layer number"""
+   def getTileImage(self, column, row, layer_number, reduction = 1):
+      """Return a tile for a specified column, row, and layer number.
+      
+      A reduction of 2, 4 or 8 returns the tile that much smaller, decoded
+      at that size when the format allows. Reduced tiles are not cached.
+      Background tiles that are not stored are made from the background.
+      """
+      if self.isEmptyTile(column, row, layer_number):
+         return self.emptyTile(reduction)
+      if reduction > 1:
+         start = time.time()
+         tile = openDraft(self.tileSource(column, row, layer_number), reduction)
+         tile.load()
+         self.instrumentation.timeStage("decode", start)
+         return tile
+      key = (layer_number, column, row)
+      if key in self.retained_tiles:
+         return self.retained_tiles[key]
+      tile = self.tile_cache.get(key)
+      if tile == None:
+         start = time.time()
+         tile = Image.open(self.tileSource(column, row, layer_number))
+         tile.load()
+         self.instrumentation.timeStage("decode", start)
+         self.tile_cache.put(key, tile)
+         if self.decode_counts != None:
+            self.decode_counts[key] = self.decode_counts.get(key, 0) + 1
+      return tile
+      
+   def isEmptyTile(self, column, row, layer_number):
+      """Return True if a tile is only background, and not stored"""
+      return (self.occupancy_map != None and
+              self.getOccupancy().isEmpty((layer_number, column, row)))
+      
+   def emptyTile(self, reduction = 1):
+      """Return a tile of background, reduced in size by reduction"""
+      tile_size = self.pyramid.tile_size
+      return Image.new("RGB", (tile_size.width / reduction,
+                               tile_size.height / reduction), self.background)
+      
+   def emptyTileBytes(self):
+      """Return the encoded bytes of a background tile"""
+      if self.empty_tile_data == None:
+         self.empty_tile_data = self.getTileEncoder().encode(self.emptyTile())
+      return self.empty_tile_data
+      
+   def skipsTile(self, tile):
+      """Return True if a tile image is only background, and not stored"""
+      if self.occupancy_map == None:
+         return False
+      extrema = tile.getextrema()
+      return extrema == tuple([(value, value) for value in self.background])
+      
+   def getTileEncoder(self):
+      """Return the encoder of this image's tiles"""
+      if self.tile_encoder == None:
+         self.tile_encoder = TileEncoder(self.tile_encoding)
+      return self.tile_encoder
+      
+   def tileSource(self, column, row, layer_number):
+      """Return a tile's file path, or a file object reading the archive"""
+      if self.packsTiles():
+         return self.getArchive().tileFile((layer_number, column, row))
+      return self.tileFilePath(column, row, layer_number)
+      
+   def isTilePosition(self, column, row, layer_number):
+      """Return True if a layer has a tile at (column, row)"""
+      if layer_number >= self.layer_count:
+         return False
+      grid_size = self.pyramid.tileGridSize(layer_number)
+      return column < grid_size.width and row < grid_size.height
+      
+   def tileBytes(self, column, row, layer_number):
+      """Return the encoded bytes of a tile, or None if there is no tile"""
+      if not self.isTilePosition(column, row, layer_number):
+         return None
+      if self.isEmptyTile(column, row, layer_number):
+         return self.emptyTileBytes()
+      if self.packsTiles():
+         key = (layer_number, column, row)
+         if not self.getArchive().contains(key):
+            return None
+         return self.getArchive().tileBytes(key)
+      try:
+         tile_file = open(self.tileFilePath(column, row, layer_number), "rb")
+      except IOError:
+         return None
+      data = tile_file.read()
+      tile_file.close()
+      return data
+      
+   def isComplete(self):
+      """Return True if every tile of every tiled layer has been written"""
+      if self.packsTiles():
+         isWritten = self.getArchive().contains
+      else:
+         isWritten = TileJournal(self.image_path).__contains__
+      for layer_number in xrange(self.tiledLayerCount()):
+         grid_size = self.pyramid.tileGridSize(layer_number)
+         for row in xrange(grid_size.height):
+            for column in xrange(grid_size.width):
+               if (not isWritten((layer_number, column, row)) and
+                   not self.isEmptyTile(column, row, layer_number)):
+                  return False
+      return True
+      
+   def isTileDone(self, column, row, layer_number):
+      """Return True if a tile is stored and recorded, or is background"""
+      key = (layer_number, column, row)
+      if self.isEmptyTile(column, row, layer_number):
+         return True
+      if self.writes_archive:
+         return self.archive.contains(key)
+      return self.journal != None and key in self.journal
+      
+   def writeTile(self, tile, column, row, layer_number):
+      """Write a tile image, keeping it in memory if its layer is retained.
+      
+      A tile file is written to a temporary file and renamed into place,
+      so a crash can not leave a partly written tile under the tile's
+      name. With an archive, the tile is encoded and written to the
+      archive by the process that owns it. A tile that is only background
+      is not written, just marked in the occupancy map. Either way the
+      tile is only recorded by recordWrittenTiles(), with others.
+      """
+      key = (layer_number, column, row)
+      instrumentation = self.instrumentation
+      if self.skipsTile(tile):
+         written = (key, EMPTY_TILE)
+         instrumentation.count(layer_number, "empty_tiles")
+      else:
+         start = time.time()
+         data = self.getTileEncoder().encode(tile)
+         start = instrumentation.timeStage("encode", start)
+         instrumentation.count(layer_number, "bytes", len(data))
+         if self.packsTiles():
+            written = (key, data)
+         else:
+            self.writeTileFile(data, column, row, layer_number)
+            instrumentation.timeStage("write", start)
+            written = (key, None)
+      self.tile_cache.discard(key)
+      if layer_number in self.retained_layers:
+         self.retained_tiles[key] = tile
+      self.written_tiles.append(written)
+      instrumentation.count(layer_number, "tiles")
+      
+   def writeTileFile(self, data, column, row, layer_number):
+      """Write an encoded tile to a temporary file, then rename it into place.
+      
+      The data is on disk before the rename, so a crash never leaves a
+      partly written tile under its own name.
+      """
       tile_path = self.tileFilePath(column, row, layer_number)
-      return Image.open(tile_path)
+      temporary_path = "%s.%i.tmp" % (tile_path, os.getpid())
+      out = open(temporary_path, "wb")
+      out.write(data)
+      out.flush()
+      os.fsync(out.fileno())
+      out.close()
+      os.rename(temporary_path, tile_path)
+      
+   def recordTiles(self, tiles):
+      """Record tiles written, given as (key, encoded tile or None) pairs.
+      
+      Background tiles, given as EMPTY_TILE, are marked in the occupancy
+      map. Encoded tiles go to the archive and other keys to the journal,
+      or all are kept for takeWrittenTiles() in a worker process.
+      """
+      if self.occupancy_map != None:
+         occupancy = self.getOccupancy()
+         occupancy.markEmpty([key for (key, data) in tiles if data == EMPTY_TILE])
+         occupancy.clear([key for (key, data) in tiles if data != EMPTY_TILE])
+         if self.journal != None or self.writes_archive:
+            tiles = [(key, data) for (key, data) in tiles if data != EMPTY_TILE]
+      if self.writes_archive:
+         start = time.time()
+         self.archive.writeTiles(tiles)
+         self.archive.flush()
+         self.instrumentation.timeStage("write", start)
+      elif self.journal != None:
+         keys = [key for (key, data) in tiles]
+         self.syncTileDirectories(keys)
+         self.journal.record(keys)
+      else:
+         self.written_tiles.extend(tiles)
+      
+   def storeTile(self, data, column, row, layer_number):
+      """Store an encoded tile rendered elsewhere, such as on request"""
+      if self.journal == None and not self.writes_archive:
+         self.openTileStore()
+      key = (layer_number, column, row)
+      if data == EMPTY_TILE:
+         self.recordTiles([(key, data)])
+         self.getOccupancy().save()
+         return
+      if self.writes_archive:
+         self.recordTiles([(key, data)])
+         return
+      self.writeTileFile(data, column, row, layer_number)
+      self.recordTiles([(key, None)])
+      
+   def addWrittenTiles(self, tiles):
+      """Add tiles a worker process wrote, as takeWrittenTiles() gave them"""
+      self.written_tiles.extend(tiles)
+      
+   def recordWrittenTiles(self, least = 1):
+      """Record the tiles written since the last call, if there are least.
+      
+      Does nothing without a journal or archive, as in a worker process,
+      whose tiles are taken with takeWrittenTiles() and recorded by the
+      tiling process.
+      """
+      if self.journal == None and not self.writes_archive:
+         return
+      if len(self.written_tiles) >= least:
+         self.recordTiles(self.takeWrittenTiles())
+      
+   def takeWrittenTiles(self):
+      """Return and forget the tiles written and not yet recorded"""
+      written_tiles = self.written_tiles
+      self.written_tiles = []
+      return written_tiles
+      
+   def takeStats(self):
+      """Return and forget what a worker process gathered while tiling:
+      (instrumentation stats, decode counts or None, tile cache counts)"""
+      decode_counts = self.decode_counts
+      if decode_counts != None:
+         self.decode_counts = {}
+      return (self.instrumentation.takeStats(), decode_counts,
+              self.tile_cache.takeCounts())
+      
+   def addStats(self, stats):
+      """Add what a worker process gathered, as takeStats() returned it"""
+      (instrumentation_stats, decode_counts, cache_counts) = stats
+      self.instrumentation.addStats(instrumentation_stats)
+      self.tile_cache.addCounts(cache_counts)
+      if decode_counts and self.decode_counts != None:
+         for (key, count) in decode_counts.items():
+            self.decode_counts[key] = self.decode_counts.get(key, 0) + count
+      
+   def retainLayer(self, layer_number):
+      """Keep tiles written to a layer in memory until released"""
+      self.retained_layers.append(layer_number)
+      
+   def releaseTiles(self, layer_number, end_row):
+      """Forget retained tiles of a layer in rows before end_row"""
+      for key in self.retained_tiles.keys():
+         if key[0] == layer_number and key[2] < end_row:
+            del self.retained_tiles[key]
+      
+   def layerPath(self, layer_number):
+      """Returns the path of the directory holding a layer's tiles"""
+      layer_path = self.layer_paths.get(layer_number)
+      if layer_path == None:
+         layer_path = os.path.join(self.image_path, LAYER_TEMPLATE % layer_number)
+         self.layer_paths[layer_number] = layer_path
+      return layer_path
       
    def tileFilePath(self, column, row, layer_number):
-      """Returns a file path string with the file name for a specific tile"""
-      layer_name = LAYER_TEMPLATE % layer_number
-      file_name = IMAGE_TEMPLATE % (row, column)        
-      path = os.path.join(self.image_path, layer_name, file_name)
-      directory = os.path.dirname(path)
-      if not os.path.exists(directory):
-         os.makedirs(directory)  
-      return path
\ No newline at end of file
+      """Returns a file path string with the file name for a specific tile.
+      
+      Does not touch the file system: layer directories are created by
+      createLayerDirectories() before tiling.
+      """
+      file_name = IMAGE_TEMPLATE % (row, column, self.getTileEncoder().tile_format)
+      if self.shard_rows == 0:
+         return os.path.join(self.layerPath(layer_number), file_name)
+      shard_name = SHARD_TEMPLATE % (row - row % self.shard_rows)
+      return os.path.join(self.layerPath(layer_number), shard_name, file_name)
\ No newline at end of file
@@ -13,12 +13,90 @@
 #
 # Author: Jonathan A, Smith
 
+from tile_order import tileOrder
+
+# Tiles written are recorded this many at a time, each batch synced once
+RECORD_TILES = 64
+
 class Tiler:
-   """Creates or adds tiles to a tiled image"""
-   
+   """Creates or adds tiles to a tiled image
+
+   self.tiled_image - image being tiled
+   self.pool - TilePool used to run tile tasks, or None to run them here
+   """
+
    def __init__(self, tiled_image):
       self.tiled_image = tiled_image
-   
+      self.pool = None
+
+   def __getstate__(self):
+      """Pickle state sent to worker processes (never the pool itself)"""
+      state = self.__dict__.copy()
+      state["pool"] = None
+      return state
+
    def tileLayer(self, layer_number):
       """Generate all tiles in a specified tile layer"""
-      raise "Implement in subclasses"
\ No newline at end of file
+      self.beginLayer(layer_number)
+      grid_size = self.pyramid.tileGridSize(layer_number)
+      self.tileRows(0, grid_size.height, layer_number)
+      self.endLayer(layer_number)
+
+   def beginLayer(self, layer_number):
+      """Prepare to generate the tiles of a layer"""
+      self.pyramid = self.tiled_image.pyramid
+      pyramid = self.pyramid
+      scale = pyramid.scaleForLayer(layer_number)
+      grid_size = pyramid.tileGridSize(layer_number)
+      self.tiled_image.instrumentation.beginLayer(
+         layer_number, grid_size.width, grid_size.height, scale)
+
+   def endLayer(self, layer_number):
+      """Finish generating the tiles of a layer"""
+      self.tiled_image.instrumentation.endLayer(layer_number)
+
+   def tileRows(self, top_row, bottom_row, layer_number):
+      """Generate tiles in rows top_row up to (not including) bottom_row"""
+      tasks = [(column, row, layer_number) for (column, row)
+               in self.tilePositions(top_row, bottom_row, layer_number)]
+      self.runTasks("generateTile", tasks)
+
+   def retileTiles(self, positions, layer_number):
+      """Generate the tiles at (column, row) positions of a layer"""
+      tasks = [(column, row, layer_number) for (column, row) in positions]
+      self.runTasks("generateTile", tasks)
+
+   def tilePositions(self, top_row, bottom_row, layer_number):
+      """Return positions of unfinished tiles in rows, in the option's order"""
+      tiled_image = self.tiled_image
+      grid_size = self.pyramid.tileGridSize(layer_number)
+      order_name = tiled_image.options.tile_order
+      return [(column, row + top_row) for (column, row)
+              in tileOrder(order_name, grid_size.width, bottom_row - top_row)
+              if not tiled_image.isTileDone(column, row + top_row, layer_number)]
+
+   def runTasks(self, method_name, tasks):
+      """Call a tiler method once for each argument tuple in tasks.
+
+      Tasks run in order in this process, or spread across the worker
+      processes of self.pool. The tiles they write are recorded in the
+      image's journal or archive RECORD_TILES at a time, and all of them
+      by the time this returns, with the stage times and tile and decode
+      counts of workers added to the image's.
+      """
+      tiled_image = self.tiled_image
+      if self.pool == None:
+         method = getattr(self, method_name)
+         for arguments in tasks:
+            method(*arguments)
+            tiled_image.recordWrittenTiles(RECORD_TILES)
+      else:
+         for (written_tiles, stats) in self.pool.run(self, method_name, tasks):
+            tiled_image.addWrittenTiles(written_tiles)
+            tiled_image.addStats(stats)
+            tiled_image.recordWrittenTiles(RECORD_TILES)
+      tiled_image.recordWrittenTiles()
+
+   def generateTile(self, column, row, layer_number):
+      """Generate and write a single tile"""
+      raise "Implement in subclasses"
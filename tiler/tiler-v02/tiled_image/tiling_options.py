@@ -0,0 +1,60 @@
+# Copyright 2009, 2010, 2011 Northwestern Univrsity and Jonathan A. Smith
+# Licensed under the Educational Community License, Version 2.0 (the "License"); 
+# you may not use this file except in compliance with the License. You may
+# obtain a copy of the License at
+#
+# http://www.osedu.org/licenses/ECL-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Author: Jonathan A, Smith
+
+class TilingOptions:
+   """Settings that control how a source image is tiled.
+
+   self.workers - number of worker processes used to generate tiles
+   self.band_memory - bytes of source decoded at a time, or None for all
+   self.cascade - sample coarser layers from tiles kept in memory
+   self.tile_cache_memory - bytes of decoded tiles kept by TiledImage
+   self.tile_order - order tiles are visited in: "row", "morton" or "hilbert"
+   self.downsampler - "pil" to resample each tile, "numpy" for whole rows
+   self.source_hashes - store a hash of the source under each finest tile,
+      so the image can later be retiled incrementally
+   self.shard_rows - 0 for one directory per layer, or the number of tile
+      rows in each subdirectory of a layer
+   self.tile_archive - pack all tiles into one archive file, not a file each
+   self.tile_store - directory of a ContentStore shared by many images to
+      keep each distinct tile in once, or None
+   self.tile_encoding - TileEncoder spec for the tiles, such as "jpg",
+      "jpg:quality=80,progressive" or "webp:quality=75"
+   self.eager_layers - 0 to tile every layer, or the number of coarsest
+      layers to tile, leaving finer tiles to be rendered on request
+   self.skip_empty_tiles - leave out tiles that are only background,
+      marking them in an occupancy map instead
+   self.max_memory - bytes the whole run may use, or None for no limit:
+      workers, source bands and tile caches are then fitted to it
+   self.progress - where events about the run go: "summary" for readable
+      lines, "quiet" for none, "json:path" for JSON lines in a file, or
+      several of these separated by commas
+   """
+
+   def __init__(self):
+      self.workers = 1
+      self.band_memory = None
+      self.cascade = False
+      self.tile_cache_memory = 32 * 1024 * 1024
+      self.tile_order = "row"
+      self.downsampler = "pil"
+      self.source_hashes = False
+      self.shard_rows = 0
+      self.tile_archive = False
+      self.tile_store = None
+      self.tile_encoding = "jpg"
+      self.eager_layers = 0
+      self.skip_empty_tiles = False
+      self.max_memory = None
+      self.progress = "summary"